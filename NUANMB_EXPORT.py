@@ -8,7 +8,11 @@ bl_info = {
     "location": "File > Export",
     "category": "Import-Export"}
     
-import bpy, enum, io, math, mathutils, os, struct, time, numpy
+import collections, concurrent.futures, enum, fnmatch, hashlib, io, math, os, struct, threading, time, numpy
+try:
+    import bpy, mathutils
+except ImportError: # Not running inside Blender, e.g. a compression worker process
+    bpy = None
 
 
 class AnimType(enum.Enum):
@@ -29,10 +33,6 @@ class AnimTrackFlags(enum.Enum):
     Compressed = 1024
     Constant = 1280
 
-def write_c_string(f, s):
-    write_chars(f, s)
-    write_byte(f, 0) #null terminator
-
 # writes a variable number of empty bytes depending on necessary alignment
 def pad(f, alignment):
     while(f.tell() % alignment):
@@ -62,29 +62,18 @@ def write_long64(f, val):
 def write_ulong64(f, val):
     f.write(struct.pack('<Q', val))
     
-def write_chars(f, chars):
-    f.write(struct.pack('<{}s'.format(len(chars)), chars.encode()))
-
-def write_byte_array(f, ba):
-    f.write(ba.getbuffer())
-    
 def write_bytes(f, bytes):
     for byte in bytes:
         write_byte(f, byte)
 
-#Some longs contain an offset to data, but that offset isn't the absolute file offset its  
-# relative to that long's position in the file/buffer.
-def write_rel_offset(f, offsetPos):
-    #Backup file write pos
-    filePosBackup = f.tell()
-    
-    f.seek(offsetPos) #relative to file start
-    write_long64(f, filePosBackup - offsetPos) #value written is the offset from the offsetPos to the data.
-    
-    f.seek(filePosBackup)
+# Where pad() would leave a file that is currently at pos
+def align(pos, alignment):
+    return pos + (-pos % alignment)
 
 
 class Group:
+    __slots__ = ('nodesAnimType', 'nodesOffsetPos', 'nodesOffset', 'nodes')
+    
     def __init__(self):
         self.nodesAnimType = 0
         self.nodesOffsetPos = 0
@@ -92,6 +81,9 @@ class Group:
         self.nodes = []
         
 class Node:
+    __slots__ = ('name', 'nodeNameOffset', 'nodeNameOffsetPos', 'nodeDataOffset', 'nodeDataOffsetPos', 
+                 'nodeAnimTrack', 'materialSubNodes')
+    
     def __init__(self):
         self.name = ""
         self.nodeNameOffset = 0
@@ -100,8 +92,26 @@ class Node:
         self.nodeDataOffsetPos = 0
         self.nodeAnimTrack = NodeAnimTrack()
         self.materialSubNodes = [] #hack for materials + camera.
+
+'''
+What one frame of each kind of track looks like in NodeAnimTrack.animationTrack
+Transform: 11 float32s, in the same order they get written out
+  SX SY SZ RX RY RZ RW PX PY PZ 0
+Float: a float32
+Boolean: a bool
+Vector: 4 float32s
+'''
+TRACK_FRAME_LAYOUTS = {
+    AnimTrackFlags.Transform.value: ((11,), numpy.float32),
+    AnimTrackFlags.Float.value: ((), numpy.float32),
+    AnimTrackFlags.Boolean.value: ((), numpy.bool_),
+    AnimTrackFlags.Vector.value: ((4,), numpy.float32),
+}
         
 class NodeAnimTrack:
+    __slots__ = ('name', 'type', 'typeOffset', 'typeOffsetPos', 'flags', 'frameCount', 'dataOffset', 'dataSize', 
+                 'unk3', 'animationTrack', 'encoded')
+    
     def __init__(self):
         self.name = ""
         self.type = ""
@@ -112,724 +122,1237 @@ class NodeAnimTrack:
         self.dataOffset = 0 
         self.dataSize = 0
         self.unk3 = 0
-        self.animationTrack = [] # could be an array of matrix4x4, or vector4, or bools, or floats, or...
-                                
+        self.animationTrack = None # numpy array with one row per frame, see TRACK_FRAME_LAYOUTS. Made by allocate()
+        self.encoded = None # (data, flags, frameCount) once encoded, can be set ahead of time to skip encoding
+    
+    def allocate(self, frameCount):
+        # Call once the flags say what kind of track this is, then fill in animationTrack[frame]
+        shape, dtype = TRACK_FRAME_LAYOUTS[self.flags & 0x00ff]
+        self.animationTrack = numpy.zeros((frameCount,) + shape, dtype=dtype)
         
     def __repr__(self):
         return "Node name: " + str(self.name) + "\t| Type: " + str(self.type) + "\t| Flags: " + str(self.flags) + "\t| # of frames: " + str(self.frameCount) + "\t| Data offset: " + str(self.dataOffset) + "\t| Data size: " + str(self.dataSize) + "\n"
    
 class Quantanizer:
-    def __init__(self, valueArray, epsilon):
-        de_nan_array(valueArray)
+    def __init__(self, valueArray, epsilon, strategy='SMALLEST', snap=True):
+        valueArray = de_nan_array(valueArray)
         #self.values = valueArray
-        self.min = min(valueArray)
-        self.max = max(valueArray)
-        if math.isclose(self.min, 1, rel_tol=1e-04):
-            self.min = 1
-        if math.isclose(self.max, 1, rel_tol=1e-04):
-            self.max = 1
-        if math.isclose(self.min, 0, abs_tol=1e-04):
-            self.min = 0
-        if math.isclose(self.max, 0, abs_tol=1e-04):
-            self.max = 0
-        if math.isclose(self.min, self.max, rel_tol=1e-04):
-            self.min = self.max
+        self.min = float(valueArray.min())
+        self.max = float(valueArray.max())
+        if snap: # Without it the range is kept exactly, for channels the snapping alone would put over budget
+            if math.isclose(self.min, 1, rel_tol=1e-04):
+                self.min = 1
+            if math.isclose(self.max, 1, rel_tol=1e-04):
+                self.max = 1
+            if math.isclose(self.min, 0, abs_tol=1e-04):
+                self.min = 0
+            if math.isclose(self.max, 0, abs_tol=1e-04):
+                self.max = 0
+            if math.isclose(self.min, self.max, rel_tol=1e-04):
+                self.min = self.max
         self.constant = self.min == self.max
-        self.bitCount = self.calc_bit_count(epsilon, valueArray)
+        self.bitCount = self.calc_bit_count(epsilon, valueArray, strategy)
         
     def __repr__(self):
         return "min: " + str(self.min) + " max: " + str(self.max) + " constant: " + str(self.constant)  + " bitCount: " + str(self.bitCount) + "\t"
         
-    def calc_bit_count(self, epsilon, valueArray):
+    def calc_bit_count(self, epsilon, valueArray, strategy='SMALLEST'):
+        # strategy is one of COMPRESSION_PRESETS
         if self.constant:
             return 0
+        if epsilon <= 0: # Nothing but the exact values fits, and doubling 0 would never get anywhere
+            return -1
+        if strategy != 'SMALLEST':
+            bits = self.range_bit_count(epsilon)
+            if bits != -1 and strategy == 'FAST':
+                return bits
+            if bits != -1:
+                # The range only gives the worst case, the actual values often fit in a few bits less
+                candidates = numpy.arange(max(1, bits - BALANCED_SEARCH_BITS), bits + 1)
+                fits = numpy.nonzero(self.compute_errors(valueArray, candidates) < epsilon)[0]
+                if len(fits):
+                    return int(candidates[fits[0]])
+        errors = self.compute_errors(valueArray) # Computed once, even if epsilon has to grow
         while epsilon < 1:
-            for bits in range(1, 31):
-                if self.compute_error(bits, valueArray) < epsilon:
-                    return bits
+            fits = numpy.nonzero(errors < epsilon)[0]
+            if len(fits):
+                return int(fits[0]) + 1
             epsilon *= 2
         return -1 #Failed to find an optimal bit count. idk if this ever happens
         
     def compute_error(self, bits, valueArray):
-        e = 0
         if self.constant:
             return 0
-        for v in valueArray:
-            ce = abs(v - self.decompressed_value(v,bits))
-            e = max(e, ce)
-        return e 
+        return float(numpy.max(numpy.abs(valueArray - self.decompressed_value(valueArray, bits))))
+    
+    def compute_errors(self, valueArray, bits=None):
+        # compute_error for every bit count (1 to 30 by default) in one go, same arithmetic as decompressed_value
+        bits = (numpy.arange(1, 31) if bits is None else bits)[:, None]
+        dv = numpy.nan_to_num(lerp(self.min, self.max, 0, 1, self.quantanize(valueArray, bits) / quantanization_value(bits)))
+        return numpy.max(numpy.abs(valueArray - dv), axis=1)
+    
+    def range_bit_count(self, epsilon):
+        # Fewest bits whose quantanization step fits in epsilon, from the range alone. 
+        # Values get truncated to the step below them, so no value can end up further off than one step.
+        if epsilon <= 0:
+            return -1
+        steps = (self.max - self.min) / epsilon
+        if steps >= quantanization_value(30):
+            return -1
+        return max(1, int(math.ceil(math.log2(steps + 1))))
 
+    # quantanize and decompressed_value work on single values and on whole numpy arrays of values
     def decompressed_value(self, v, bits): 
         qv = quantanization_value(bits)    
         if qv == 0:
-            return 0
+            return numpy.zeros_like(v, dtype=numpy.float64)
                
-        dv = lerp(self.min, self.max, 0, 1, self.quantanize(v, bits) / quantanization_value(bits))
-        return dv if not math.isnan(dv) else 0 #I dont think python generates NaNs like in C#
+        dv = lerp(self.min, self.max, 0, 1, self.quantanize(v, bits) / qv)
+        return numpy.nan_to_num(dv) #I dont think python generates NaNs like in C#
         
     def quantanize(self, v, bits):
-        if v <= self.min:
-            return 0
-        
-        if v >= self.max:
-            return quantanization_value(bits)
-        
-        #Quantanized value, which is supposed to be an integer    
-        quantanized = (v - self.min) / (self.max - self.min) * quantanization_value(bits)
-        quantanized = math.trunc(quantanized)
-        return quantanized
+        v = numpy.asarray(v, dtype=numpy.float64) # float32 tracks would otherwise get quantanized at float32 precision
+        qv = quantanization_value(bits)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            #Quantanized value, which is supposed to be an integer    
+            quantanized = numpy.trunc((v - self.min) / (self.max - self.min) * qv)
+        quantanized = numpy.where(v <= self.min, 0, numpy.where(v >= self.max, qv, quantanized))
+        return quantanized.astype(numpy.int64)
    
     
+# How each channel's bit count gets picked:
+#  SMALLEST  tries every bit count from 1 up and keeps the first within the error budget
+#  BALANCED  works out the worst case bit count from the range, then tries a few below it
+#  FAST      uses the worst case bit count from the range, no searching
+# Encoding time against SMALLEST, best of 10 over 3 runs of benchmarks/bench_nuanmb.py --scenario encode 
+# at the default error budget (runs on one machine varied by up to 50%):
+#              small (30 bones, 60 frames)   medium (120 bones, 300 frames)   large (300 bones, 900 frames)
+#  BALANCED    0.89-0.98x                    0.48-0.70x                       0.43-0.63x
+#  FAST        0.58-1.08x                    0.30-0.44x                       0.29-0.43x
+# The file sizes came out byte-identical for all three presets at every size. Smooth motion rarely fits in fewer
+# bits than its range needs, and CompressedTransform.refine tops rotations up to the same bits for the rebuilt W
+# whichever preset picked them, so in practice the presets only trade search time.
+# Every preset still checks the final error of a track against the budget before writing it compressed.
+COMPRESSION_PRESETS = ['FAST', 'BALANCED', 'SMALLEST']
+PRESET_ITEMS = (
+    ('FAST', "Fast", "Bit counts straight from each channel's range, no search. About 2.5x faster than Smallest on larger rigs"),
+    ('BALANCED', "Balanced", "Checks a few bit counts below the range's. About 1.5-2x faster than Smallest on larger rigs, barely on small ones"),
+    ('SMALLEST', "Smallest", "Searches every bit count for the smallest file"),
+)
+BALANCED_SEARCH_BITS = 3
+
 def quantanization_value(bitCount):
-    v = 0
-    for i in range(0, bitCount):
-        v |= 1 << i
-    return v
+    return (1 << bitCount) - 1
         
 def lerp(av, bv, v0, v1, t): #idk whats going on in here tbh tbh
     if v0 == v1:
         return av
-    if t == v0:
-        return av
-    if t == v1:
-        return bv    
     mu = (t - v0) / (v1 - v0)
     val = ( (av * (1 - mu)) + (bv * mu))
-    return val if not math.isnan(val) else 0
+    val = numpy.where(t == v0, av, numpy.where(t == v1, bv, val))
+    return numpy.nan_to_num(val)
         
 def de_nan_array(va):
-    for v in va:
-        if math.isnan(v):
-            print("NaN")
-            v = 0.0    
-
-
-def material_group_hacks(f, g):
-    pad(f, 0x8) #8-byte alignment for arrays
-    write_rel_offset(f, g.nodesOffsetPos)
-    for node in g.nodes:
-        node.nodeNameOffsetPos = f.tell()
-        write_long64(f, 0) #Placeholder offset, node name e.g. "EyeL"
-        node.nodeDataOffsetPos = f.tell()
-        write_long64(f, 0) #Placeholder offset, probably node data offset
-        write_long64(f, len(node.materialSubNodes)) #Material nodes have subnodes, e.g. CustomBoolean1. Length is 9 for "EyeL"
-        pad(f, 0x8)
-        
-    for node in g.nodes:
-        pad(f, 0x4) #4-byte alignent for strings, about to write "EyeL"
-        write_rel_offset(f, node.nodeNameOffsetPos)
-        write_c_string(f, node.name)
-        pad(f, 0x8) #8-byte alignment for arrays
-        write_rel_offset(f, node.nodeDataOffsetPos)
-        
-        for msn in node.materialSubNodes:
-            nat = msn.nodeAnimTrack
-            nat.typeOffsetPos = f.tell()
-            write_long64(f, 0) #A temp offset to the type name
-            write_uint(f, nat.flags)
-            write_uint(f, nat.frameCount)
-            write_uint(f, nat.unk3)
-            write_uint(f, nat.dataOffset)
-            write_long64(f, nat.dataSize)
-            pad(f, 0x8)
-            
-        for msn in node.materialSubNodes:
-            nat = msn.nodeAnimTrack
-            pad(f, 0x4) #4-byte alignement for strings, about to write "CustomVector0"
-            write_rel_offset(f, nat.typeOffsetPos)
-            write_c_string(f, nat.type)
-            #...Repeat for all custom vectors, looks like the type names are contiguous
-    
-    #Umm after this the massive unified animation data buffer gets written
-    #what happened to the custom bools and floats????
-    #Turns out studiosb doesnt write them out
-        
-def write_group_array(f, groups):
-    
-    #write out some preliminary node stuff for all groups
-    for g in groups: 
-        write_long64(f, g.nodesAnimType) #Write the AnimType of the group, check out the enums
-        g.nodesOffsetPos = f.tell()
-        write_long64(f, 0) #Temp 'NodeOffset'
-        write_long64(f, len(g.nodes)) #NodeCount, a 'Node' could be something like a bone in an AnimTrack
-        pad(f, 0x8) #probably not necessary since just wrote 3 long64s...
-    
-    #now actually write out the nodes  
+    va = numpy.asarray(va, dtype=numpy.float64)
+    if numpy.isnan(va).any():
+        print("NaN")
+        va = numpy.nan_to_num(va)
+    return va
+
+
+def material_node_count(g, node):
+    # Material and camera nodes have subnodes, e.g. CustomBoolean1. Length is 9 for "EyeL"
+    # For everything else its 'Array.length', but it seems like only materials have multiple sub nodes in the array
+    if g.nodesAnimType == AnimType.Material.value or g.nodesAnimType == AnimType.Camera.value:
+        return len(node.materialSubNodes)
+    return 1
+
+def node_tracks(g, node):
+    if g.nodesAnimType == AnimType.Material.value or g.nodesAnimType == AnimType.Camera.value:
+        return [msn.nodeAnimTrack for msn in node.materialSubNodes]
+    return [node.nodeAnimTrack]
+
+def c_string_size(s):
+    return len(s.encode()) + 1 #null terminator
+
+'''
+Everything in the file is positioned up front, so it can be serialized in a single pass without
+going back to patch offsets. Offsets in the file are relative to the position of the long holding them.
+ HBSS header           0x00
+ Anim header           0x10, offsets to the anim name, group array and data buffer
+ Anim name             0x48, 4-byte aligned string
+ Group array           8-byte aligned, (AnimType, NodeOffset, NodeCount) for every group
+ Per group:
+   Node array          8-byte aligned, (NameOffset, DataOffset, TrackCount) for every node
+   Per node:
+     Node name         4-byte aligned string, e.g "ArmL"
+     Track array       8-byte aligned, (TypeOffset, Flags, FrameCount, Unk3, DataOffset, DataSize) for every track
+     Track type names  4-byte aligned strings, e.g "Transform". Non material nodes only have the one
+ Data buffer           8-byte aligned, the unified animation data buffer from make_anim_buffer
+'''
+ANIM_HEADER_POS = 0x10
+ANIM_NAME_POS = 0x48
+
+class NuanmbLayout:
+    def __init__(self):
+        self.animNameOffset = 0
+        self.groupOffset = 0
+        self.bufferOffset = 0
+        self.fileSize = 0
+
+def layout_nuanmb(groups, animName, bufferSize):
+    # Fills in the offset positions of every group, node and track, and returns where the top level blocks go.
+    layout = NuanmbLayout()
+    layout.animNameOffset = ANIM_NAME_POS
+    pos = align(ANIM_NAME_POS + c_string_size(animName), 0x4) #apparently strings are padded before and after?
+    
+    pos = align(pos, 0x8) # 8-byte alignement for arrays and matl data objects
+    layout.groupOffset = pos
     for g in groups:
-        if (g.nodesAnimType == AnimType.Material.value or g.nodesAnimType == AnimType.Camera.value):
-            material_group_hacks(f, g)
-            continue
+        g.nodesOffsetPos = pos + 0x8
+        pos += 0x18
+    
+    for g in groups:
+        pos = align(pos, 0x8)
+        g.nodesOffset = pos
+        for node in g.nodes:
+            node.nodeNameOffsetPos = pos
+            node.nodeDataOffsetPos = pos + 0x8
+            pos += 0x18
         
-        pad(f, 0x8) #8-byte alignment for arrays
-        write_rel_offset(f, g.nodesOffsetPos) 
+        for node in g.nodes:
+            pos = align(pos, 0x4)
+            node.nodeNameOffset = pos
+            pos += c_string_size(node.name)
+            pos = align(pos, 0x8)
+            node.nodeDataOffset = pos
+            nats = node_tracks(g, node)
+            for nat in nats:
+                nat.typeOffsetPos = pos
+                pos += 0x20
+            for nat in nats: #looks like the type names are contiguous
+                pos = align(pos, 0x4)
+                nat.typeOffset = pos
+                pos += c_string_size(nat.type)
+    
+    pos = align(pos, 0x8)
+    layout.bufferOffset = pos
+    layout.fileSize = pos + bufferSize
+    return layout
+
+def pack_c_string(data, pos, s):
+    encoded = s.encode()
+    data[pos:pos + len(encoded)] = encoded #null terminator is already there
+
+def make_nuanmb(animBuffer, groups, finalFrameIndex, animName):
+    bufferData = animBuffer.getbuffer()
+    layout = layout_nuanmb(groups, animName, bufferData.nbytes)
+    data = bytearray(layout.fileSize) #All padding is zeroes, so only the actual values need to be written
+    
+    struct.pack_into('<4si', data, 0x0, b"HBSS", 0x40) #16-Byte Aligned Header
+    struct.pack_into('<IHHfHH', data, ANIM_HEADER_POS,
+        0x414E494D, #Magic
+        0x0002, #VersionMajor
+        0x0000, #VersionMinor
+        finalFrameIndex,
+        0x0001, #Unk1
+        0x0003) #Unk2
+    struct.pack_into('<qqqqq', data, 0x20,
+        layout.animNameOffset - 0x20,
+        layout.groupOffset - 0x28, # aka the 'GroupOffset'
+        len(groups), #e.g '3' for anim w/ 'Transform', 'Visibility', 'Material' tracks
+        layout.bufferOffset - 0x38, # "BufferOffset"
+        bufferData.nbytes) # "BufferSize"
+    pack_c_string(data, layout.animNameOffset, animName)
+    
+    for i, g in enumerate(groups):
+        struct.pack_into('<qqq', data, layout.groupOffset + i * 0x18,
+            g.nodesAnimType, g.nodesOffset - g.nodesOffsetPos, len(g.nodes))
         
-        for node in g.nodes: #Node Prep 
-            node.nodeNameOffsetPos = f.tell()
-            write_long64(f, 0) #Temp node name offset
-            node.nodeDataOffsetPos = f.tell()
-            write_long64(f, 0) #Temp node data offset
-            write_long64(f, 1) #'Array.length', but it seems like only materials have multiple sub nodes in the array
-            pad(f, 0x8) #Probably not necessary, since only longs got written
-            
-        for node in g.nodes: #Node Finalizer Loop
-            pad(f, 0x4) #4-byte alignement for strings
-            write_rel_offset(f, node.nodeNameOffsetPos) #about to write name so go fill-in offset
-            write_c_string(f, node.name) #e.g "ArmL"
-            pad(f, 0x8) #8-byte alignment for arrays
-            write_rel_offset(f, node.nodeDataOffsetPos)#node data? like, the flags,framecount, AnimType, etc
-            #Time to write out the node data, order is important
-            nat = node.nodeAnimTrack
-            nat.typeOffsetPos = f.tell()
-            write_long64(f, 0) # A temp offset to the TypeName. Idk why its done this way rather than just write out the enum
-            write_uint(f, nat.flags)
-            write_uint(f, nat.frameCount)
-            write_uint(f, nat.unk3)
-            write_uint(f, nat.dataOffset) #Shouldnt this be unknown at this point? Already known in studiosb, which means the data buffer was already calculated at this point
-            write_long64(f, nat.dataSize) # guess ill just premake the animation data buffer.
-                                          # dataOffset refers to its offset in the unified data buffer that contains all data for all nodes in all tracks.
-                                          # so, data offset will be 0 for the first entry
-            pad(f, 0x8)
-            pad(f, 0x4)#4-byte alignement for strings
-            write_rel_offset(f, nat.typeOffsetPos)
-            write_c_string(f, nat.type)
-            
+        for node in g.nodes:
+            struct.pack_into('<qqq', data, node.nodeNameOffsetPos,
+                node.nodeNameOffset - node.nodeNameOffsetPos,
+                node.nodeDataOffset - node.nodeDataOffsetPos,
+                material_node_count(g, node))
+            pack_c_string(data, node.nodeNameOffset, node.name)
             
+            for nat in node_tracks(g, node):
+                # dataOffset refers to its offset in the unified data buffer that contains all data for all nodes in all tracks.
+                # so, data offset will be 0 for the first entry
+                struct.pack_into('<qIIIIq', data, nat.typeOffsetPos,
+                    nat.typeOffset - nat.typeOffsetPos, # Idk why its done this way rather than just write out the enum
+                    nat.flags, nat.frameCount, nat.unk3, nat.dataOffset, nat.dataSize)
+                pack_c_string(data, nat.typeOffset, nat.type)
+    
+    data[layout.bufferOffset:] = bufferData
+    return data
 
 def write_nuanmb(f, animBuffer, groups, finalFrameIndex, animName):
-    write_chars(f, "HBSS")
-    write_int(f, 0x40)# 4 bytes
-    pad(f, 0x10)#16-Byte Aligned Header
-    write_uint(f, 0x414E494D) #Magic, 4 bytes
-    write_ushort(f, 0x0002) #VersionMajor, 2 bytes
-    write_ushort(f, 0x0000) #VersionMinor, 2 bytes
-    write_float(f, finalFrameIndex) # FFI, 4 bytes
-    write_ushort(f, 0x0001) #Unk1, 2 bytes
-    write_ushort(f, 0x0003) #Unk2, 2 bytes
-    
-    animNameOffset = f.tell()
-    write_long64(f, 0) # Placeholder relative offset for anim name, 8 bytes
-    
-    groupOffset = f.tell()
-    write_long64(f, 0) # Placeholder relative offset for animation arrays, aka the 'GroupOffset', 8 bytes
-    
-    write_long64(f, len(groups))#e.g '3' for anim w/ 'Transform', 'Visibility', 'Material' tracks, 8 bytes
-   
-    bufferOffset = f.tell()
-    write_long64(f, 0) #Placeholder relative offset for GroupData "BufferOffset"
-    
-    write_long64(f, animBuffer.getbuffer().nbytes) # "BufferSize"
-    
-    pad(f, 0x8) #8 Bytes
-    
-    pad(f, 0x4) #4 Byes, necessary padding because file name string will be written
-    write_rel_offset(f, animNameOffset) #Nows a good time to fix the temp offset
-    write_c_string(f, animName) #variable bytes
-    pad(f, 0x4) #4 byes, apparently  strings are padded before and after?
-    
-    pad(f, 0x8) # 8-byte alignement for arrays and matl data objects
-    write_rel_offset(f, groupOffset)
-    write_group_array(f, groups)
-    
-    #ready to write beeg buffer
-    pad(f, 0x8)
-    write_rel_offset(f, bufferOffset)
-    write_byte_array(f, animBuffer)
-    
-def make_anim_buffer(context, groups, compression):
-    b = io.BytesIO()
+    # Single write with no seeking, so f can be a pipe or any other stream
+    f.write(make_nuanmb(animBuffer, groups, finalFrameIndex, animName))
+
+def get_group_tracks(groups):
+    # Same order the tracks are laid out in the animation buffer
+    nats = []
     for g in groups:
         for node in g.nodes:
             if node.materialSubNodes: #Material or Camera
                 for sn in node.materialSubNodes:
-                    write_track_from_nat(b, sn.nodeAnimTrack, compression)
+                    nats.append(sn.nodeAnimTrack)
             else: #Normal
-                write_track_from_nat(b, node.nodeAnimTrack, compression)
+                nats.append(node.nodeAnimTrack)
+    return nats
+
+# Below this many compressed transform tracks its faster to just encode them here than to start worker processes
+PARALLEL_MIN_TRACKS = 16
+
+def encode_track(flags, animationTrack, compression, budget=None):
+    # Only depends on the track's own frames, so this can run in a worker process.
+    # Returns the encoded bytes along with the flags and frame count the encoding picked.
+    nat = NodeAnimTrack()
+    nat.flags = flags
+    nat.animationTrack = animationTrack
+    b = io.BytesIO()
+    write_track_data(b, nat, compression, budget)
+    return b.getvalue(), nat.flags, nat.frameCount
+
+def map_encode_track(pool, workers, flags, tracks, compression, budget):
+    chunkSize = max(1, len(tracks) // (workers * 4))
+    return list(pool.map(encode_track, flags, tracks, [compression] * len(tracks), [budget] * len(tracks), chunksize=chunkSize))
+
+class LazyProcessPool:
+    # Stands in for a ProcessPoolExecutor that only starts once a file really has enough tracks to compress in
+    # parallel, so camera exports, small rigs and fully cached incremental exports never spawn any workers.
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock() # Several writer threads can ask for it at once
+    
+    def map(self, *args, **kwargs):
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            executor = self.executor
+        return executor.map(*args, **kwargs)
+    
+    def shutdown(self, wait=True):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=wait)
+                self.executor = None
+
+def encode_tracks(nats, compression, workers=None, pool=None, budget=None):
+    # pool can be an already running ProcessPoolExecutor or a LazyProcessPool, so batch exports dont pay for 
+    # process startup every file
+    flags = [nat.flags for nat in nats]
+    tracks = [nat.animationTrack for nat in nats]
+    transformCount = sum(1 for f in flags if (f & 0x00ff) == AnimTrackFlags.Transform.value)
+    if workers is None:
+        workers = pool.workers if isinstance(pool, LazyProcessPool) else os.cpu_count() or 1
+    
+    if compression and workers > 1 and transformCount >= PARALLEL_MIN_TRACKS:
+        try:
+            if pool is not None:
+                return map_encode_track(pool, workers, flags, tracks, compression, budget)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                return map_encode_track(pool, workers, flags, tracks, compression, budget)
+        except (OSError, concurrent.futures.BrokenExecutor) as e:
+            print("Parallel compression unavailable (%s), compressing on a single core" % e)
+    
+    return [encode_track(f, t, compression, budget) for f, t in zip(flags, tracks)]
+
+def make_anim_buffer(context, groups, compression, workers=None, pool=None, budget=None, dedupe=True):
+    nats = get_group_tracks(groups)
+    unencoded = [nat for nat in nats if nat.encoded is None]
+    for nat, encoded in zip(unencoded, encode_tracks(unencoded, compression, workers, pool, budget)):
+        nat.encoded = encoded
+    
+    # Lay the encoded tracks out in order, exactly like write_track_from_nat would.
+    # Tracks that encode to the exact same bytes (const helper bones, unchanging material values, 
+    # always visible meshes...) all point at the first copy instead of getting their own.
+    b = io.BytesIO()
+    dataOffsets = {} # Key is the encoded data, Value is where it was written. bytes hash in C, so this stays cheap
+    for nat in nats:
+        data, flags, frameCount = nat.encoded
+        nat.flags = flags
+        nat.frameCount = frameCount
+        nat.dataSize = len(data)
+        if dedupe and data in dataOffsets:
+            nat.dataOffset = dataOffsets[data]
+            continue
+        nat.dataOffset = b.tell()
+        dataOffsets[data] = nat.dataOffset
+        b.write(data)
+        pad(b, 0x64)
     return b
 
-def write_uncompressed_tranform(b, nat):
-    for af in nat.animationTrack: #af means "AnimationFrame"
-        '''
-        Smash matrix
-          0   1   2   3
-        0 SX  SY  SZ  N/A
-        1 RX  RY  RZ  RW
-        2 PX  PY  PZ  0
-        '''
-        sx = af[0][0]; sy = af[0][1]; sz = af[0][2]
-        rx = af[1][0]; ry = af[1][1]; rz = af[1][2]; rw = af[1][3]
-        px = af[2][0]; py = af[2][1]; pz = af[2][2]
-        
-        write_float(b, sx); write_float(b, sy); write_float(b, sz)
-        write_float(b, rx); write_float(b, ry); write_float(b, rz); write_float(b, rw)
-        write_float(b, px); write_float(b, py); write_float(b, pz); 
-        write_float(b, 0); #Always 0?
-        
-        #Wrote Direct, so set Direct Flags
-        nat.flags |= AnimTrackFlags.Direct.value
-   
-def all_same(nat):
-    allSame = True
-    first = nat.animationTrack[0]
-    for af in nat.animationTrack:
-        if first != af:
-            allSame = False
-            break
-        
-    return allSame
+DEFAULT_EPSILON = 0.000002
 
-def write_const_transform(b, nat):
-    af = nat.animationTrack[0]
+class ErrorBudget:
+    # The largest absolute error each kind of channel is allowed to end up with after encoding.
+    # material covers Float and Vector tracks, e.g. CustomVector31 or a camera's FieldOfView
+    def __init__(self, position=DEFAULT_EPSILON, rotation=DEFAULT_EPSILON, scale=DEFAULT_EPSILON, material=DEFAULT_EPSILON,
+                 strategy='SMALLEST'):
+        self.position = position
+        self.rotation = rotation
+        self.scale = scale
+        self.material = material
+        self.strategy = strategy # One of COMPRESSION_PRESETS
+        
+    def __repr__(self):
+        return ("position: " + str(self.position) + " rotation: " + str(self.rotation) + " scale: " + str(self.scale) 
+                + " material: " + str(self.material) + " strategy: " + self.strategy)
+    
+    def channel_epsilons(self):
+        # In the order channels are compressed, sx sy sz rx ry rz px py pz
+        return [self.scale] * 3 + [self.rotation] * 3 + [self.position] * 3
     
-    sx = af[0][0]; sy = af[0][1]; sz = af[0][2]
-    rx = af[1][0]; ry = af[1][1]; rz = af[1][2]; rw = af[1][3]
-    px = af[2][0]; py = af[2][1]; pz = af[2][2]
+    def lossy(self):
+        # A budget of 0 means lossless, which only const or direct transforms can be
+        return min(self.channel_epsilons()) > 0
+    
+    def column_epsilons(self):
+        # Per column of a transform frame, sx sy sz rx ry rz rw px py pz
+        return [self.scale] * 3 + [self.rotation] * 4 + [self.position] * 3
+
+# Columns of a transform frame that get compressed, sx sy sz rx ry rz px py pz. RW gets rebuilt from rx ry rz
+TRANSFORM_CHANNELS = [0, 1, 2, 3, 4, 5, 7, 8, 9]
+RW_CHANNEL = 6
+TRANSFORM_SIZE = 0x2C # 11 floats
+COMPRESSED_TRANSFORM_HEADER_SIZE = 0x10 + 9 * 0x10 #160, also the default data offset
+COMPRESSED_TRANSFORM_DATA_OFFSET = COMPRESSED_TRANSFORM_HEADER_SIZE + TRANSFORM_SIZE #204
 
-    write_float(b, sx); write_float(b, sy); write_float(b, sz)
-    write_float(b, rx); write_float(b, ry); write_float(b, rz); write_float(b, rw)
-    write_float(b, px); write_float(b, py); write_float(b, pz); 
-    write_float(b, 0); #Always 0?
+def constant_errors(at):
+    # Per column, how far any frame strays from the first one
+    return numpy.abs(at - at[0]).max(axis=0)
+
+def is_constant_transform(at, budget):
+    e = constant_errors(at)
+    return ((e[0:3] <= budget.scale).all() and (e[3:7] <= budget.rotation).all() 
+            and (e[7:10] <= budget.position).all())
+
+def pack_bits(bits):
+    # bits is a flat array of 0/1, packed least significant bit first like the game reads them
+    padded = numpy.zeros((len(bits) + 7) // 8 * 8, dtype=numpy.uint8)
+    padded[:len(bits)] = bits
+    return padded.reshape(-1, 8).dot(1 << numpy.arange(8)).astype(numpy.uint8).tobytes()
+
+class CompressedTransform:
+    # Does all the quantanization analysis up front, so the exact size and error of the
+    # compressed form are known before deciding to write it.
+    def __init__(self, at, budget):
+        self.at = at
+        self.frameCount = len(at)
+        self.quantanizers = [Quantanizer(at[:, col], epsilon, budget.strategy) 
+                             for col, epsilon in zip(TRANSFORM_CHANNELS, budget.channel_epsilons())]
+        self.update_layout()
+        if self.valid and not self.meets(budget):
+            self.refine(budget)
+    
+    def update_layout(self):
+        sx, sy, sz, rx, ry, rz, px, py, pz = self.quantanizers
+        self.errors = None # max_errors, worked out again once the bit counts change
+        self.valid = all(q.bitCount != -1 for q in self.quantanizers)
+        self.hasScale = not (sx.constant and sy.constant and sz.constant)
+        self.hasRotation = not (rx.constant and ry.constant and rz.constant)
+        self.hasPosition = not (px.constant and py.constant and pz.constant)
+        
+        self.flags = 0 #Compression Flags
+        self.bitsPerEntry = 0
+        if self.hasScale:
+            self.flags |= 0x01
+            self.bitsPerEntry += sum(q.bitCount for q in self.quantanizers[0:3])
+        else:
+            self.flags |= 0x02
+        if self.hasRotation:
+            self.flags |= 0x04
+            self.bitsPerEntry += sum(q.bitCount for q in self.quantanizers[3:6])
+            self.bitsPerEntry += 1 #The 1 is for extra W rotation bit 
+        if self.hasPosition:
+            self.flags |= 0x08
+            self.bitsPerEntry += sum(q.bitCount for q in self.quantanizers[6:9])
+            
+    def refine(self, budget):
+        # Direct is the last resort. Snapping a nearly constant channel to constant, 0 or 1 can cost more than the 
+        # budget on its own, so channels over it get quantanized again from their exact range first.
+        errors = self.max_errors()
+        for i, (col, epsilon) in enumerate(zip(TRANSFORM_CHANNELS, budget.channel_epsilons())):
+            if errors[col] > epsilon or (3 <= i < 6 and errors[RW_CHANNEL] > budget.rotation):
+                self.quantanizers[i] = Quantanizer(self.at[:, col], epsilon, budget.strategy, snap=False)
+        self.update_layout()
+        # Then more bits for whatever is still over, W only gets closer through more bits on rx ry rz.
+        # Every extra bit about halves the error, so the bits needed are guessed from how far over it is.
+        columnEpsilons = budget.column_epsilons()
+        while self.valid:
+            errors = self.max_errors()
+            over = [e / epsilon if epsilon > 0 else math.inf for e, epsilon in zip(errors, columnEpsilons)]
+            if max(over) <= 1:
+                break
+            grown = False
+            for i, (col, q) in enumerate(zip(TRANSFORM_CHANNELS, self.quantanizers)):
+                ratio = max(over[col], over[RW_CHANNEL]) if 3 <= i < 6 else over[col]
+                if ratio > 1 and not q.constant and q.bitCount < 30:
+                    q.bitCount = min(30, q.bitCount + max(1, int(math.ceil(math.log2(min(ratio, 2 ** 30))))))
+                    grown = True
+            if not grown:
+                break
+            self.update_layout()
+            
+    def channel_present(self, index):
+        return (self.hasScale, self.hasRotation, self.hasPosition)[index // 3]
+    
+    def size(self):
+        return COMPRESSED_TRANSFORM_DATA_OFFSET + (self.frameCount * self.bitsPerEntry + 7) // 8
+    
+    def decompressed(self):
+        # The first 10 columns the way the game rebuilds them. Constant channels just get the default (first frame) value back.
+        frames = numpy.empty((self.frameCount, 10), dtype=numpy.float64)
+        frames[:] = self.at[0, :10]
+        for i, (col, q) in enumerate(zip(TRANSFORM_CHANNELS, self.quantanizers)):
+            if self.channel_present(i) and not q.constant:
+                frames[:, col] = q.decompressed_value(self.at[:, col], q.bitCount)
+        if self.hasRotation:
+            frames[:, RW_CHANNEL] = numpy.sqrt(numpy.abs(1 - numpy.sum(frames[:, 3:6] ** 2, axis=1)))
+            frames[self.at[:, RW_CHANNEL] < 0, RW_CHANNEL] *= -1
+        return frames.astype(numpy.float32) # Like the game, the rounding can be enough to go over budget
+    
+    def max_errors(self):
+        # Max error of every column after decompression, sx sy sz rx ry rz rw px py pz like ErrorBudget.column_epsilons.
+        # RW isn't stored, it gets rebuilt from rx ry rz and ends up further off than them the closer it is to 0.
+        if self.errors is None:
+            errors = numpy.abs(self.decompressed().astype(numpy.float64) - self.at[:, :10].astype(numpy.float64))
+            self.errors = [float(e) for e in errors.max(axis=0)]
+        return self.errors
+    
+    def meets(self, budget):
+        return all(e <= epsilon for e, epsilon in zip(self.max_errors(), budget.column_epsilons()))
+    
+    def write(self, b):
+        sx, sy, sz, rx, ry, rz, px, py, pz = self.quantanizers
+        #Compressed Header
+        b.write(struct.pack('<hhhHii', 0x04, self.flags, 
+                            COMPRESSED_TRANSFORM_HEADER_SIZE, #Not Hex in StudioSB
+                            self.bitsPerEntry, 
+                            COMPRESSED_TRANSFORM_DATA_OFFSET, #Not Hex in StudioSB
+                            self.frameCount))
+        for i, q in enumerate(self.quantanizers):
+            b.write(struct.pack('<ffq', q.min, q.max, q.bitCount if self.channel_present(i) else 16))
+        b.write(self.at[0, :10].astype('<f4').tobytes()) #Default Values
+        b.write(struct.pack('<i', 0))
+        
+        #Now we can finally write the bits, every frame is the same layout of bitsPerEntry bits
+        columns = []
+        for i, (col, q) in enumerate(zip(TRANSFORM_CHANNELS, self.quantanizers)):
+            if self.channel_present(i) and q.bitCount > 0:
+                quantanized = q.quantanize(self.at[:, col], q.bitCount)
+                columns.append((quantanized[:, None] >> numpy.arange(q.bitCount)) & 1)
+        if self.hasRotation:
+            #'flip-W' bit, the decompressed W is never negative so only the sign of the real W matters
+            columns.append((self.at[:, RW_CHANNEL] < 0).astype(numpy.int64)[:, None])
+        if columns:
+            b.write(pack_bits(numpy.hstack(columns).ravel()))
+            
+def write_uncompressed_tranform(b, nat):
+    # Frames are already laid out as SX SY SZ RX RY RZ RW PX PY PZ 0
+    b.write(nat.animationTrack.astype('<f4', copy=False).tobytes())
+    #Wrote Direct, so set Direct Flags
+    nat.flags |= AnimTrackFlags.Direct.value
+   
+def all_same(nat, budget=None):
+    # Close enough counts as the same, so bones that only differ by float noise end up const
+    return is_constant_transform(nat.animationTrack, budget or ErrorBudget())
 
+def write_const_transform(b, nat):
+    b.write(nat.animationTrack[0].astype('<f4', copy=False).tobytes())
     nat.flags |= AnimTrackFlags.ConstTransform.value
     
-def write_compressed_transform(b, nat):
-    
+def write_compressed_transform(b, nat, budget=None):
+    ct = CompressedTransform(nat.animationTrack, budget or ErrorBudget())
+    if not ct.valid:
+        print("Compression Level too small to compress")
+        return
     nat.flags |= AnimTrackFlags.Compressed.value
+    ct.write(b)
+
+def write_transform(b, nat, compression, budget):
+    # Picks the smallest encoding whose error stays in budget. Direct is the reference, so it always qualifies.
+    at = nat.animationTrack
+    if is_constant_transform(at, budget):
+        write_const_transform(b, nat)
+        nat.frameCount = 1
+        return
     
-    epsilon = 0.000002 # Maybe allow this to be set by user, but might just be confusing.
-    
-    #Make the 'Animation Track' into a numpy array for vertical slicing
-    at = numpy.array(nat.animationTrack) 
-      
-    sx = Quantanizer(at[:, 0, 0], epsilon)
-    sy = Quantanizer(at[:, 0, 1], epsilon)
-    sz = Quantanizer(at[:, 0, 2], epsilon)
-    rx = Quantanizer(at[:, 1, 0], epsilon)
-    ry = Quantanizer(at[:, 1, 1], epsilon)
-    rz = Quantanizer(at[:, 1, 2], epsilon)
-    px = Quantanizer(at[:, 2, 0], epsilon)
-    py = Quantanizer(at[:, 2, 1], epsilon)
-    pz = Quantanizer(at[:, 2, 2], epsilon)
-    
-    hasScale = not (sx.constant and sy.constant and sz.constant)
-    hasRotation = not (rx.constant and ry.constant and rz.constant)
-    hasPosition = not (px.constant and py.constant and pz.constant)
-    
-    """
-    print("nat.name = " + str(nat.name))
-    print("sx:" + str(sx) + "\t sy:" + str(sy) + "\t sz:" + str(sz) + 
-        "\t rx:" + str(rx) + "\t ry:" + str(ry) + "\t rz:" + str(rz) +
-        "\t px:" + str(px) + "\t py:" + str(py) + "\t pz:" + str(pz) )
+    if compression and budget.lossy():
+        ct = CompressedTransform(at, budget)
+        if ct.valid and ct.size() < TRANSFORM_SIZE * len(at) and ct.meets(budget):
+            nat.flags |= AnimTrackFlags.Compressed.value
+            ct.write(b)
+            return
     
-    print("sx = {" + str(at[:,0,0]) + "}\n")
-    """
+    write_uncompressed_tranform(b, nat)
     
-    #print("rx = {" + str(at[:,1,0]) + "}\n")
+COMPRESSED_HEADER_SIZE = 0x10
+COMPRESSED_BOOLEAN_DEFAULT_OFFSET = 0x20 # Booleans have an unused 16 byte compression block after the header
+
+def value_track_array(nat):
+    # (frames, components), 1 component for Float tracks and 4 for Vector tracks
+    return nat.animationTrack.reshape(len(nat.animationTrack), -1)
+
+class CompressedValues:
+    # Float and Vector4 tracks get one (start, end, bitCount) range per component, just like transform channels
+    def __init__(self, values, epsilon, strategy='SMALLEST'):
+        self.values = values
+        self.frameCount = len(values)
+        self.quantanizers = [Quantanizer(values[:, i], epsilon, strategy) for i in range(values.shape[1])]
+        self.valid = all(q.bitCount != -1 for q in self.quantanizers)
+        self.bitsPerEntry = sum(q.bitCount for q in self.quantanizers)
+        self.defaultDataOffset = COMPRESSED_HEADER_SIZE + 0x10 * len(self.quantanizers)
+        self.compressedDataOffset = self.defaultDataOffset + 4 * len(self.quantanizers)
+        
+    def size(self):
+        return self.compressedDataOffset + (self.frameCount * self.bitsPerEntry + 7) // 8
+    
+    def max_error(self):
+        errors = []
+        for i, q in enumerate(self.quantanizers):
+            values = self.values[:, i]
+            if q.constant: # Gets the default (first frame) value back
+                errors.append(float(numpy.max(numpy.abs(values - values[0]))))
+            else:
+                errors.append(q.compute_error(q.bitCount, values))
+        return max(errors)
+    
+    def write(self, b):
+        b.write(struct.pack('<HHHHII', 0x04, 0, self.defaultDataOffset, self.bitsPerEntry, 
+                            self.compressedDataOffset, self.frameCount))
+        for q in self.quantanizers:
+            b.write(struct.pack('<ffq', q.min, q.max, q.bitCount))
+        b.write(self.values[0].astype('<f4').tobytes()) #Default Values
+        columns = []
+        for i, q in enumerate(self.quantanizers):
+            if q.bitCount > 0:
+                quantanized = q.quantanize(self.values[:, i], q.bitCount)
+                columns.append((quantanized[:, None] >> numpy.arange(q.bitCount)) & 1)
+        if columns:
+            b.write(pack_bits(numpy.hstack(columns).ravel()))
+
+def write_value_track(b, nat, compression, epsilon, strategy='SMALLEST'):
+    # Float and Vector tracks, written as whichever of const, compressed or direct is smallest and stays within epsilon
+    values = value_track_array(nat)
+    if numpy.abs(values - values[0]).max() <= epsilon:
+        b.write(values[0].astype('<f4').tobytes())
+        nat.frameCount = 1
+        nat.flags |= AnimTrackFlags.Constant.value
+        return
     
+    if compression and epsilon > 0: # 0 means lossless, only const or direct are
+        cv = CompressedValues(values, epsilon, strategy)
+        if cv.valid and cv.size() < values.size * 4 and cv.max_error() <= epsilon:
+            cv.write(b)
+            nat.flags |= AnimTrackFlags.Compressed.value
+            return
     
-    cFlags = 0 #Compression Flags
-    bitsPerEntry = 0
+    b.write(values.astype('<f4').tobytes())
+    nat.flags |= AnimTrackFlags.Direct.value
+
+def write_boolean_track(b, nat, compression):
+    values = nat.animationTrack.astype(numpy.uint8)
+    if (values == values[0]).all():
+        b.write(values[:1].tobytes())
+        nat.frameCount = 1
+        nat.flags |= AnimTrackFlags.Constant.value
+        return
     
-    if sx.bitCount == -1 or sy.bitCount == -1 or sz.bitCount == -1 \
-    or rx.bitCount == -1 or ry.bitCount == -1 or rz.bitCount == -1 \
-    or px.bitCount == -1 or py.bitCount == -1 or pz.bitCount == -1:
-        print("Compression Level too small to compress")
+    # One bit per frame instead of a whole byte, once the frames outweigh the header
+    compressedSize = COMPRESSED_BOOLEAN_DEFAULT_OFFSET + 1 + (len(values) + 7) // 8
+    if compression and compressedSize < len(values):
+        b.write(struct.pack('<HHHHII', 0x04, 0, COMPRESSED_BOOLEAN_DEFAULT_OFFSET, 1, 
+                            COMPRESSED_BOOLEAN_DEFAULT_OFFSET + 1, len(values)))
+        b.write(bytes(COMPRESSED_BOOLEAN_DEFAULT_OFFSET - COMPRESSED_HEADER_SIZE))
+        b.write(values[:1].tobytes()) #Default Value
+        b.write(pack_bits(values))
+        nat.flags |= AnimTrackFlags.Compressed.value
         return
     
-    if hasScale:
-        cFlags |= 0x01
-        bitsPerEntry += sx.bitCount if not sx.constant else 0
-        bitsPerEntry += sy.bitCount if not sy.constant else 0
-        bitsPerEntry += sz.bitCount if not sz.constant else 0
-    else:
-        cFlags |= 0x02
-    
-    if hasRotation:
-        cFlags |= 0x04
-        bitsPerEntry += rx.bitCount if not rx.constant else 0
-        bitsPerEntry += ry.bitCount if not ry.constant else 0
-        bitsPerEntry += rz.bitCount if not rz.constant else 0
-        bitsPerEntry += 1 #The 1 is for extra W rotation bit 
-    
-    if hasPosition:
-        cFlags |= 0x08
-        bitsPerEntry += px.bitCount if not px.constant else 0
-        bitsPerEntry += py.bitCount if not py.constant else 0
-        bitsPerEntry += pz.bitCount if not pz.constant else 0
-    
-    
-    #Compressed Header
-    write_short(b, 0x04)
-    write_short(b, cFlags)
-    write_short(b, 160) #Not Hex in StudioSB
-    write_ushort(b, bitsPerEntry)
-    write_int(b, 204) #Not Hex in StudioSB
-    write_int(b, len(nat.animationTrack))
-    write_float(b, sx.min)
-    write_float(b, sx.max)
-    write_long64(b, sx.bitCount if hasScale else 16)
-    write_float(b, sy.min)
-    write_float(b, sy.max)
-    write_long64(b, sy.bitCount if hasScale else 16)
-    write_float(b, sz.min)
-    write_float(b, sz.max)
-    write_long64(b, sz.bitCount if hasScale else 16)
-    write_float(b, rx.min)
-    write_float(b, rx.max)
-    write_long64(b, rx.bitCount if hasRotation else 16)
-    write_float(b, ry.min)
-    write_float(b, ry.max)
-    write_long64(b, ry.bitCount if hasRotation else 16)
-    write_float(b, rz.min)
-    write_float(b, rz.max)
-    write_long64(b, rz.bitCount if hasRotation else 16)
-    write_float(b, px.min)
-    write_float(b, px.max)
-    write_long64(b, px.bitCount if hasPosition else 16)
-    write_float(b, py.min)
-    write_float(b, py.max)
-    write_long64(b, py.bitCount if hasPosition else 16)
-    write_float(b, pz.min)
-    write_float(b, pz.max)
-    write_long64(b, pz.bitCount if hasPosition else 16)
-    dv = nat.animationTrack[0] #Default Values
-    write_float(b, dv[0][0])
-    write_float(b, dv[0][1])
-    write_float(b, dv[0][2])
-    write_float(b, dv[1][0])
-    write_float(b, dv[1][1])
-    write_float(b, dv[1][2])
-    write_float(b, dv[1][3])
-    write_float(b, dv[2][0])
-    write_float(b, dv[2][1])
-    write_float(b, dv[2][2])
-    write_int(b, 0)
-    
-    #Now we can finally write the bits
-    bitString = ""
-    frame = 0
-    for af in nat.animationTrack:
-        if hasScale:
-            #print("Frame: " + str(frame) + " af[0][0] = " + str(af[0][0]))
-           # print("sx.quantanize = " + str(sx.quantanize(af[0][0], sx.bitCount)) + " ")
-            bitString += get_bits(sx.quantanize(af[0][0], sx.bitCount), sx.bitCount)
-            bitString += get_bits(sy.quantanize(af[0][1], sy.bitCount), sy.bitCount)
-            bitString += get_bits(sz.quantanize(af[0][2], sz.bitCount), sz.bitCount)
-
-        if hasRotation:
-            #print("Frame: " + str(frame) + " af[1][0] = " + str(af[1][0]))
-            #print("rx.quantanize = " + str(rx.quantanize(af[1][0], rx.bitCount)) + " ")
-            bitString += get_bits(rx.quantanize(af[1][0], rx.bitCount), rx.bitCount)
-            bitString += get_bits(ry.quantanize(af[1][1], ry.bitCount), ry.bitCount)
-            bitString += get_bits(rz.quantanize(af[1][2], rz.bitCount), rz.bitCount)
-            
-        if hasPosition:
-            bitString += get_bits(px.quantanize(af[2][0], px.bitCount), px.bitCount)
-            bitString += get_bits(py.quantanize(af[2][1], py.bitCount), py.bitCount)
-            bitString += get_bits(pz.quantanize(af[2][2], pz.bitCount), pz.bitCount)
-            if not pz.constant:
-                print("Frame: " + str(frame) + ", af[2][2] = " + str(af[2][2]) + ", pz.quantize = " + str(pz.quantanize(af[2][2], pz.bitCount)) 
-                    + ",pz.bitCount =" + str(pz.bitCount) + ", bits = " + str(get_bits(pz.quantanize(af[2][2], pz.bitCount), pz.bitCount)))
-        if hasRotation:
-            #'flip-W' bit
-            w = math.sqrt(math.fabs( 1 - (
-                rx.decompressed_value(af[1][0], rx.bitCount)**2 +
-                ry.decompressed_value(af[1][1], ry.bitCount)**2 +
-                rz.decompressed_value(af[1][2], rz.bitCount)**2)))
-            fBit = 1 if (af[1][3] < 0) != (w < 0) else 0
-            bitString += get_bits(fBit, 1)
-        frame += 1
-        
-    #print("bitString Length = " + str(len(bitString)))
-    #print("bitString = " + str(bitString))
-    if bitString != "":       
-        ba = get_bytes(bitString)
-        write_bytes(b, ba)
-
-def get_bits(value, bitCount):
-    bits = ""
-    for i in range(bitCount):
-        bit = (value >> i) & 0x1
-        bits += format(bit, 'b')  
-    return bits
-
-def get_bytes(bitString):
-    ba = []
-    byte = 0
-    bitCounter = 0
-    for bit in bitString:
-        byte |= int(bit, 2) << bitCounter
-        bitCounter += 1
-        if bitCounter == 8:
-            ba.append(byte)
-            byte = 0
-            bitCounter = 0 
-    if bitCounter != 0:
-        ba.append(byte) 
-    return ba    
-
-
-"""
-def write_transform(b, nat):
-    if all_same(nat):
-        write_const_transform(b, nat)
-    else:
-        write_compressed_transform(b, nat)
-"""
+    b.write(values.tobytes())
+    nat.flags |= AnimTrackFlags.Direct.value
     
-def write_track_from_nat(b, nat, compression):
+def write_track_from_nat(b, nat, compression, budget=None):
     nat.dataOffset = b.tell()
+    write_track_data(b, nat, compression, budget)
+    nat.dataSize = b.tell() - nat.dataOffset
+    pad(b, 0x64)
+
+def write_track_data(b, nat, compression, budget=None):
     nat.frameCount = len(nat.animationTrack)
     
     if ((nat.flags & 0x00ff) == AnimTrackFlags.Transform.value):
-        if all_same(nat):
-            write_const_transform(b, nat)
-            nat.frameCount = 1
-        elif compression:
-            write_compressed_transform(b, nat)
-        else:
-            write_uncompressed_tranform(b, nat)
+        write_transform(b, nat, compression, budget or ErrorBudget())
             
-    elif ((nat.flags & 0x00ff) == AnimTrackFlags.Float.value):
-        for af in nat.animationTrack:
-            write_float(b,af)
-        if (nat.frameCount == 1):
-            nat.flags |= AnimTrackFlags.Constant.value
-        else:
-            nat.flags |= AnimTrackFlags.Direct.value
+    elif ((nat.flags & 0x00ff) == AnimTrackFlags.Float.value or (nat.flags & 0x00ff) == AnimTrackFlags.Vector.value):
+        budget = budget or ErrorBudget()
+        write_value_track(b, nat, compression, budget.material, budget.strategy)
     
     elif ((nat.flags & 0x00ff) == AnimTrackFlags.Boolean.value):
-        for af in nat.animationTrack:
-            write_byte(b,af)
-        if (nat.frameCount == 1):
-            nat.flags |= AnimTrackFlags.Constant.value
-        else:
-            nat.flags |= AnimTrackFlags.Direct.value
-        
-    elif (nat.flags & 0x00ff) == AnimTrackFlags.Vector.value:
-        for af in nat.animationTrack:
-            for i in af: #[0, 1 , 2 , 3] Should be a vector of 4 values
-                write_float(b, i)
-        if (nat.frameCount == 1):
-            nat.flags |= AnimTrackFlags.Constant.value
-        else:
-            nat.flags |= AnimTrackFlags.Direct.value
-            
-    
-    nat.dataSize = b.tell() - nat.dataOffset
-    pad(b, 0x64)
+        write_boolean_track(b, nat, compression)
             
             
+# ==== Export estimate ====
+# Makes the same const/compressed/direct choice as write_track_data for every track, from the quantanization
+# analysis alone, so the file size and error of an export are known without packing any bits or writing a file.
+class TrackEstimate:
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+        self.encoding = 'Direct'
+        self.size = 0
+        self.bitsPerEntry = 0
+        self.errors = {} # Max error per kind of channel, 'scale', 'rotation', 'position' or 'material'
+        self.dataKey = None # Tracks that would encode to the same data only get written once
+
+    def __repr__(self):
+        return "%s %s: %s %d bytes %s" % (self.name, self.type, self.encoding, self.size, self.errors)
+
+def transform_kind_errors(errors):
+    # errors is per column sx sy sz rx ry rz rw px py pz
+    return {'scale': float(max(errors[0:3])), 'rotation': float(max(errors[3:7])), 'position': float(max(errors[7:10]))}
+
+def estimate_transform(e, at, compression, budget):
+    if is_constant_transform(at, budget):
+        e.encoding = 'Const'
+        e.size = TRANSFORM_SIZE
+        e.errors = transform_kind_errors(constant_errors(at)[:10])
+        e.dataKey = at[0].astype('<f4', copy=False).tobytes()
+        return
+    if compression and budget.lossy():
+        ct = CompressedTransform(at, budget)
+        if ct.valid and ct.size() < TRANSFORM_SIZE * len(at) and ct.meets(budget):
+            e.encoding = 'Compressed'
+            e.size = ct.size()
+            e.bitsPerEntry = ct.bitsPerEntry
+            e.errors = transform_kind_errors(ct.max_errors())
+            return
+    e.size = TRANSFORM_SIZE * len(at)
+    e.errors = {'scale': 0.0, 'rotation': 0.0, 'position': 0.0}
+
+def estimate_value_track(e, nat, compression, epsilon, strategy='SMALLEST'):
+    values = value_track_array(nat)
+    constError = float(numpy.abs(values - values[0]).max())
+    if constError <= epsilon:
+        e.encoding = 'Const'
+        e.size = values.shape[1] * 4
+        e.errors = {'material': constError}
+        e.dataKey = values[0].astype('<f4').tobytes()
+        return
+    if compression and epsilon > 0:
+        cv = CompressedValues(values, epsilon, strategy)
+        if cv.valid and cv.size() < values.size * 4 and cv.max_error() <= epsilon:
+            e.encoding = 'Compressed'
+            e.size = cv.size()
+            e.bitsPerEntry = cv.bitsPerEntry
+            e.errors = {'material': cv.max_error()}
+            return
+    e.size = values.size * 4
+    e.errors = {'material': 0.0}
+
+def estimate_boolean_track(e, nat, compression):
+    values = nat.animationTrack.astype(numpy.uint8)
+    if (values == values[0]).all():
+        e.encoding = 'Const'
+        e.size = 1
+        e.dataKey = values[:1].tobytes()
+        return
+    compressedSize = COMPRESSED_BOOLEAN_DEFAULT_OFFSET + 1 + (len(values) + 7) // 8
+    if compression and compressedSize < len(values):
+        e.encoding = 'Compressed'
+        e.size = compressedSize
+        e.bitsPerEntry = 1
+        return
+    e.size = len(values)
+
+def estimate_track(name, nat, compression, budget=None):
+    budget = budget or ErrorBudget()
+    e = TrackEstimate(name, nat.type)
+    trackType = nat.flags & 0x00ff
+    if trackType == AnimTrackFlags.Transform.value:
+        estimate_transform(e, nat.animationTrack, compression, budget)
+    elif trackType == AnimTrackFlags.Float.value or trackType == AnimTrackFlags.Vector.value:
+        estimate_value_track(e, nat, compression, budget.material, budget.strategy)
+    elif trackType == AnimTrackFlags.Boolean.value:
+        estimate_boolean_track(e, nat, compression)
+    if e.dataKey is None: # The same frames always encode the same way
+        e.dataKey = (trackType, nat.animationTrack.tobytes())
+    return e
+
+class ExportEstimate:
+    def __init__(self, tracks, bufferSize, fileSize):
+        self.tracks = tracks
+        self.bufferSize = bufferSize
+        self.fileSize = fileSize
+        self.seconds = 0.0
+
+    def max_errors(self):
+        errors = {'scale': 0.0, 'rotation': 0.0, 'position': 0.0, 'material': 0.0}
+        for e in self.tracks:
+            for kind, error in e.errors.items():
+                errors[kind] = max(errors[kind], error)
+        return errors
+
+def estimate_export(groups, compression, budget=None, animName="estimate.nuanmb"):
+    # Predicted sizes and errors for groups as make_anim_buffer and make_nuanmb would write them
+    tracks = []
+    for g in groups:
+        for node in g.nodes:
+            for nat in node_tracks(g, node):
+                tracks.append(estimate_track(node.name, nat, compression, budget))
+    bufferSize = 0
+    dataKeys = set() # Same as make_anim_buffer's dedupe
+    for e in tracks:
+        if e.dataKey in dataKeys:
+            continue
+        dataKeys.add(e.dataKey)
+        bufferSize += align(e.size, 0x64)
+    return ExportEstimate(tracks, bufferSize, layout_nuanmb(groups, animName, bufferSize).fileSize)
+
+def print_export_estimate(estimate):
+    for e in estimate.tracks:
+        print("%-32s %-16s %-10s %7d bytes %3d bits/frame  %s" % (e.name, e.type, e.encoding, e.size, e.bitsPerEntry,
+              " ".join("%s %.3g" % (kind, error) for kind, error in sorted(e.errors.items()))))
+    errors = estimate.max_errors()
+    print("Predicted file size %d bytes (%d byte buffer) | max error position %.3g rotation %.3g scale %.3g material %.3g" %
+          (estimate.fileSize, estimate.bufferSize, errors['position'], errors['rotation'], errors['scale'], errors['material']))
+
+class CameraSampler:
+    # Fills a camera's "Transform" and "Camera" groups, one frame at a time as sample_frames steps through the scene
+    def __init__(self, c, sce):
+        self.camera = c
+        
+        #Make Transform Group
+        self.tg = Group()
+        self.tg.nodesAnimType = AnimType.Transform.value
+        
+        #Make Transform Node
+        tn = Node()
+        tn.name = c.name
+        
+        self.frameCount = sce.frame_end - sce.frame_start
+        
+        #make NodeAnimTrack
+        self.tnat = tn.nodeAnimTrack
+        self.tnat.flags |= AnimTrackFlags.Transform.value
+        self.tnat.type = "Transform"
+        self.tnat.allocate(self.frameCount)
+        self.tg.nodes.append(tn)
+        
+        #Make Camera Group
+        self.cg = Group()
+        self.cg.nodesAnimType = AnimType.Camera.value
+        
+        #Make Camera Node
+        cn = Node()
+        cn.name = c.name + "Shape" 
+        
+        #Make Camera Subnodes as if it were material
+        csnFarClip = Node()
+        csnFieldOfView = Node()
+        csnNearClip = Node()
+        
+        #FarClip seems to be the same value in all investigated tracks
+        cnat = csnFarClip.nodeAnimTrack
+        cnat.flags |= AnimTrackFlags.Float.value
+        cnat.flags |= AnimTrackFlags.Constant.value
+        cnat.type = "FarClip"
+        cnat.allocate(1)
+        cnat.animationTrack[0] = 100000.0
+        
+        #Field of view changes throughout an animation, proper keyframing is planned
+        self.fnat = csnFieldOfView.nodeAnimTrack
+        self.fnat.flags |= AnimTrackFlags.Float.value
+        self.fnat.type = "FieldOfView"
+        self.fnat.allocate(self.frameCount)
+        
+        #NearClip seems to be the same value in all investigated tracks
+        cnat = csnNearClip.nodeAnimTrack
+        cnat.flags |= AnimTrackFlags.Float.value
+        cnat.flags |= AnimTrackFlags.Constant.value
+        cnat.type = "NearClip"
+        cnat.allocate(1)
+        cnat.animationTrack[0] = 1.0
+        
+        cn.materialSubNodes.append(csnFarClip)
+        cn.materialSubNodes.append(csnFieldOfView)
+        cn.materialSubNodes.append(csnNearClip)
+        self.cg.nodes.append(cn)
+    
+    def needs_sampling(self):
+        return self.frameCount > 0
+    
+    def sample(self, i):
+        if i >= self.frameCount: # Camera tracks stop one frame short of the scene's end frame
+            return
+        c = self.camera
+        q = c.rotation_quaternion #Blender has RW in first index, Smash has it in last
+        self.tnat.animationTrack[i] = (c.scale[0], c.scale[1], c.scale[2], 
+                                       q[1], q[2], q[3], q[0], 
+                                       c.location[0], c.location[1], c.location[2], 0)
+        self.fnat.animationTrack[i] = c.data.angle_y #Todo: Figure out FOV conversion, dont hardcode this value
+    
+    def make_groups(self):
+        #Cameras have 2 groups, a "Transform" and a "Camera" group
+        return [self.tg, self.cg]
+
+def sample_frames(sce, samplers):
+    # Changing frames is the expensive part, so every sampler gets filled in by the same pass over the frames
+    samplers = [s for s in samplers if s.needs_sampling()]
+    if not samplers:
+        return
+    for i, frame in enumerate(range(sce.frame_start, sce.frame_end + 1)): # Range is not inclusive of the stop so need to add + 1
+        sce.frame_set(frame)
+        for sampler in samplers:
+            sampler.sample(i)
+
 def gather_camera_groups(context):    
-    #Blender stuff
-    sce = bpy.context.scene #blender scene
-    c = bpy.context.object #blender Camera
-    
-    #Cameras have 2 groups, a "Transform" and a "Camera" group
-    groups = []
-    
-    #Make Transform Group
-    tg = Group()
-    tg.nodesAnimType = AnimType.Transform.value
-    
-    #Make Transform Node
-    tn = Node()
-    tn.name = c.name
-    
-    #make NodeAnimTrack
-    tnat = tn.nodeAnimTrack
-    for f in range(sce.frame_start, sce.frame_end):
-        sce.frame_set(f)
-        sx = c.scale[0]; sy = c.scale[1]; sz = c.scale[2]
-        rw = c.rotation_quaternion[0] #Blender has RW in first index, Smash has it in last
-        rx = c.rotation_quaternion[1]
-        ry = c.rotation_quaternion[2]
-        rz = c.rotation_quaternion[3]
-        px = c.location[0]; py = c.location[1]; pz = c.location[2]
-        tnat.animationTrack.append([[sx, sy, sz, 1], [rx, ry, rz, rw], [px, py, pz, 1]])
-        tnat.flags |= AnimTrackFlags.Transform.value
-        tnat.type = "Transform"
-    
-    tn.nodeAnimTrack = tnat
-    tg.nodes.append(tn)
-    
-    #Make Camera Group
-    cg = Group()
-    cg.nodesAnimType = AnimType.Camera.value
-    
-    #Make Camera Node
-    cn = Node()
-    cn.name = c.name + "Shape" 
-    
-    #Make Camera Subnodes as if it were material
-    csnFarClip = Node()
-    csnFieldOfView = Node()
-    csnNearClip = Node()
-    
-    #FarClip seems to be the same value in all investigated tracks
-    cnat = csnFarClip.nodeAnimTrack
-    cnat.animationTrack.append(100000.0)
-    cnat.flags |= AnimTrackFlags.Float.value
-    cnat.flags |= AnimTrackFlags.Constant.value
-    cnat.type = "FarClip"
-    csnFarClip.nodeAnimTrack = cnat
-    
-    #Field of view changes throughout an animation, proper keyframing is planned
-    cnat = csnFieldOfView.nodeAnimTrack
-    cnat.flags |= AnimTrackFlags.Float.value
-    cnat.type = "FieldOfView"
-    for f in range(sce.frame_start, sce.frame_end):
-        sce.frame_set(f)
-        cnat.animationTrack.append(c.data.angle_y) #Todo: Figure out FOV conversion, dont hardcode this value
-    csnFieldOfView.nodeAnimTrack = cnat
-    
-    #NearClip seems to be the same value in all investigated tracks
-    cnat = csnNearClip.nodeAnimTrack
-    cnat.animationTrack.append(1.0)
-    cnat.flags |= AnimTrackFlags.Float.value
-    cnat.flags |= AnimTrackFlags.Constant.value
-    cnat.type = "NearClip"
-    csnNearClip.nodeAnimTrack = cnat
-        
-    
-    
-    
-    cn.materialSubNodes.append(csnFarClip)
-    cn.materialSubNodes.append(csnFieldOfView)
-    cn.materialSubNodes.append(csnNearClip)
- 
-    cg.nodes.append(cn)
-    
-    
-    groups.append(tg) 
-    groups.append(cg)
-    return groups
-    
-def gather_groups(context, exportSplit): 
-    #Blender Setup
-    obj = bpy.context.object
-    sce = bpy.context.scene
-    
-    #Groups Setup
-    groups = []
-    
-    #Make Transform group
-    tg = Group()
-    tg.nodesAnimType = AnimType.Transform.value
-    
-    bones = []
-    if exportSplit:
-        fcurves = obj.animation_data.action.fcurves
-        for curve in fcurves:
-            if not curve.group.select:
-                continue
-            bn = curve.data_path.split('"')[1]
-            pb = obj.pose.bones.get(bn)
-            if pb:
-                if pb not in bones:
-                    bones.append(pb)
-            
-    else:
-        for bone in obj.pose.bones:
-            bones.append(bone)
+    sampler = CameraSampler(bpy.context.object, bpy.context.scene)
+    sample_frames(bpy.context.scene, [sampler])
+    return sampler.make_groups()
+    
+# ==== Incremental export cache ====
+# Remembers the sampled frames and encoded data of every bone per exported file, so re-exporting
+# after tweaking a few bones only samples and compresses the bones whose F-curves changed.
+class ExportCacheEntry:
+    def __init__(self, key, animationTrack, encoded):
+        self.key = key
+        self.animationTrack = animationTrack
+        self.encoded = encoded # (data, flags, frameCount) from encode_track
+
+# Only the most recently exported files are kept, a batch export would otherwise hold the frames and encoded
+# data of every action for the rest of the session. A few instead of one so a multi-object export still fits.
+EXPORT_CACHE_FILES = 4
+export_caches = collections.OrderedDict() # Key is the exported file's path, Value is a dict of bone name -> ExportCacheEntry
 
-    # Re-Write, current theory is that updating frames is expensive, so here will only go through all frames once.
-    ignore_markers = ['_eff', 'H_', '_offset', '_null']
+def get_export_cache(filepath):
+    path = os.path.abspath(filepath)
+    cache = export_caches.pop(path, {})
+    export_caches[path] = cache # Most recent last
+    while len(export_caches) > EXPORT_CACHE_FILES:
+        export_caches.popitem(last=False)
+    return cache
 
-    # Transform Group Prep
-    for bone in bones: 
-        if any(ss in bone.name for ss in ignore_markers):
-            bones.remove(bone)
+def fcurve_key(curve):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(("%s|%d|%s" % (curve.data_path, curve.array_index, curve.extrapolation)).encode())
+    kps = curve.keyframe_points
+    for prop in ('co', 'handle_left', 'handle_right'):
+        values = numpy.empty(len(kps) * 2, dtype=numpy.float32)
+        kps.foreach_get(prop, values)
+        h.update(values.tobytes())
+    h.update(str([(kp.interpolation, kp.easing) for kp in kps]).encode())
+    for m in curve.modifiers:
+        h.update(str([getattr(m, p.identifier) for p in m.bl_rna.properties 
+                      if p.type in {'BOOLEAN', 'INT', 'FLOAT', 'ENUM'} and not getattr(p, 'is_array', False)]).encode())
+    return h.digest()
 
-    bone_node_dict = {} # Key is the bone name, Value is the transform node
+def get_bone_cache_keys(obj, bones, sce, encodeSettings):
+    # A bone's parent-relative transform only depends on its own curves and the rest pose of it and its parent,
+    # unless it doesn't fully inherit its parent's transform, then the parent's curves matter too.
+    # Bones touched by constraints or drivers are never reused (key is None).
+    action = obj.animation_data.action if obj.animation_data else None
+    bone_curve_keys = {}
+    keyed_channels = {} # Bone name -> (property, array index) of every curve on it
+    if action:
+        for curve in action.fcurves:
+            if curve.data_path.startswith('pose.bones'):
+                boneName = curve.data_path.split('"')[1]
+                bone_curve_keys.setdefault(boneName, []).append(fcurve_key(curve))
+                keyed_channels.setdefault(boneName, set()).add((curve.data_path.split('"]')[-1].lstrip('.'), curve.array_index))
+    
+    volatile = set()
+    animData = obj.animation_data
+    if animData:
+        for driver in animData.drivers:
+            if driver.data_path.startswith('pose.bones'):
+                volatile.add(driver.data_path.split('"')[1])
+        # Like get_direct_fcurves, NLA strips (or blending the action into them) can move any bone
+        if (any(track.strips and not track.mute for track in animData.nla_tracks) 
+            or animData.action_influence != 1 or animData.action_blend_type != 'REPLACE'):
+            volatile.update(pb.name for pb in obj.pose.bones)
+    for pb in obj.pose.bones:
+        if pb.constraints:
+            volatile.add(pb.name)
+            volatile.update(p.name for p in pb.parent_recursive) #IK moves the whole chain
+    
+    keys = {}
+    def bone_key(pb):
+        if pb.name not in keys:
+            keys[pb.name] = None if pb.name in volatile else make_bone_key(pb)
+        return keys[pb.name]
+    
+    def make_bone_key(pb):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str((sce.frame_start, sce.frame_end, encodeSettings, obj.data.pose_position)).encode())
+        h.update(str([list(row) for row in pb.bone.matrix_local]).encode())
+        for curveKey in sorted(bone_curve_keys.get(pb.name, [])):
+            h.update(curveKey)
+        # Channels without curves keep whatever the pose has, so re-posing a bone changes its frames too
+        rotation = {'QUATERNION': 'rotation_quaternion', 'AXIS_ANGLE': 'rotation_axis_angle'}.get(pb.rotation_mode, 'rotation_euler')
+        keyed = keyed_channels.get(pb.name, set())
+        h.update(pb.rotation_mode.encode())
+        for prop in ('location', rotation, 'scale'):
+            h.update(str([v for i, v in enumerate(getattr(pb, prop)) if (prop, i) not in keyed]).encode())
+        if pb.parent:
+            h.update(str([list(row) for row in pb.parent.bone.matrix_local]).encode())
+            if pb.bone.inherit_scale != 'FULL' or not pb.bone.use_inherit_rotation:
+                parentKey = bone_key(pb.parent)
+                if parentKey is None:
+                    return None
+                h.update(parentKey)
+        return h.digest()
+    
     for bone in bones:
-        tn = Node()
-        tn.name = bone.name
-        nat = tn.nodeAnimTrack
-        nat.flags |= AnimTrackFlags.Transform.value
-        nat.type = "Transform"
-        bone_node_dict[bone.name] = tn
-
-    # Visibility Group Prep
-    vis_group = Group()
-    vis_group.nodesAnimType = AnimType.Visibility.value
-
-    vis_markers = ['_VIS_O']
-    vis_meshes = []
-    for child in obj.children:
-        if not any(ss in child.name for ss in vis_markers):
-            continue
-        if exportSplit:
-            curve_selected = False
-            for curve in child.animation_data.action.fcurves:
-                if curve.group.select:
-                    curve_selected = True
-            if curve_selected == False:
-                continue
-        if child in vis_meshes:
-            continue
-        vis_meshes.append(child)
-    
-    vis_mesh_node_dict = {} #Key is vis_mesh name, Value is the vis node
-    for vis_mesh in vis_meshes:
-        vis_name = None
-        for vis_marker in vis_markers:
-            if vis_marker in vis_mesh.name:
-                vis_name = vis_mesh.name.split(vis_marker)[0]
-        vis_node = Node()
-        vis_node.name = vis_name
-        nat = vis_node.nodeAnimTrack
-        nat.flags |= AnimTrackFlags.Boolean.value
-        nat.type = 'Visibility'
-        vis_mesh_node_dict[vis_mesh] = vis_node
-
-    
-    # Material Group Prep
-    mat_group = Group()
-    mat_group.nodesAnimType = AnimType.Material.value
-
-    mat_name_main_node_dict = {} # Key is mat name, Value is the main node (Material nodes are wierd and have 'subnodes')
-    mat_prop_sub_node_dict = {} # Key is mat prop, Value is the sub node
-    main_node_sub_nodes_dict = {} # Key is main node, Value is the list of sub nodes
-    sub_node_blender_property_dict = {}
-    for key, value in obj.items(): #Key Format for materials should be nat.name:nat.type
-        if ':' not in key:
-            continue
-        mat_name = key.split(':')[0] # e.g. 'EyeL'
-        mat_property = key.split(':')[1] # e.g. 'CustomVector6'
+        bone_key(bone)
+    return keys
+
+def update_export_cache(cache, groups):
+    # Stores the encoded data of the bones gather_groups sampled, once make_anim_buffer is done with them
+    for node in groups[0].nodes: #Transform group
+        entry = cache.get(node.name)
+        if entry is not None and entry.encoded is None:
+            entry.encoded = node.nodeAnimTrack.encoded
+
+def get_direct_fcurves(id_data, dataPath):
+    # Returns the F-curves animating dataPath by array index, or None when a driver or NLA strip 
+    # could also change its value, then it has to be read from the scene after every frame change
+    animData = id_data.animation_data
+    if animData is None:
+        return {}
+    if any(driver.data_path == dataPath for driver in animData.drivers):
+        return None
+    if any(track.strips and not track.mute for track in animData.nla_tracks):
+        return None
+    if animData.action is None:
+        return {}
+    return {curve.array_index: curve for curve in animData.action.fcurves 
+            if curve.data_path == dataPath and not curve.mute}
+
+def sample_fcurve(curve, frames, discrete=False):
+    # Evaluates curve on all frames at once, discrete is for curves on int and bool properties
+    values = sample_fcurve_values(curve, frames)
+    if discrete: # Blender rounds those before using the value, evaluate already does but the keyframe paths don't
+        values = numpy.floor(values + 0.5)
+    return values
+
+def sample_fcurve_values(curve, frames):
+    # Step and linear curves are expanded straight from their keyframes,
+    # anything else (bezier, easing, modifiers, extrapolation) goes through Blender's evaluate, frame by frame
+    kps = curve.keyframe_points
+    if len(kps) > 0 and not curve.modifiers and curve.extrapolation == 'CONSTANT':
+        co = numpy.empty(len(kps) * 2, dtype=numpy.float32)
+        kps.foreach_get('co', co)
+        x = co[0::2].astype(numpy.float64)
+        y = co[1::2].astype(numpy.float64)
+        interpolations = {kp.interpolation for kp in kps[:-1]} # The last key's interpolation never gets used
+        if interpolations <= {'CONSTANT'}:
+            # Every key holds its value until the next key, so the frames are just the key values repeated by run length
+            runLengths = numpy.diff(numpy.searchsorted(frames, x, side='left'), append=len(frames))
+            runLengths[0] += numpy.searchsorted(frames, x[0], side='left') # Frames before the first key hold its value
+            return numpy.repeat(y, runLengths)
+        if interpolations == {'LINEAR'}:
+            return numpy.interp(frames, x, y)
+    return numpy.array([curve.evaluate(f) for f in frames], dtype=numpy.float64)
+
+def to_bool(values):
+    # The one rule for turning sampled values into Visibility and Boolean frames, both sampling paths use it.
+    # Any nonzero value is True, int and bool curves get rounded first by sample_fcurve like Blender does.
+    return numpy.asarray(values) != 0
 
-        if mat_name not in mat_name_main_node_dict.keys():
-            mat_main_node = Node()
-            mat_main_node.name = mat_name
-            mat_name_main_node_dict[mat_name] = mat_main_node
+def sample_property(id_data, dataPath, size, frames):
+    # Returns a (frames, size) array of dataPath's value on every frame, or None if it can't be read from F-curves.
+    # Channels without a curve keep their current value.
+    curves = get_direct_fcurves(id_data, dataPath)
+    if curves is None:
+        return None
+    current = id_data.path_resolve(dataPath)
+    discrete = isinstance(current[0] if size > 1 else current, int) # bool is an int too
+    values = numpy.empty((len(frames), size), dtype=numpy.float64)
+    for i in range(size):
+        if i in curves:
+            values[:, i] = sample_fcurve(curves[i], frames, discrete)
+        else:
+            values[:, i] = current[i] if size > 1 else current
+    return values
+
+class ArmatureSampler:
+    # Fills an armature's Transform, Visibility and Material groups, one frame at a time as sample_frames steps through the scene
+    def __init__(self, obj, sce, exportSplit, cache=None, encodeSettings=None):
+        self.obj = obj
         
-        prop_sub_node = Node()
-        nat = prop_sub_node.nodeAnimTrack
-        if 'Boolean' in mat_property:
-            nat.flags |= AnimTrackFlags.Boolean.value
-        elif 'Float' in mat_property:
-            nat.flags |= AnimTrackFlags.Float.value
-        elif 'Vector' in mat_property:
-            nat.flags |= AnimTrackFlags.Vector.value
+        #Make Transform group
+        self.tg = Group()
+        self.tg.nodesAnimType = AnimType.Transform.value
+        
+        frameCount = sce.frame_end - sce.frame_start + 1 # Every track gets one row per frame, allocated up front
+        
+        bones = []
+        if exportSplit:
+            fcurves = obj.animation_data.action.fcurves
+            for curve in fcurves:
+                if not curve.group.select:
+                    continue
+                bn = curve.data_path.split('"')[1]
+                pb = obj.pose.bones.get(bn)
+                if pb:
+                    if pb not in bones:
+                        bones.append(pb)
+                
         else:
-            print('Unknown Material Property Type %s' % (mat_property))
-            continue
-        nat.type = mat_property
-        mat_prop_sub_node_dict[mat_property] = prop_sub_node
+            for bone in obj.pose.bones:
+                bones.append(bone)
 
-        main_node = mat_name_main_node_dict[mat_name]
-        if main_node not in main_node_sub_nodes_dict:
-            main_node_sub_nodes_dict[main_node] = []
-        sub_node_list = main_node_sub_nodes_dict[main_node]
-        sub_node_list.append(prop_sub_node)
-        sub_node_blender_property_dict[prop_sub_node] = key
+        ignore_markers = ['_eff', 'H_', '_offset', '_null']
 
+        # Transform Group Prep
+        for bone in bones: 
+            if any(ss in bone.name for ss in ignore_markers):
+                bones.remove(bone)
 
-        
-    # Go through each frame, and fill out the nodes for each group
-    for frame in range(sce.frame_start, sce.frame_end + 1): # Range is not inclusive of the stop so need to add + 1
-        sce.frame_set(frame)
+        self.bone_node_dict = {} # Key is the bone name, Value is the transform node
         for bone in bones:
-            tn = bone_node_dict[bone.name]
+            tn = Node()
+            tn.name = bone.name
+            nat = tn.nodeAnimTrack
+            nat.flags |= AnimTrackFlags.Transform.value
+            nat.type = "Transform"
+            nat.allocate(frameCount)
+            self.bone_node_dict[bone.name] = tn
+
+        # Bones whose curves haven't changed since the last export to this file reuse their encoded track
+        self.sampled_bones = bones
+        if cache is not None:
+            bone_keys = get_bone_cache_keys(obj, bones, sce, encodeSettings)
+            self.sampled_bones = []
+            for bone in bones:
+                nat = self.bone_node_dict[bone.name].nodeAnimTrack
+                key = bone_keys[bone.name]
+                entry = cache.get(bone.name)
+                if key is not None and entry is not None and entry.key == key and entry.encoded is not None:
+                    nat.animationTrack = entry.animationTrack
+                    nat.encoded = entry.encoded
+                    continue
+                self.sampled_bones.append(bone)
+                if key is None:
+                    cache.pop(bone.name, None)
+                else:
+                    cache[bone.name] = ExportCacheEntry(key, nat.animationTrack, None)
+
+        # Visibility Group Prep
+        self.vis_group = Group()
+        self.vis_group.nodesAnimType = AnimType.Visibility.value
+
+        vis_markers = ['_VIS_O']
+        self.vis_meshes = []
+        for child in obj.children:
+            if not any(ss in child.name for ss in vis_markers):
+                continue
+            if exportSplit:
+                curve_selected = False
+                for curve in child.animation_data.action.fcurves:
+                    if curve.group.select:
+                        curve_selected = True
+                if curve_selected == False:
+                    continue
+            if child in self.vis_meshes:
+                continue
+            self.vis_meshes.append(child)
+        
+        self.vis_mesh_node_dict = {} #Key is vis_mesh name, Value is the vis node
+        for vis_mesh in self.vis_meshes:
+            vis_name = None
+            for vis_marker in vis_markers:
+                if vis_marker in vis_mesh.name:
+                    vis_name = vis_mesh.name.split(vis_marker)[0]
+            vis_node = Node()
+            vis_node.name = vis_name
+            nat = vis_node.nodeAnimTrack
+            nat.flags |= AnimTrackFlags.Boolean.value
+            nat.type = 'Visibility'
+            nat.allocate(frameCount)
+            self.vis_mesh_node_dict[vis_mesh] = vis_node
+
+        
+        # Material Group Prep
+        self.mat_group = Group()
+        self.mat_group.nodesAnimType = AnimType.Material.value
+
+        mat_name_main_node_dict = {} # Key is mat name, Value is the main node (Material nodes are wierd and have 'subnodes')
+        mat_prop_sub_node_dict = {} # Key is mat prop, Value is the sub node
+        self.main_node_sub_nodes_dict = {} # Key is main node, Value is the list of sub nodes
+        self.sub_node_blender_property_dict = {}
+        for key, value in obj.items(): #Key Format for materials should be nat.name:nat.type
+            if ':' not in key:
+                continue
+            mat_name = key.split(':')[0] # e.g. 'EyeL'
+            mat_property = key.split(':')[1] # e.g. 'CustomVector6'
+
+            if mat_name not in mat_name_main_node_dict.keys():
+                mat_main_node = Node()
+                mat_main_node.name = mat_name
+                mat_name_main_node_dict[mat_name] = mat_main_node
+            
+            prop_sub_node = Node()
+            nat = prop_sub_node.nodeAnimTrack
+            if 'Boolean' in mat_property:
+                nat.flags |= AnimTrackFlags.Boolean.value
+            elif 'Float' in mat_property:
+                nat.flags |= AnimTrackFlags.Float.value
+            elif 'Vector' in mat_property:
+                nat.flags |= AnimTrackFlags.Vector.value
+            else:
+                print('Unknown Material Property Type %s' % (mat_property))
+                continue
+            nat.type = mat_property
+            nat.allocate(frameCount)
+            mat_prop_sub_node_dict[mat_property] = prop_sub_node
+
+            main_node = mat_name_main_node_dict[mat_name]
+            if main_node not in self.main_node_sub_nodes_dict:
+                self.main_node_sub_nodes_dict[main_node] = []
+            sub_node_list = self.main_node_sub_nodes_dict[main_node]
+            sub_node_list.append(prop_sub_node)
+            self.sub_node_blender_property_dict[prop_sub_node] = key
+
+        # Visibility and material values come straight from F-curves, so they get evaluated for all frames up front.
+        # Only the ones a driver or NLA strip could change still get read after every frame change.
+        frames = numpy.arange(sce.frame_start, sce.frame_end + 1, dtype=numpy.float64)
+        self.sampled_vis_meshes = []
+        for vis_mesh in self.vis_meshes:
+            values = sample_property(vis_mesh, 'hide_render', 1, frames)
+            if values is None:
+                self.sampled_vis_meshes.append(vis_mesh)
+                continue
+            self.vis_mesh_node_dict[vis_mesh].nodeAnimTrack.animationTrack[:] = ~to_bool(values[:, 0]) # Visible unless hidden
+
+        self.sampled_sub_nodes = []
+        for sub_node, key in self.sub_node_blender_property_dict.items():
+            nat = sub_node.nodeAnimTrack
+            values = sample_property(obj, '["%s"]' % key, 4 if 'Vector' in nat.type else 1, frames)
+            if values is None:
+                self.sampled_sub_nodes.append(sub_node)
+            elif 'Vector' in nat.type:
+                nat.animationTrack[:] = values
+            elif 'Boolean' in nat.type:
+                nat.animationTrack[:] = to_bool(values[:, 0])
+            else:
+                nat.animationTrack[:] = values[:, 0]
+
+    def needs_sampling(self):
+        # Nothing to sample when every bone was reused and the visibility and material tracks came from F-curves
+        return bool(self.sampled_bones or self.sampled_vis_meshes or self.sampled_sub_nodes)
+
+    def sample(self, i):
+        # Fill out row i of the nodes for each group, the scene is already on the matching frame
+        obj = self.obj
+        for bone in self.sampled_bones:
+            tn = self.bone_node_dict[bone.name]
             trans = None
             rot = None
             scale = None
@@ -844,83 +1367,291 @@ def gather_groups(context, exportSplit):
                 trans = rm.to_translation()
                 rot = rm.to_quaternion()
                 scale = rm.to_scale()
-            if frame != sce.frame_start:
-                previous_frame_smash_quaternion = nat.animationTrack[frame - sce.frame_start - 1][1][:]
-                p = previous_frame_smash_quaternion
+            if i != 0:
+                p = nat.animationTrack[i - 1, 3:7] # previous frame's smash quaternion
                 previous_frame_blender_quaternion = mathutils.Quaternion([p[3],p[0],p[1],p[2]])
                 if previous_frame_blender_quaternion.dot(rot) < 0:
                     rot.negate()
-            nat.animationTrack.append([ [scale[0], scale[1], scale[2], 1],
-                                        [rot[1], rot[2], rot[3], rot[0]],
-                                        [trans[0], trans[1], trans[2], 1] ])
+            nat.animationTrack[i] = (scale[0], scale[1], scale[2],
+                                     rot[1], rot[2], rot[3], rot[0],
+                                     trans[0], trans[1], trans[2], 0)
         
-        for vis_mesh in vis_meshes:
-            vis_node = vis_mesh_node_dict[vis_mesh]
+        for vis_mesh in self.sampled_vis_meshes:
+            vis_node = self.vis_mesh_node_dict[vis_mesh]
             nat = vis_node.nodeAnimTrack
-            is_visible = not vis_mesh.hide_render
-            nat.animationTrack.append(is_visible)
+            nat.animationTrack[i] = not to_bool(vis_mesh.hide_render)
 
-        for main_node, sub_node_list in main_node_sub_nodes_dict.items():
-            for sub_node in sub_node_list:
-                nat = sub_node.nodeAnimTrack
-                blender_property = obj[sub_node_blender_property_dict[sub_node]]
-                bp = blender_property
-                if 'Vector' in nat.type:
-                    nat.animationTrack.append([bp[0], bp[1], bp[2], bp[3]])
-                else:
-                    nat.animationTrack.append(bp)
+        for sub_node in self.sampled_sub_nodes:
+            nat = sub_node.nodeAnimTrack
+            blender_property = obj[self.sub_node_blender_property_dict[sub_node]]
+            bp = blender_property
+            if 'Vector' in nat.type:
+                nat.animationTrack[i] = (bp[0], bp[1], bp[2], bp[3])
+            elif 'Boolean' in nat.type:
+                nat.animationTrack[i] = to_bool(bp)
+            else:
+                nat.animationTrack[i] = bp
 
-    # Add the Nodes to their Group and then add the groups to the list.
-    for bone_node in bone_node_dict:
-        tg.nodes.append(bone_node_dict[bone_node])
-    tg.nodes.sort(key = lambda node: node.name)
+    def make_groups(self):
+        # Add the Nodes to their Group and then add the groups to the list.
+        groups = []
+        for bone_node in self.bone_node_dict:
+            self.tg.nodes.append(self.bone_node_dict[bone_node])
+        self.tg.nodes.sort(key = lambda node: node.name)
 
-    for vis_mesh in vis_mesh_node_dict:
-        vis_group.nodes.append(vis_mesh_node_dict[vis_mesh])
-    vis_group.nodes.sort(key = lambda node: node.name)
+        for vis_mesh in self.vis_mesh_node_dict:
+            self.vis_group.nodes.append(self.vis_mesh_node_dict[vis_mesh])
+        self.vis_group.nodes.sort(key = lambda node: node.name)
 
-    for main_node, sub_node_list in main_node_sub_nodes_dict.items():
-        for sub_node in sub_node_list:
-            main_node.materialSubNodes.append(sub_node)
+        for main_node, sub_node_list in self.main_node_sub_nodes_dict.items():
+            for sub_node in sub_node_list:
+                main_node.materialSubNodes.append(sub_node)
 
-    for main_node in main_node_sub_nodes_dict.keys():
-        mat_group.nodes.append(main_node)
-    
-    groups.append(tg)
-    groups.append(vis_group)
-    groups.append(mat_group)
+        for main_node in self.main_node_sub_nodes_dict.keys():
+            self.mat_group.nodes.append(main_node)
+        
+        groups.append(self.tg)
+        groups.append(self.vis_group)
+        groups.append(self.mat_group)
 
-    return groups
-    
-def export_nuanmb_main(context, filepath, compression, exportSplit):
- 
-    print(str(filepath))
-    fileName = os.path.basename(filepath)
-    print(str(fileName))
-    groups = []
+        return groups
+
+def gather_groups(context, exportSplit, cache=None, encodeSettings=None): 
+    sampler = ArmatureSampler(bpy.context.object, bpy.context.scene, exportSplit, cache, encodeSettings)
+    sample_frames(bpy.context.scene, [sampler])
+    return sampler.make_groups()
     
+def gather_export_groups(context, compression, exportSplit, cache=None, budget=None):
     if (context.active_object.type == 'CAMERA'):
         compression = False # Smash Camera Anims are not compressed
         groups = gather_camera_groups(context)
     else:
-        groups = gather_groups(context, exportSplit)
-    
-    animBuffer = make_anim_buffer(context, groups, compression)
-    
-    s = bpy.context.scene
-    finalFrameIndex = s.frame_end - s.frame_start - 1
- 
+        groups = gather_groups(context, exportSplit, cache, (compression, budget))
+    return groups, compression
+
+def get_final_frame_index(scene):
+    return scene.frame_end - scene.frame_start - 1
+
+def write_nuanmb_file(filepath, groups, compression, finalFrameIndex, pool=None, budget=None):
+    # Returns the size of the written file
+    animBuffer = make_anim_buffer(None, groups, compression, pool=pool, budget=budget)
+    data = make_nuanmb(animBuffer, groups, finalFrameIndex, os.path.basename(filepath))
     with open(filepath, 'wb') as f:
-        write_nuanmb(f, animBuffer, groups, finalFrameIndex, fileName)
+        f.write(data)
+    return len(data)
+
+def export_nuanmb_main(context, filepath, compression, exportSplit, incremental=False, budget=None):
+ 
+    print(str(filepath))
+    fileName = os.path.basename(filepath)
+    print(str(fileName))
+    
+    cache = get_export_cache(filepath) if incremental and context.active_object.type == 'ARMATURE' else None
+    # Starting the pipeline first lets the compression workers spin up while the frames get sampled
+    with ExportPipeline(compression) as pipeline:
+        result = BatchExportResult()
+        result.fileName = fileName
+        groups, compression = gather_export_groups(context, compression, exportSplit, cache, budget)
+        pipeline.submit(filepath, groups, compression, get_final_frame_index(bpy.context.scene), result, cache, budget)
 
     return {'FINISHED'}
 
+export_estimates = {} # Key is the object's name, Value is its last ExportEstimate, shown in the sidebar
+
+def estimate_nuanmb_main(context, animName, compression, exportSplit, budget=None):
+    # Samples the active object like an export would, but stops after the quantanization analysis
+    start = time.time()
+    groups, compression = gather_export_groups(context, compression, exportSplit, None, budget)
+    estimate = estimate_export(groups, compression, budget, animName)
+    estimate.seconds = time.time() - start
+    export_estimates[context.active_object.name] = estimate
+    print_export_estimate(estimate)
+    return estimate
+
+def active_export_name(obj):
+    action = obj.animation_data.action if obj.animation_data else None
+    return get_export_file_name(action.name if action else obj.name)
+
+def action_fits_object(action, obj):
+    # Armature actions key pose bones or material properties, camera actions key the object itself
+    for curve in action.fcurves:
+        isArmatureCurve = curve.data_path.startswith('pose.bones') or curve.data_path.startswith('["')
+        if isArmatureCurve == (obj.type == 'ARMATURE'):
+            return True
+    return False
+
+def get_export_file_name(name):
+    # Imported actions are named after their file, so they may already have the extension
+    name = name.replace('/', '_').replace('\\', '_')
+    if not name.lower().endswith('.nuanmb'):
+        name += '.nuanmb'
+    return name
+
+class BatchExportResult:
+    def __init__(self):
+        self.fileName = ""
+        self.fileSize = 0
+        self.sampleTime = 0
+        self.encodeTime = 0
+
+def encode_and_write_action(filepath, groups, compression, finalFrameIndex, pool, result, cache, budget):
+    start = time.time()
+    result.fileSize = write_nuanmb_file(filepath, groups, compression, finalFrameIndex, pool, budget)
+    if cache is not None:
+        update_export_cache(cache, groups)
+    result.encodeTime = time.time() - start
+    return result
+
+class ExportPipeline:
+    # Sampling has to stay on Blender's main thread, everything after it (compressing the tracks, then laying out
+    # and writing the file) runs on writer threads, so it overlaps whatever the main thread samples next.
+    # The process pool only starts the first time a file has enough uncached tracks to compress, see LazyProcessPool.
+    # At most depth files wait to be written at once, that keeps memory use flat on large movesets.
+    def __init__(self, compression=True, writers=1, depth=1, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.depth = max(depth, 1)
+        self.pending = collections.deque()
+        self.results = []
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=max(writers, 1))
+        self.pool = LazyProcessPool(self.workers) if compression and self.workers > 1 else None
+    
+    def submit(self, filepath, groups, compression, finalFrameIndex, result, cache=None, budget=None):
+        while len(self.pending) >= self.depth:
+            self.results.append(self.pending.popleft().result())
+        self.pending.append(self.writer.submit(encode_and_write_action, filepath, groups, compression, 
+                                               finalFrameIndex, self.pool, result, cache, budget))
+    
+    def finish(self):
+        # Returns the BatchExportResult of every submitted file, in submission order
+        while self.pending:
+            self.results.append(self.pending.popleft().result())
+        return self.results
+    
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.writer.shutdown(wait=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, excType, excValue, traceback):
+        try:
+            if excType is None:
+                self.finish()
+        finally:
+            self.close()
+
+def export_nuanmb_batch(context, directory, compression, exportSplit, actionFilter, incremental=False, budget=None):
+    # Exports every action that fits the active object to <action>.nuanmb in directory.
+    # Sampling has to happen on the main thread, but the previous action gets compressed and written
+    # on a background thread (and the process pool) while the next one is being sampled.
+    obj = context.active_object
+    sce = context.scene
+    actions = [a for a in bpy.data.actions 
+               if fnmatch.fnmatchcase(a.name, actionFilter or '*') and action_fits_object(a, obj)]
+    if not actions:
+        return [], 0
+    
+    if obj.animation_data is None:
+        obj.animation_data_create()
+    originalAction = obj.animation_data.action
+    originalFrames = (sce.frame_start, sce.frame_end, sce.frame_current)
+    
+    batchStart = time.time()
+    try:
+        with ExportPipeline(compression) as pipeline:
+            for action in actions:
+                result = BatchExportResult()
+                result.fileName = get_export_file_name(action.name)
+                
+                filepath = os.path.join(directory, result.fileName)
+                cache = get_export_cache(filepath) if incremental and obj.type == 'ARMATURE' else None
+                
+                sampleStart = time.time()
+                obj.animation_data.action = action
+                frameStart, frameEnd = action.frame_range
+                sce.frame_start = int(round(frameStart))
+                sce.frame_end = int(round(frameEnd))
+                groups, actionCompression = gather_export_groups(context, compression, exportSplit, cache, budget)
+                result.sampleTime = time.time() - sampleStart
+                
+                pipeline.submit(filepath, groups, actionCompression, get_final_frame_index(sce), result, cache, budget)
+            results = pipeline.finish()
+    finally:
+        obj.animation_data.action = originalAction
+        sce.frame_start, sce.frame_end = originalFrames[0], originalFrames[1]
+        sce.frame_set(originalFrames[2])
+    
+    for r in results:
+        print("%s: %d bytes, sampled in %.3fs, encoded + written in %.3fs" % (r.fileName, r.fileSize, r.sampleTime, r.encodeTime))
+    totalTime = time.time() - batchStart
+    print("Exported %d actions (%d bytes) in %.3f seconds" % (len(results), sum(r.fileSize for r in results), totalTime))
+    return results, totalTime
+
+def export_nuanmb_multi(context, directory, compression, exportSplit, incremental=False, budget=None):
+    # Exports every selected armature and camera to <object>.nuanmb in directory.
+    # All of them get sampled during one pass over the frames, then each file is compressed and written
+    # on its own thread, sharing one process pool.
+    sce = context.scene
+    objects = [o for o in context.selected_objects if o.type in {'ARMATURE', 'CAMERA'}]
+    if not objects:
+        return [], 0
+    
+    batchStart = time.time()
+    jobs = [] # (filepath, sampler, compression, cache, result)
+    for obj in objects:
+        result = BatchExportResult()
+        result.fileName = get_export_file_name(obj.name)
+        filepath = os.path.join(directory, result.fileName)
+        if obj.type == 'CAMERA':
+            jobs.append((filepath, CameraSampler(obj, sce), False, None, result)) # Smash Camera Anims are not compressed
+        else:
+            cache = get_export_cache(filepath) if incremental else None
+            sampler = ArmatureSampler(obj, sce, exportSplit, cache, (compression, budget))
+            jobs.append((filepath, sampler, compression, cache, result))
+    
+    originalFrame = sce.frame_current
+    # Every object's file gets its own writer thread, they all finish sampling at the same time
+    with ExportPipeline(compression, writers=len(jobs), depth=len(jobs)) as pipeline:
+        sampleStart = time.time()
+        try:
+            sample_frames(sce, [job[1] for job in jobs])
+        finally:
+            sce.frame_set(originalFrame)
+        sampleTime = time.time() - sampleStart
+        
+        finalFrameIndex = get_final_frame_index(sce)
+        for filepath, sampler, objCompression, cache, result in jobs:
+            result.sampleTime = sampleTime
+            pipeline.submit(filepath, sampler.make_groups(), objCompression, finalFrameIndex, result, cache, budget)
+        results = pipeline.finish()
+    
+    print("Sampled %d objects in %.3fs" % (len(results), sampleTime))
+    for r in results:
+        print("%s: %d bytes, encoded + written in %.3fs" % (r.fileName, r.fileSize, r.encodeTime))
+    totalTime = time.time() - batchStart
+    print("Exported %d objects (%d bytes) in %.3f seconds" % (len(results), sum(r.fileSize for r in results), totalTime))
+    return results, totalTime
+
 
 # ExportHelper is a helper class, defines filename and
 # invoke() function which calls the file selector.
-from bpy_extras.io_utils import ExportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
-from bpy.types import Operator
+if bpy is not None:
+    from bpy_extras.io_utils import ExportHelper
+    from bpy.props import StringProperty, BoolProperty, EnumProperty, FloatProperty
+    from bpy.types import Operator, Panel
+else: # Lets worker processes import this file without Blender, the operator is never registered there
+    ExportHelper = object
+    class Operator:
+        pass
+    class Panel:
+        pass
+    def StringProperty(**kwargs):
+        return None
+    BoolProperty = EnumProperty = FloatProperty = StringProperty
 
 
 class ExportSomeData(Operator, ExportHelper):
@@ -941,7 +1672,7 @@ class ExportSomeData(Operator, ExportHelper):
     # to the class instance from the operator settings before calling.
     compression: BoolProperty(
         name="Enable Compression",
-        description="Currently only compresses Transform tracks",
+        description="Compresses Transform, Visibility and Material tracks whenever that makes them smaller",
         default=True,
     )
 
@@ -951,9 +1682,89 @@ class ExportSomeData(Operator, ExportHelper):
         default=False,
     )
     
+    batchExport: BoolProperty(
+        name="Export All Actions",
+        description="Export every action of the selected object to its own <action>.nuanmb in the chosen file's directory",
+        default=False,
+    )
+    
+    actionFilter: StringProperty(
+        name="Action Filter",
+        description="Only export actions whose names match this pattern, e.g. c00attack*",
+        default="*",
+    )
+    
+    multiObjectExport: BoolProperty(
+        name="Export Selected Objects",
+        description="Export every selected armature and camera to its own <object>.nuanmb in the chosen file's directory",
+        default=False,
+    )
+    
+    incrementalExport: BoolProperty(
+        name="Reuse Unchanged Tracks",
+        description="Only re-sample and re-compress bones whose animation changed since the last export to the same file",
+        default=False,
+    )
+    
+    dryRun: BoolProperty(
+        name="Estimate Only",
+        description="Report the predicted file size and compression error of every track without writing the file",
+        default=False,
+    )
+    
+    # Each transform track is written const, compressed or direct, whichever is smallest while staying in these
+    positionError: FloatProperty(
+        name="Max Position Error",
+        description="Largest position difference a bone track may end up with after compression",
+        default=DEFAULT_EPSILON, min=0.0, precision=6,
+    )
+    
+    rotationError: FloatProperty(
+        name="Max Rotation Error",
+        description="Largest quaternion component difference a bone track may end up with after compression",
+        default=DEFAULT_EPSILON, min=0.0, precision=6,
+    )
+    
+    scaleError: FloatProperty(
+        name="Max Scale Error",
+        description="Largest scale difference a bone track may end up with after compression",
+        default=DEFAULT_EPSILON, min=0.0, precision=6,
+    )
+    
+    compressionPreset: EnumProperty(
+        name="Compression Preset",
+        description="How hard to search for the fewest bits per channel, the error limits hold for every preset",
+        items=PRESET_ITEMS,
+        default='SMALLEST',
+    )
     
     def execute(self, context):
-        return export_nuanmb_main(context, self.filepath, self.compression, self.splitExport)
+        budget = ErrorBudget(self.positionError, self.rotationError, self.scaleError, strategy=self.compressionPreset)
+        if self.dryRun:
+            estimate = estimate_nuanmb_main(context, os.path.basename(self.filepath), self.compression, self.splitExport, budget)
+            self.report({'INFO'}, estimate_summary(estimate))
+            return {'FINISHED'}
+        if self.batchExport:
+            results, totalTime = export_nuanmb_batch(context, os.path.dirname(self.filepath), 
+                                                     self.compression, self.splitExport, self.actionFilter, 
+                                                     self.incrementalExport, budget)
+            if not results:
+                self.report({'WARNING'}, "No actions matching '%s' found for %s" % (self.actionFilter, context.active_object.name))
+                return {'CANCELLED'}
+            self.report({'INFO'}, "Exported %d actions (%d bytes) in %.2f seconds" % 
+                        (len(results), sum(r.fileSize for r in results), totalTime))
+            return {'FINISHED'}
+        if self.multiObjectExport:
+            results, totalTime = export_nuanmb_multi(context, os.path.dirname(self.filepath), 
+                                                     self.compression, self.splitExport, 
+                                                     self.incrementalExport, budget)
+            if not results:
+                self.report({'WARNING'}, "No armatures or cameras selected")
+                return {'CANCELLED'}
+            self.report({'INFO'}, "Exported %d objects (%d bytes) in %.2f seconds" % 
+                        (len(results), sum(r.fileSize for r in results), totalTime))
+            return {'FINISHED'}
+        return export_nuanmb_main(context, self.filepath, self.compression, self.splitExport, self.incrementalExport, budget)
     
     @classmethod
     def poll(self, context):
@@ -962,6 +1773,59 @@ class ExportSomeData(Operator, ExportHelper):
                 return True
         return False
 
+def estimate_summary(estimate):
+    errors = estimate.max_errors()
+    return ("Predicted %d bytes, max error position %.2g rotation %.2g scale %.2g material %.2g (%.2f seconds)" %
+            (estimate.fileSize, errors['position'], errors['rotation'], errors['scale'], errors['material'], estimate.seconds))
+
+class EstimateNuanmbExport(Operator):
+    """Predict the exported size and compression error of the active object's animation without writing a file"""
+    bl_idname = "export_test.estimate_nuanmb"
+    bl_label = "Estimate .nuanmb Export"
+    bl_options = {'REGISTER', 'UNDO'} # The redo panel re-runs it live as the settings change
+    
+    compression: BoolProperty(name="Enable Compression", default=True)
+    splitExport: BoolProperty(name="Split Export", default=False)
+    positionError: FloatProperty(name="Max Position Error", default=DEFAULT_EPSILON, min=0.0, precision=6)
+    rotationError: FloatProperty(name="Max Rotation Error", default=DEFAULT_EPSILON, min=0.0, precision=6)
+    scaleError: FloatProperty(name="Max Scale Error", default=DEFAULT_EPSILON, min=0.0, precision=6)
+    compressionPreset: EnumProperty(name="Compression Preset", items=PRESET_ITEMS, default='SMALLEST')
+    
+    def execute(self, context):
+        budget = ErrorBudget(self.positionError, self.rotationError, self.scaleError, strategy=self.compressionPreset)
+        estimate = estimate_nuanmb_main(context, active_export_name(context.active_object), 
+                                        self.compression, self.splitExport, budget)
+        self.report({'INFO'}, estimate_summary(estimate))
+        return {'FINISHED'}
+    
+    @classmethod
+    def poll(self, context):
+        return ExportSomeData.poll(context)
+
+class NUANMB_PT_export_estimate(Panel):
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "NUANMB"
+    bl_label = "Export Estimate"
+    
+    def draw(self, context):
+        layout = self.layout
+        layout.operator(EstimateNuanmbExport.bl_idname, text="Estimate")
+        obj = context.active_object
+        estimate = export_estimates.get(obj.name) if obj is not None else None
+        if estimate is None:
+            return
+        errors = estimate.max_errors()
+        col = layout.column(align=True)
+        col.label(text="%.1f KB predicted" % (estimate.fileSize / 1024.0))
+        counts = collections.Counter(e.encoding for e in estimate.tracks)
+        col.label(text=", ".join("%d %s" % (counts[encoding], encoding) for encoding in ('Const', 'Compressed', 'Direct')))
+        col.label(text="Position error %.2g" % errors['position'])
+        col.label(text="Rotation error %.2g" % errors['rotation'])
+        col.label(text="Scale error %.2g" % errors['scale'])
+        if errors['material']:
+            col.label(text="Material error %.2g" % errors['material'])
+
 # Only needed if you want to add into a dynamic menu
 def menu_func_export(self, context):
     self.layout.operator(ExportSomeData.bl_idname, text="NUANMB (.nuanmb)")
@@ -969,10 +1833,15 @@ def menu_func_export(self, context):
 
 def register():
     bpy.utils.register_class(ExportSomeData)
+    bpy.utils.register_class(EstimateNuanmbExport)
+    bpy.utils.register_class(NUANMB_PT_export_estimate)
     bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
 
 
 def unregister():
+    export_caches.clear()
+    bpy.utils.unregister_class(NUANMB_PT_export_estimate)
+    bpy.utils.unregister_class(EstimateNuanmbExport)
     bpy.utils.unregister_class(ExportSomeData)
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
 
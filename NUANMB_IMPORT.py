@@ -9,7 +9,13 @@ bl_info = {
     "location": "File > Import",
     "category": "Import-Export"}
     
-import bpy, enum, io, math, mathutils, os, struct, time
+import enum, io, math, mmap, os, struct, time, numpy
+try:
+    import bpy, mathutils
+except ImportError: # Lets command line tools read .nuanmb files without Blender
+    bpy = None
+
+SOURCE_FRAME_RATE = 60 # Every animation in the game runs at 60 fps
 
 class AnimTrack:
     def __init__(self):
@@ -73,7 +79,10 @@ class AnimTrackFlags(enum.Enum):
 def readVarLenString(file):
     nameBuffer = []
     while('\x00' not in nameBuffer):
-        nameBuffer.append(str(file.read(1).decode("utf-8", "ignore")))
+        char = file.read(1)
+        if not char: # read() gives empty bytes forever at the end of the file
+            raise RuntimeError("Unexpected end of file while reading a string at %#x" % file.tell())
+        nameBuffer.append(str(char.decode("utf-8", "ignore")))
     del nameBuffer[-1]
     return ''.join(nameBuffer)
 
@@ -128,12 +137,104 @@ def getExactObjectName(objName, compare):
 
     return objName
 
-def getAnimationInfo(self, context, camera_selected, filepath, read_transform, read_material, read_visibility, read_camera):
+class AnimInfo:
+    def __init__(self):
+        self.name = ""
+        self.versionMajor = 0
+        self.versionMinor = 0
+        self.finalFrameIndex = 0
+        self.frameCount = 0
+        self.groups = {} # Structure of this dict is: {AnimType (numeric): an array of AnimTrack objects}
+        self.bufferOffset = 0
+        self.bufferSize = 0
+
+    def __repr__(self):
+        return "AnimName: " + str(self.name) + "\t| # of frames: " + str(self.frameCount) + "\t| Groups: " + str(len(self.groups)) + "\t| BufferOffset: " + str(self.bufferOffset) + "\t| BufferSize: " + str(self.bufferSize) + "\n"
+
+def readAnimInfo(am, animPath=""):
+    # Reads the header, group and node tables, but not the animation buffer itself
+    info = AnimInfo()
+    am.seek(0x10, 0)
+    AnimCheck = struct.unpack('<L', am.read(4))[0]
+    if (AnimCheck != 0x414E494D):
+        raise RuntimeError("%s is not a valid NUANMB file." % animPath)
+    info.versionMajor = struct.unpack('<H', am.read(2))[0]
+    info.versionMinor = struct.unpack('<H', am.read(2))[0]
+    info.finalFrameIndex = struct.unpack('<f', am.read(4))[0]
+    info.frameCount = info.finalFrameIndex + 1
+    Unk1 = struct.unpack('<H', am.read(2))[0]
+    Unk2 = struct.unpack('<H', am.read(2))[0]
+    AnimNameOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+    GroupOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+    GroupCount = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+    info.bufferOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+    info.bufferSize = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+    am.seek(AnimNameOffset, 0)
+    info.name = readVarLenString(am); am.seek(0x04, 1)
+    am.seek(GroupOffset, 0)
+    # Collect information about the nodes
+    for g in range(GroupCount):
+        NodeAnimType = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+        NodeOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+        NodeCount = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+        info.groups[NodeAnimType] = [] # Create empty array to append to later on
+        NextGroupPos = am.tell()
+        # print("AnimType: " + AnimType(NodeAnimType).name + " | " + "NodeOffset: " + str(NodeOffset) + " | " + "NodeCount: " + str(NodeCount) + " | NextGroupPos: " + str(NextGroupPos))
+        am.seek(NodeOffset, 0)
+        for n in range(NodeCount):
+            NodeNameOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+            NodeDataOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+            at = AnimTrack()
+            # Special workaround for material tracks
+            if (NodeAnimType == AnimType.Material.value or NodeAnimType == AnimType.Camera.value):
+                TrackCount = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+                NextNodePos = am.tell()
+                am.seek(NodeNameOffset, 0)
+                NodeName = readVarLenString(am)
+                am.seek(NodeDataOffset, 0)
+                for tr in range(TrackCount):
+                    at = AnimTrack()
+                    at.name = NodeName
+                    # An offset for the type name, which will be seeked to later
+                    TypeOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+                    at.flags = struct.unpack('<L', am.read(4))[0]
+                    at.frameCount = struct.unpack('<L', am.read(4))[0]
+                    Unk3_0 = struct.unpack('<L', am.read(4))[0]
+                    at.dataOffset = struct.unpack('<L', am.read(4))[0]
+                    at.dataSize = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+                    NextTrackPos = am.tell()
+                    am.seek(TypeOffset, 0)
+                    at.type = readVarLenString(am)
+                    am.seek(NextTrackPos, 0)
+                    info.groups[NodeAnimType].append(at)
+            else:
+                NextNodePos = am.tell() + struct.unpack('<L', am.read(4))[0] + 0x07
+
+                am.seek(NodeNameOffset, 0)
+                at.name = readVarLenString(am)
+                am.seek(NodeDataOffset + 0x08, 0)
+                at.flags = struct.unpack('<L', am.read(4))[0]
+                at.frameCount = struct.unpack('<L', am.read(4))[0]
+                Unk3_0 = struct.unpack('<L', am.read(4))[0]
+                at.dataOffset = struct.unpack('<L', am.read(4))[0]
+                at.dataSize = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
+                at.type = readVarLenString(am)
+                info.groups[NodeAnimType].append(at)
+
+            # print("NodeNameOffset: " + str(NodeNameOffset) + " | " + "NodeDataOffset: " + str(NodeDataOffset) + " | " + "NextNodePos: " + str(NextNodePos))
+            # print("NodeName: " + str(at.name) + " | " + "TrackFlags: " + str(at.flags) + " | " + "TrackFrameCount: " + str(at.frameCount) + " | " + "Unk3: " + str(Unk3_0) + " | " + "TrackDataOffset: " + str(at.dataOffset) +" | " + "TrackDataSize: " + str(at.dataSize))
+            am.seek(NextNodePos, 0)
+        # print("---------")
+        am.seek(NextGroupPos, 0)
+    return info
+
+def getAnimationInfo(self, context, camera_selected, filepath, read_transform, read_material, read_visibility, read_camera, frame_rate=SOURCE_FRAME_RATE, 
+                     preview=False, preview_step=4, preview_max_keys=0):
     # Semi-global variables used by this function's hierarchy; cleared every time this function runs
     global AnimName; AnimName = ""
-    GroupCount = 0
     global FrameCount; FrameCount = 0
-    NodeCount = 0
+    global FrameRate; FrameRate = frame_rate
+    global KeyFrames; KeyFrames = [] # Only set for previews
     global AnimGroups; AnimGroups = {}
     # Structure of this dict is: {AnimType (numeric): an array of AnimTrack objects}
 
@@ -141,95 +242,39 @@ def getAnimationInfo(self, context, camera_selected, filepath, read_transform, r
     for animFile in self.files:
         animPath = os.path.join(os.path.dirname(filepath), animFile.name)
         if os.path.isfile(animPath):
-            with open(animPath, 'rb') as am:
-                am.seek(0x10, 0)
-                AnimCheck = struct.unpack('<L', am.read(4))[0]
-                if (AnimCheck == 0x414E494D):
-                    AnimVerA = struct.unpack('<H', am.read(2))[0]
-                    AnimVerB = struct.unpack('<H', am.read(2))[0]
-                    FinalFrameIndex = struct.unpack('<f', am.read(4))[0]
-                    FrameCount = FinalFrameIndex + 1
-                    print("Total # of frames: " + str(FrameCount))
-                    print("FinalFrameIndex: " +str(FinalFrameIndex)) 
-                    Unk1 = struct.unpack('<H', am.read(2))[0]
-                    Unk2 = struct.unpack('<H', am.read(2))[0]
-                    AnimNameOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                    GroupOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                    GroupCount = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                    BufferOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                    BufferSize = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                    print("GroupOffset: " + str(GroupOffset) + " | " + "GroupCount: " + str(GroupCount) + " | " + "BufferOffset: " + str(BufferOffset) + " | " + "BufferSize: " + str(BufferSize))
-                    am.seek(AnimNameOffset, 0)
-                    AnimName = readVarLenString(am); am.seek(0x04, 1)
-                    print("AnimName: " + AnimName)
-                    am.seek(GroupOffset, 0)
-                    # Collect information about the nodes
-                    for g in range(GroupCount):
-                        NodeAnimType = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                        NodeOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                        NodeCount = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                        AnimGroups[NodeAnimType] = [] # Create empty array to append to later on
-                        NextGroupPos = am.tell()
-                        # print("AnimType: " + AnimType(NodeAnimType).name + " | " + "NodeOffset: " + str(NodeOffset) + " | " + "NodeCount: " + str(NodeCount) + " | NextGroupPos: " + str(NextGroupPos))
-                        am.seek(NodeOffset, 0)
-                        for n in range(NodeCount):
-                            NodeNameOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                            NodeDataOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                            at = AnimTrack()
-                            # Special workaround for material tracks
-                            if (NodeAnimType == AnimType.Material.value or NodeAnimType == AnimType.Camera.value):
-                                TrackCount = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                                NextNodePos = am.tell()
-                                am.seek(NodeNameOffset, 0)
-                                NodeName = readVarLenString(am)
-                                am.seek(NodeDataOffset, 0)
-                                for tr in range(TrackCount):
-                                    at = AnimTrack()
-                                    at.name = NodeName
-                                    # An offset for the type name, which will be seeked to later
-                                    TypeOffset = am.tell() + struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                                    at.flags = struct.unpack('<L', am.read(4))[0]
-                                    at.frameCount = struct.unpack('<L', am.read(4))[0]
-                                    Unk3_0 = struct.unpack('<L', am.read(4))[0]
-                                    at.dataOffset = struct.unpack('<L', am.read(4))[0]
-                                    at.dataSize = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                                    NextTrackPos = am.tell()
-                                    am.seek(TypeOffset, 0)
-                                    at.type = readVarLenString(am)
-                                    am.seek(NextTrackPos, 0)
-                                    AnimGroups[NodeAnimType].append(at)
-                            else:
-                                NextNodePos = am.tell() + struct.unpack('<L', am.read(4))[0] + 0x07
-
-                                am.seek(NodeNameOffset, 0)
-                                at.name = readVarLenString(am)
-                                am.seek(NodeDataOffset + 0x08, 0)
-                                at.flags = struct.unpack('<L', am.read(4))[0]
-                                at.frameCount = struct.unpack('<L', am.read(4))[0]
-                                Unk3_0 = struct.unpack('<L', am.read(4))[0]
-                                at.dataOffset = struct.unpack('<L', am.read(4))[0]
-                                at.dataSize = struct.unpack('<L', am.read(4))[0]; am.seek(0x04, 1)
-                                at.type = readVarLenString(am)
-                                AnimGroups[NodeAnimType].append(at)
-
-                            # print("NodeNameOffset: " + str(NodeNameOffset) + " | " + "NodeDataOffset: " + str(NodeDataOffset) + " | " + "NextNodePos: " + str(NextNodePos))
-                            # print("NodeName: " + str(at.name) + " | " + "TrackFlags: " + str(at.flags) + " | " + "TrackFrameCount: " + str(at.frameCount) + " | " + "Unk3: " + str(Unk3_0) + " | " + "TrackDataOffset: " + str(at.dataOffset) +" | " + "TrackDataSize: " + str(at.dataSize))
-                            am.seek(NextNodePos, 0)
-                        # print("---------")
-                        am.seek(NextGroupPos, 0)
-                    print(AnimGroups)
-                    am.seek(BufferOffset, 0) # This must happen or all data will be read incorrectly
-                    readAnimations(io.BytesIO(am.read(BufferSize)))
-
-                    # Now get the data into Blender
-                    if (camera_selected):
-                        importCamera(context)
-                    else:
-                        importAnimations(context, read_transform, read_material, read_visibility, read_camera)
-                    
-
-                else:
-                    raise RuntimeError("%s is not a valid NUANMB file." % animPath)
+            try:
+                # Checks the whole file up front, a broken one is skipped instead of failing halfway through the import
+                info, buffer = readAnimFile(animPath, validate=True)
+            except RuntimeError as e:
+                print(str(e))
+                self.report({'ERROR'}, str(e))
+                continue
+            FrameCount = info.frameCount
+            print("Total # of frames: " + str(FrameCount))
+            print("FinalFrameIndex: " +str(info.finalFrameIndex)) 
+            print("GroupCount: " + str(len(info.groups)) + " | " + "BufferOffset: " + str(info.bufferOffset) + " | " + "BufferSize: " + str(info.bufferSize))
+            AnimName = info.name
+            print("AnimName: " + AnimName)
+            AnimGroups = info.groups
+            print(AnimGroups)
+            if (frame_rate == SOURCE_FRAME_RATE and not preview):
+                readAnimations(io.BytesIO(buffer))
+            else:
+                times = getResampleTimes(info.frameCount, SOURCE_FRAME_RATE, frame_rate)
+                FrameCount = len(times)
+                if (preview):
+                    # Only the picked frames get sampled and keyed, on the same frames a full import would key them
+                    rows = getPreviewRows(len(times), preview_step, preview_max_keys)
+                    times = times[rows]
+                    KeyFrames = rows + 1
+                readResampledAnimations(info, buffer, times)
+                print("Sampled " + str(len(times)) + " of " + str(FrameCount) + " frames at " + str(frame_rate) + " fps")
+
+            # Now get the data into Blender
+            if (camera_selected):
+                importCamera(context)
+            else:
+                importAnimations(context, read_transform, read_material, read_visibility, read_camera)
 
 def readAnimations(ao):
     for ag in AnimGroups.items():
@@ -401,7 +446,19 @@ def readCompressedData(aq, track):
         print("Compressed texture data extraction not yet implemented")
 
     if ((track.flags & 0x00ff) == AnimTrackFlags.Float.value):
-        print("Compressed float data extraction not yet implemented")
+        Start = struct.unpack('<f', aq.read(4))[0]
+        End = struct.unpack('<f', aq.read(4))[0]
+        Count = struct.unpack('<L', aq.read(4))[0]; aq.seek(0x04, 1)
+        item = AnimCompressedItem(Start, End, Count)
+
+        aq.seek(track.dataOffset + ach.defaultDataOffset, 0)
+        frameValue = struct.unpack('<f', aq.read(4))[0] # Used as is when the value never changes
+        aq.seek(track.dataOffset + ach.compressedDataOffset, 0)
+        for f in range(ach.frameCount):
+            if (item.count != 0):
+                value, bp = readBits(aq, item.count, bp)
+                frameValue = lerp(item.start, item.end, 0, 1, value / float((1 << item.count) - 1))
+            track.animations.append(frameValue)
 
     if ((track.flags & 0x00ff) == AnimTrackFlags.PatternIndex.value):
         print("Compressed pattern index data extraction not yet implemented")
@@ -451,6 +508,408 @@ def readCompressedData(aq, track):
             track.animations.append(values[:]) #Gotta append a copy by using [:], or else a reference will get appended and all values of the list will be the last ones
         print(track.animations)
 
+# ==== Array decoding ====
+# numpy versions of readDirectData and readCompressedData, these don't need Blender and decode a whole track at once.
+# Every track decodes to a (frames, channels) array, const tracks only have one frame.
+# Transform channels are SX SY SZ RX RY RZ RW PX PY PZ, Vector4 channels are X Y Z W, Float and Boolean have one channel.
+TRANSFORM_CHANNELS = ['SX', 'SY', 'SZ', 'RX', 'RY', 'RZ', 'RW', 'PX', 'PY', 'PZ']
+TRACK_CHANNEL_COUNTS = {AnimTrackFlags.Transform.value: 10, AnimTrackFlags.Float.value: 1, 
+                        AnimTrackFlags.Boolean.value: 1, AnimTrackFlags.Vector4.value: 4}
+DIRECT_FRAME_SIZES = {AnimTrackFlags.Transform.value: 0x2C, AnimTrackFlags.Float.value: 0x4, 
+                      AnimTrackFlags.Boolean.value: 0x1, AnimTrackFlags.Vector4.value: 0x10}
+
+def readAnimFile(animPath, indexOnly=False, validate=False):
+    # Returns the AnimInfo and the animation buffer, the buffer is None with indexOnly.
+    # validate reads the whole file and runs validateAnimData on it first.
+    if validate:
+        with open(animPath, 'rb') as am:
+            data = am.read()
+        info = validateAnimData(data, animPath)
+        return info, None if indexOnly else data[info.bufferOffset:info.bufferOffset + info.bufferSize]
+    with open(animPath, 'rb') as am:
+        info = readAnimInfo(am, animPath)
+        if indexOnly:
+            return info, None
+        am.seek(info.bufferOffset, 0)
+        return info, am.read(info.bufferSize)
+
+def readCompressedHeader(buffer, offset):
+    ach = AnimCompressedHeader()
+    ach.unk_4, ach.flags, ach.defaultDataOffset, ach.bitsPerEntry, ach.compressedDataOffset, ach.frameCount = struct.unpack_from('<HHHHLL', buffer, offset)
+    return ach
+
+def readCompressedItems(buffer, offset, count):
+    # The items follow the 0x10 byte header
+    return [AnimCompressedItem(*struct.unpack_from('<ffL', buffer, offset + 0x10 + i * 0x10)) for i in range(count)]
+
+def getCompressedItemMask(track, ach):
+    # Which of the items actually have bits stored per frame, in the order they are stored
+    if ((track.flags & 0x00ff) != AnimTrackFlags.Transform.value):
+        return None
+    scaleFlags = ach.flags & 0x3
+    return ([scaleFlags == 0x3 or scaleFlags == 0x1] + [scaleFlags == 0x1] * 2 
+            + [(ach.flags & 0x4) > 0] * 3 + [(ach.flags & 0x8) > 0] * 3)
+
+def unpackFrameBits(buffer, offset, frameBits, frameCount, firstFrame=0):
+    # Returns a (frameCount, frameBits) array of the bits readBits would read for those frames.
+    # The bitstream is LSB first and every frame takes exactly frameBits bits, so frame N starts at bit N * frameBits
+    # and only the bytes holding the requested frames get touched.
+    firstBit = firstFrame * frameBits
+    lastBit = firstBit + frameCount * frameBits
+    raw = numpy.frombuffer(buffer, dtype=numpy.uint8, count=(lastBit + 7) // 8 - firstBit // 8, offset=offset + firstBit // 8)
+    bits = ((raw[:, None] >> numpy.arange(8, dtype=numpy.uint8)) & 1).reshape(-1)
+    skip = firstBit % 8
+    return bits[skip:skip + frameCount * frameBits].reshape(frameCount, frameBits)
+
+def dequantize(bits, item):
+    # Same result as lerp(item.start, item.end, 0, 1, value / float(scale)) for every frame's value
+    value = bits.astype(numpy.float64) @ numpy.ldexp(1.0, numpy.arange(item.count))
+    scale = float((1 << item.count) - 1)
+    mu = value / scale
+    result = (item.start * (1 - mu)) + (item.end * mu)
+    result[value == 0] = item.start
+    result[value == scale] = item.end
+    return result
+
+def clampFrameRange(storedFrames, firstFrame, frameCount):
+    if frameCount is None:
+        frameCount = storedFrames - firstFrame
+    return max(0, min(frameCount, storedFrames - firstFrame))
+
+def decodeCompressedTrack(buffer, track, firstFrame=0, frameCount=None):
+    ach = readCompressedHeader(buffer, track.dataOffset)
+    trackType = track.flags & 0x00ff
+    frameCount = clampFrameRange(ach.frameCount, firstFrame, frameCount)
+    dataStart = track.dataOffset + ach.compressedDataOffset
+
+    if (trackType == AnimTrackFlags.Boolean.value):
+        bits = unpackFrameBits(buffer, dataStart, ach.bitsPerEntry, frameCount, firstFrame)
+        return (bits.astype(numpy.float64) @ numpy.ldexp(1.0, numpy.arange(ach.bitsPerEntry)) == 1)[:, None]
+
+    channelCount = TRACK_CHANNEL_COUNTS.get(trackType)
+    if channelCount is None:
+        return None
+    itemCount = 9 if trackType == AnimTrackFlags.Transform.value else channelCount
+    items = readCompressedItems(buffer, track.dataOffset, itemCount)
+    mask = getCompressedItemMask(track, ach) or [True] * itemCount
+    defaults = numpy.frombuffer(buffer, dtype=numpy.float32, count=channelCount, offset=track.dataOffset + ach.defaultDataOffset)
+    frames = numpy.empty((frameCount, channelCount), dtype=numpy.float64)
+    frames[:] = defaults
+
+    # Transform items skip RW, it gets rebuilt from the flip bit
+    itemChannels = [0, 1, 2, 3, 4, 5, 7, 8, 9] if trackType == AnimTrackFlags.Transform.value else list(range(channelCount))
+    hasRotation = trackType == AnimTrackFlags.Transform.value and (ach.flags & 0x4) > 0
+    frameBits = sum(item.count for item, used in zip(items, mask) if used) + (1 if hasRotation else 0)
+    bits = unpackFrameBits(buffer, dataStart, frameBits, frameCount, firstFrame)
+    bitPosition = 0
+    for itemIndex, item in enumerate(items):
+        if not mask[itemIndex] or item.count == 0:
+            continue
+        frames[:, itemChannels[itemIndex]] = dequantize(bits[:, bitPosition:bitPosition + item.count], item)
+        bitPosition += item.count
+    if trackType == AnimTrackFlags.Transform.value and (ach.flags & 0x3) == 0x3:
+        frames[:, 1] = frames[:, 2] = frames[:, 0] # Isotropic scale only stores X
+    if hasRotation:
+        # W is calculated
+        frames[:, 6] = numpy.sqrt(numpy.abs(1 - numpy.sum(frames[:, 3:6] ** 2, axis=1)))
+        frames[bits[:, bitPosition] == 1, 6] *= -1
+    return frames.astype(numpy.float32)
+
+def decodeDirectTrack(buffer, track, firstFrame=0, frameCount=None):
+    trackType = track.flags & 0x00ff
+    frameSize = DIRECT_FRAME_SIZES.get(trackType)
+    if frameSize is None:
+        return None
+    frameCount = clampFrameRange(getStoredFrameCount(buffer, track), firstFrame, frameCount)
+    offset = track.dataOffset + firstFrame * frameSize
+    if (trackType == AnimTrackFlags.Boolean.value):
+        return (numpy.frombuffer(buffer, dtype=numpy.uint8, count=frameCount, offset=offset) == 1)[:, None]
+    values = numpy.frombuffer(buffer, dtype=numpy.float32, count=frameCount * frameSize // 4, offset=offset)
+    return values.reshape(frameCount, frameSize // 4)[:, :TRACK_CHANNEL_COUNTS[trackType]].copy() # Drops PW
+
+def getStoredFrameCount(buffer, track):
+    # Const tracks store a single frame, compressed ones keep their own count in the compressed header
+    if ((track.flags & 0xff00) == AnimTrackFlags.Compressed.value):
+        return readCompressedHeader(buffer, track.dataOffset).frameCount
+    if ((track.flags & 0xff00) == AnimTrackFlags.Direct.value):
+        return track.frameCount
+    return 1
+
+def decodeTrack(buffer, track, firstFrame=0, frameCount=None):
+    # Returns the (frames, channels) array for track, or None for track types that can't be decoded yet (Texture, PatternIndex).
+    # firstFrame and frameCount pick out a range of the stored frames, only the data of that range gets read.
+    if ((track.flags & 0xff00) == AnimTrackFlags.Compressed.value):
+        return decodeCompressedTrack(buffer, track, firstFrame, frameCount)
+    return decodeDirectTrack(buffer, track, firstFrame, frameCount)
+
+def decodeTrackFrames(buffer, track, firstFrame, frameCount=1):
+    # Returns exactly frameCount rows starting at animation frame firstFrame. Const tracks give their only frame
+    # for every row, and frames past the end of a shorter track hold its last frame, like the imported keys would.
+    storedFrames = getStoredFrameCount(buffer, track)
+    if storedFrames == 0 or firstFrame < 0:
+        return None
+    first = min(firstFrame, storedFrames - 1)
+    frames = decodeTrack(buffer, track, first, min(firstFrame + frameCount, storedFrames) - first)
+    if frames is None:
+        return None
+    return frames[numpy.minimum(numpy.arange(firstFrame, firstFrame + frameCount), storedFrames - 1) - first]
+
+def decodeFrame(buffer, track, frame):
+    # A single frame of track as a (channels,) array
+    frames = decodeTrackFrames(buffer, track, frame, 1)
+    return None if frames is None else frames[0]
+
+def decodeAnimation(info, buffer):
+    # Returns {AnimType (numeric): [(AnimTrack, array)]}
+    return {animType: [(track, decodeTrack(buffer, track)) for track in tracks] for animType, tracks in info.groups.items()}
+
+def iterateFrameChunks(am, chunkSize=64, animPath="", validate=False):
+    # Yields (firstFrame, {AnimType (numeric): [(AnimTrack, array)]}) for every chunkSize frames of the animation,
+    # each array holding exactly that chunk's rows like decodeTrackFrames. am is a file opened in binary mode; it
+    # gets memory-mapped, so only the pages holding the current chunk are read and memory stays the same however
+    # long the animation is.
+    mm = mmap.mmap(am.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        info = validateAnimData(mm, animPath) if validate else readAnimInfo(mm, animPath)
+        view = memoryview(mm)
+        buffer = view[info.bufferOffset:info.bufferOffset + info.bufferSize]
+        try:
+            frameCount = int(info.frameCount)
+            for firstFrame in range(0, frameCount, chunkSize):
+                count = min(chunkSize, frameCount - firstFrame)
+                yield firstFrame, {animType: [(track, decodeTrackFrames(buffer, track, firstFrame, count)) for track in tracks]
+                                   for animType, tracks in info.groups.items()}
+        finally:
+            buffer.release()
+            view.release()
+    finally:
+        mm.close()
+
+# ==== Validation ====
+# Checks every offset, count and string of a whole file against its size before anything gets decoded,
+# so a corrupt or truncated file fails straight away with the offset at fault instead of deep in the import.
+def checkRange(data, offset, size, what, animPath):
+    if offset < 0 or size < 0 or offset + size > len(data):
+        raise RuntimeError("%s: %s at %#x (%d bytes) is outside the file (%d bytes)" % (animPath, what, offset, size, len(data)))
+
+def checkString(data, offset, what, animPath):
+    checkRange(data, offset, 1, what, animPath)
+    if data.find(b'\x00', offset) < 0:
+        raise RuntimeError("%s: %s at %#x has no terminator" % (animPath, what, offset))
+
+def checkTrack(data, info, track, animPath):
+    # Bounds of the track's data inside the animation buffer, and the compression header sanity
+    what = "%s track %s" % (track.type, track.name)
+    if track.dataOffset + track.dataSize > info.bufferSize:
+        raise RuntimeError("%s: %s data at %#x (%d bytes) is outside the animation buffer (%d bytes)" %
+                           (animPath, what, track.dataOffset, track.dataSize, info.bufferSize))
+    trackType = track.flags & 0x00ff
+    trackMode = track.flags & 0xff00
+    dataStart = info.bufferOffset + track.dataOffset
+    if trackMode == AnimTrackFlags.Compressed.value:
+        if track.dataSize < 0x10:
+            raise RuntimeError("%s: %s is compressed but only has %d bytes of data" % (animPath, what, track.dataSize))
+        ach = readCompressedHeader(data, dataStart)
+        if trackType == AnimTrackFlags.Boolean.value:
+            frameBits = ach.bitsPerEntry
+            if frameBits == 0:
+                raise RuntimeError("%s: %s has 0 bits per entry" % (animPath, what))
+        elif trackType in TRACK_CHANNEL_COUNTS:
+            channelCount = TRACK_CHANNEL_COUNTS[trackType]
+            itemCount = 9 if trackType == AnimTrackFlags.Transform.value else channelCount
+            if 0x10 + itemCount * 0x10 > track.dataSize or ach.defaultDataOffset + channelCount * 4 > track.dataSize:
+                raise RuntimeError("%s: %s compression items or default values run past its %d bytes of data" %
+                                   (animPath, what, track.dataSize))
+            items = readCompressedItems(data, dataStart, itemCount)
+            mask = getCompressedItemMask(track, ach) or [True] * itemCount
+            for i, item in enumerate(items):
+                if mask[i] and item.count > 32:
+                    raise RuntimeError("%s: %s compression item %d has %d bits" % (animPath, what, i, item.count))
+            frameBits = sum(item.count for item, used in zip(items, mask) if used)
+            if trackType == AnimTrackFlags.Transform.value and (ach.flags & 0x4) > 0:
+                frameBits += 1 # W flip bit
+            if frameBits != ach.bitsPerEntry:
+                raise RuntimeError("%s: %s compression items add up to %d bits per frame, the header says %d" %
+                                   (animPath, what, frameBits, ach.bitsPerEntry))
+        else:
+            return # Texture and PatternIndex layouts aren't known, only their bounds get checked
+        if ach.compressedDataOffset + (ach.frameCount * frameBits + 7) // 8 > track.dataSize:
+            raise RuntimeError("%s: %s has %d frames of %d bits at %#x, past its %d bytes of data" %
+                               (animPath, what, ach.frameCount, frameBits, ach.compressedDataOffset, track.dataSize))
+    elif trackType in DIRECT_FRAME_SIZES:
+        storedFrames = track.frameCount if trackMode == AnimTrackFlags.Direct.value else 1
+        if storedFrames * DIRECT_FRAME_SIZES[trackType] > track.dataSize:
+            raise RuntimeError("%s: %s has %d frames of %d bytes, past its %d bytes of data" %
+                               (animPath, what, storedFrames, DIRECT_FRAME_SIZES[trackType], track.dataSize))
+
+def validateAnimData(data, animPath=""):
+    # Returns the AnimInfo of a whole file in data, or raises RuntimeError saying what is wrong and where.
+    # Walks the same tables as readAnimInfo, which only runs once the bounds are known to be good.
+    checkRange(data, 0, 0x48, "Header", animPath)
+    if struct.unpack_from('<L', data, 0x10)[0] != 0x414E494D:
+        raise RuntimeError("%s is not a valid NUANMB file." % animPath)
+    nameOffset = 0x20 + struct.unpack_from('<L', data, 0x20)[0]
+    groupOffset = 0x28 + struct.unpack_from('<L', data, 0x28)[0]
+    groupCount = struct.unpack_from('<L', data, 0x30)[0]
+    bufferOffset = 0x38 + struct.unpack_from('<L', data, 0x38)[0]
+    bufferSize = struct.unpack_from('<L', data, 0x40)[0]
+    checkString(data, nameOffset, "Animation name", animPath)
+    checkRange(data, groupOffset, groupCount * 0x18, "Group table", animPath)
+    checkRange(data, bufferOffset, bufferSize, "Animation buffer", animPath)
+    for g in range(groupCount):
+        entry = groupOffset + g * 0x18
+        animType = struct.unpack_from('<L', data, entry)[0]
+        nodeOffset = entry + 0x08 + struct.unpack_from('<L', data, entry + 0x08)[0]
+        nodeCount = struct.unpack_from('<L', data, entry + 0x10)[0]
+        checkRange(data, nodeOffset, nodeCount * 0x18, "Node table of group %d" % g, animPath)
+        for n in range(nodeCount):
+            node = nodeOffset + n * 0x18
+            checkString(data, node + struct.unpack_from('<L', data, node)[0], "Name of node %d in group %d" % (n, g), animPath)
+            dataOffset = node + 0x08 + struct.unpack_from('<L', data, node + 0x08)[0]
+            if animType == AnimType.Material.value or animType == AnimType.Camera.value:
+                # Several tracks per node, each with its own type name offset
+                trackCount = struct.unpack_from('<L', data, node + 0x10)[0]
+                checkRange(data, dataOffset, trackCount * 0x20, "Tracks of node %d in group %d" % (n, g), animPath)
+                for t in range(trackCount):
+                    record = dataOffset + t * 0x20
+                    checkString(data, record + struct.unpack_from('<L', data, record)[0], "Type name of track at %#x" % record, animPath)
+            else:
+                # One track, its type name follows the record
+                if struct.unpack_from('<L', data, node + 0x10)[0] != 1:
+                    raise RuntimeError("%s: Node %d in group %d has %d tracks, expected 1" %
+                                       (animPath, n, g, struct.unpack_from('<L', data, node + 0x10)[0]))
+                checkRange(data, dataOffset, 0x20, "Track of node %d in group %d" % (n, g), animPath)
+                checkString(data, dataOffset + 0x20, "Type name of track at %#x" % dataOffset, animPath)
+
+    info = readAnimInfo(data if isinstance(data, mmap.mmap) else io.BytesIO(data), animPath) # An mmap reads like a file already
+    for tracks in info.groups.values():
+        for track in tracks:
+            checkTrack(data, info, track, animPath)
+    return info
+
+# ==== Resampling ====
+# Decoded tracks have one row per source frame, these sample them at any fractional frame time.
+def getResampleTimes(frameCount, sourceRate, targetRate):
+    # Source frame times of every target frame, covering the same span as frames 0 .. frameCount - 1
+    targetCount = int(math.floor((frameCount - 1) * targetRate / sourceRate + 1e-6)) + 1
+    return numpy.arange(max(targetCount, 1), dtype=numpy.float64) * (sourceRate / targetRate)
+
+def nlerpQuaternions(a, b, t):
+    # a and b are (n, 4) XYZW, b gets flipped into a's hemisphere so it goes the short way around
+    b = numpy.where(numpy.sum(a * b, axis=1)[:, None] < 0, -b, b)
+    q = a + (b - a) * t[:, None]
+    return q / numpy.linalg.norm(q, axis=1)[:, None]
+
+def slerpQuaternions(a, b, t):
+    dot = numpy.sum(a * b, axis=1)
+    b = numpy.where(dot[:, None] < 0, -b, b)
+    dot = numpy.clip(numpy.abs(dot), 0.0, 1.0)
+    theta = numpy.arccos(dot)
+    sinTheta = numpy.sin(theta)
+    nearlyParallel = sinTheta < 1e-6 # Falls back to nlerp, which is exact enough there and doesn't divide by 0
+    sinTheta[nearlyParallel] = 1.0
+    wa = numpy.where(nearlyParallel, 1 - t, numpy.sin((1 - t) * theta) / sinTheta)
+    wb = numpy.where(nearlyParallel, t, numpy.sin(t * theta) / sinTheta)
+    q = a * wa[:, None] + b * wb[:, None]
+    return q / numpy.linalg.norm(q, axis=1)[:, None]
+
+def resampleTrack(frames, trackFlags, times, quaternionMode='SLERP'):
+    # frames is a (frames, channels) array from decodeTrack, times are fractional source frames.
+    # Positions, scales and material values are interpolated linearly, rotations with slerp (or nlerp) and
+    # booleans hold the value of the frame before. Times past the last frame hold it, const tracks stay const.
+    if frames is None or len(frames) <= 1:
+        return frames
+    trackType = trackFlags & 0x00ff
+    times = numpy.clip(times, 0, len(frames) - 1)
+    before = numpy.floor(times).astype(numpy.int64)
+    after = numpy.minimum(before + 1, len(frames) - 1)
+    t = times - before
+    if trackType == AnimTrackFlags.Boolean.value:
+        return frames[before]
+
+    a = frames[before].astype(numpy.float64)
+    b = frames[after].astype(numpy.float64)
+    result = a + (b - a) * t[:, None]
+    if trackType == AnimTrackFlags.Transform.value:
+        interpolate = slerpQuaternions if quaternionMode == 'SLERP' else nlerpQuaternions
+        result[:, 3:7] = interpolate(a[:, 3:7], b[:, 3:7], t)
+    return result.astype(frames.dtype)
+
+def resampleAnimation(decoded, frameCount, sourceRate, targetRate, quaternionMode='SLERP'):
+    # decodeAnimation's output at a different frame rate, returns it along with the new frame count
+    times = getResampleTimes(frameCount, sourceRate, targetRate)
+    return resampleAnimationAt(decoded, times, quaternionMode), len(times)
+
+def resampleAnimationAt(decoded, times, quaternionMode='SLERP'):
+    # decodeAnimation's output sampled at the given source frame times, which don't need to be evenly spaced
+    resampled = {}
+    for animType, tracks in decoded.items():
+        resampled[animType] = []
+        for track, frames in tracks:
+            if frames is not None and len(frames) > 1:
+                # Shorter tracks only cover the target frames up to their own last frame
+                trackTimes = times[times <= len(frames) - 1 + 1e-6]
+                frames = resampleTrack(frames, track.flags, trackTimes, quaternionMode)
+            resampled[animType].append((track, frames))
+    return resampled
+
+def toTrackAnimations(track, frames):
+    # Array rows -> the per frame values readDirectData and readCompressedData put in track.animations
+    trackType = track.flags & 0x00ff
+    if trackType == AnimTrackFlags.Transform.value:
+        return [mathutils.Matrix([[px, py, pz, 0], [rx, ry, rz, rw], [sx, sy, sz, 1]])
+                for sx, sy, sz, rx, ry, rz, rw, px, py, pz in frames.tolist()]
+    if trackType == AnimTrackFlags.Vector4.value:
+        return frames.tolist()
+    return [row[0] for row in frames.tolist()] # Float and Boolean
+
+def getPreviewRows(frameCount, step, maxKeys=0):
+    # Every step'th frame, spaced out further if that would be more than maxKeys (0 for no limit) keys.
+    # The last frame is always included so the preview ends on the right pose.
+    step = max(1, step)
+    if maxKeys == 1:
+        return numpy.zeros(1, dtype=numpy.int64)
+    if maxKeys > 1:
+        step = max(step, int(math.ceil((frameCount - 1) / float(maxKeys - 1))))
+    rows = numpy.arange(0, frameCount, step)
+    if rows[-1] != frameCount - 1:
+        rows = numpy.append(rows, frameCount - 1)
+    return rows
+
+def readResampledAnimations(info, buffer, times):
+    # Used instead of readAnimations when importing at another frame rate or as a preview, fills track.animations
+    # with the frames at the given source frame times
+    resampled = resampleAnimationAt(decodeAnimation(info, buffer), times)
+    for tracks in resampled.values():
+        for track, frames in tracks:
+            if frames is None:
+                print("Resampling %s tracks is not supported, %s was skipped" % (track.type, track.name))
+                continue
+            track.animations = toTrackAnimations(track, frames)
+            track.frameCount = len(track.animations)
+
+def getKeyFrame(row):
+    # The Blender frame the row'th frame of track.animations gets keyed on, previews skip frames in between
+    return int(KeyFrames[row]) if len(KeyFrames) else row + 1
+
+def getImportAction(name):
+    # Reuses the action of an earlier preview import of the same animation, so a full import replaces it in place
+    action = bpy.data.actions.get(name)
+    if action is not None and action.get("nuanmb_preview"):
+        for curve in list(action.fcurves):
+            action.fcurves.remove(curve)
+        for group in list(action.groups):
+            action.groups.remove(group)
+        for marker in list(action.pose_markers):
+            action.pose_markers.remove(marker)
+    else:
+        action = bpy.data.actions.new(name)
+    if len(KeyFrames):
+        action["nuanmb_preview"] = True
+    elif "nuanmb_preview" in action:
+        del action["nuanmb_preview"]
+    return action
+
 # This function deals with all of the Blender-camera-specific operations
 def importCamera(context):
     #should only enter this function if the selected object was the camera.
@@ -463,7 +922,7 @@ def importCamera(context):
         cam.animation_data_create()
     
     #idk lol
-    action = bpy.data.actions.new(AnimName)
+    action = getImportAction(AnimName)
     cam.animation_data.action = action
     
     #matrix setup
@@ -484,7 +943,7 @@ def importCamera(context):
         if (ag[0] == AnimType.Transform.value):  
             cam.name = ag[1][0].name
             # Iterate by frame, and loop through tracks by name to set the transformation matrices
-            for frame in range(int(FrameCount)):
+            for frame in range(len(KeyFrames) or int(FrameCount)):
                 for track in ag[1]:
                     print("Track frame # " + str(frame) + ", type " + AnimType.Transform.name)
                     qr = mathutils.Quaternion(track.animations[frame][1].wxyz)
@@ -497,13 +956,13 @@ def importCamera(context):
                     cam.matrix_local = mathutils.Matrix(pm @ rm @ sx @ sy @ sz)
                     
                     cam.keyframe_insert(data_path ='location',
-                                            frame = frame + 1,
+                                            frame = getKeyFrame(frame),
                                             group = AnimName)
                     cam.keyframe_insert(data_path ='rotation_quaternion',
-                                            frame = frame + 1,
+                                            frame = getKeyFrame(frame),
                                             group = AnimName)
                     cam.keyframe_insert(data_path ='scale',
-                                            frame = frame + 1,
+                                            frame = getKeyFrame(frame),
                                             group = AnimName)
                                                                 
         elif (ag[0] == AnimType.Camera.value):
@@ -511,11 +970,11 @@ def importCamera(context):
             for track in ag[1]:
                 print ("Camera Track Type: " + str(track.type))
                 if(track.type == "FieldOfView"):
-                    blender_frame = 1
                     #TODO: Blender doesn't allow keyframing FOV directly,
                     # need to figure out conversion between smash FOV
                     # and convert that to Sensor Width and Focal Length
-                    for anim_frame in track.animations:
+                    for row, anim_frame in enumerate(track.animations):
+                        blender_frame = getKeyFrame(row)
                         '''
                         cam["FOV"] = anim_frame
                         cam.keyframe_insert(data_path = '["FOV"]',
@@ -526,7 +985,6 @@ def importCamera(context):
                         cam.data.keyframe_insert(data_path = 'lens',
                                             frame = blender_frame,
                                             group = AnimName)
-                        blender_frame += 1
                     
             
     
@@ -551,7 +1009,7 @@ def importCamera(context):
     render.resolution_y   = 1080
     render.pixel_aspect_x = 1
     render.pixel_aspect_y = 1
-    render.fps            = 60
+    render.fps            = int(round(FrameRate))
     
           
 def keyframe_insert_locrotscale(obj, boneName, frame, groupName):
@@ -565,14 +1023,34 @@ def keyframe_insert_locrotscale(obj, boneName, frame, groupName):
                         frame = frame,
                         group = groupName)                        
 
+HELPER_BONES = {
+    # Bone -> helper bones that follow it, the first one the armature has gets used
+    'ShoulderL': ['H_SholderL', 'H_ShoulderL'],
+    'ArmL': ['H_ElbowL'],
+    'ShoulderR': ['H_SholderR', 'H_ShoulderR'],
+    'ArmR': ['H_ElbowR'],
+}
+
+def getHelperBones(boneNames):
+    # {bone name: helper bone name} for the helpers this armature has, looked up once per import instead of per frame
+    helperBones = {}
+    for boneName, helpers in HELPER_BONES.items():
+        match = next((x for x in helpers if x in boneNames), None)
+        if boneName in boneNames and match:
+            helperBones[boneName] = match
+    return helperBones
+
 # This function deals with all of the Blender-specific operations
 def importAnimations(context, read_transform, read_material, read_visibility, read_camera):
     obj = bpy.context.object
     bpy.ops.object.mode_set(mode='POSE', toggle=False)
+    boneNames = set(obj.data.bones.keys())
+    helperBones = getHelperBones(boneNames)
     
     #Re-Enable inheriting scale for bones. Will get turned off per-animation
     for bone in obj.data.bones:
         bone.inherit_scale = 'FULL'
+    noInheritScale = set() # Bones this import already turned it off for
     
     # Force all bones to use quaternion rotation
     # Also set each bone to the identity matrix
@@ -585,7 +1063,7 @@ def importAnimations(context, read_transform, read_material, read_visibility, re
     except:
         obj.animation_data_create()
 
-    action = bpy.data.actions.new(AnimName)
+    action = getImportAction(AnimName)
     obj.animation_data.action = action
 
     # Animation frames start at 1, the same as what Blender uses by default
@@ -619,9 +1097,9 @@ def importAnimations(context, read_transform, read_material, read_visibility, re
                         scalez = track.animations[frame][2][2]
                         
                         if ((scalex != 1) or (scaley != 1) or (scalez != 1)):
-                            for bone in obj.data.bones:
-                                if (bone.name == track.name):
-                                    bone.inherit_scale = 'NONE'
+                            if (track.name in boneNames and track.name not in noInheritScale):
+                                obj.data.bones[track.name].inherit_scale = 'NONE'
+                                noInheritScale.add(track.name)
                         
                         transform = mathutils.Matrix(pm @ rm @ sx @ sy @ sz)
                         tfmArray[track.name] = transform
@@ -633,32 +1111,11 @@ def importAnimations(context, read_transform, read_material, read_visibility, re
                         if (tbone.parent):
                             tbone.matrix = tbone.parent.matrix @ tfmArray[tbone.name]
                             #Naive Helper Bone Fixes, will be replaced once they are better understood
-                            if tbone.name == 'ShoulderL':
-                                match = next((x for x in ['H_SholderL', 'H_ShoulderL'] if x in obj.pose.bones.keys()), False)
-                                if match: #FoundHelperBone
-                                    hb = obj.pose.bones[match]
-                                    hb.matrix = tbone.parent.matrix @ tfmArray[tbone.name]
-                                    keyframe_insert_locrotscale(obj, hb.name, frame + 1, AnimName)
-                            if tbone.name == 'ArmL':
-                                match = next((x for x in ['H_ElbowL'] if x in obj.pose.bones.keys()), False)
-                                if match: #FoundHelperBone
-                                    hb = obj.pose.bones[match]
-                                    hb.matrix = tbone.parent.matrix @ tfmArray[tbone.name]
-                                    keyframe_insert_locrotscale(obj, hb.name, frame + 1, AnimName)
-                            if tbone.name == 'ShoulderR':
-                                match = next((x for x in ['H_SholderR', 'H_ShoulderR'] if x in obj.pose.bones.keys()), False)
-                                if match: #FoundHelperBone
-                                    hb = obj.pose.bones[match]
-                                    hb.matrix = tbone.parent.matrix @ tfmArray[tbone.name]
-                                    keyframe_insert_locrotscale(obj, hb.name, frame + 1, AnimName)
-                            if tbone.name == 'ArmR':
-                                match = next((x for x in ['H_ElbowR'] if x in obj.pose.bones.keys()), False)
-                                if match: #FoundHelperBone
-                                    hb = obj.pose.bones[match]
-                                    hb.matrix = tbone.parent.matrix @ tfmArray[tbone.name]
-                                    keyframe_insert_locrotscale(obj, hb.name, frame + 1, AnimName)                                    
-                                    
-                                    
+                            match = helperBones.get(tbone.name)
+                            if match: #FoundHelperBone
+                                hb = obj.pose.bones[match]
+                                hb.matrix = tbone.parent.matrix @ tfmArray[tbone.name]
+                                keyframe_insert_locrotscale(obj, hb.name, getKeyFrame(frame), AnimName)
                         else:
                             tbone.matrix = tfmArray[tbone.name]
                             
@@ -667,7 +1124,7 @@ def importAnimations(context, read_transform, read_material, read_visibility, re
                         try:
                             obj.keyframe_insert(data_path='pose.bones["%s"].%s' %
                                        (tbone.name, "location"),
-                                       frame=frame + 1,
+                                       frame=getKeyFrame(frame),
                                        group=AnimName)
                         except:
                             continue
@@ -676,7 +1133,7 @@ def importAnimations(context, read_transform, read_material, read_visibility, re
                         try:
                             obj.keyframe_insert(data_path='pose.bones["%s"].%s' %
                                        (tbone.name, "rotation_quaternion"),
-                                       frame=frame + 1,
+                                       frame=getKeyFrame(frame),
                                        group=AnimName)
                         except:
                             continue
@@ -685,7 +1142,7 @@ def importAnimations(context, read_transform, read_material, read_visibility, re
                         try:
                             obj.keyframe_insert(data_path='pose.bones["%s"].%s' %
                                        (tbone.name, "scale"),
-                                       frame=frame + 1,
+                                       frame=getKeyFrame(frame),
                                        group=AnimName)
                         except:
                             continue
@@ -702,19 +1159,17 @@ def importAnimations(context, read_transform, read_material, read_visibility, re
                         if (target.type == 'MESH' and track.name == getExactObjectName(target.name, track.name)):
                             target.hide_render = not trackData
                             target.hide_viewport = not trackData
-                            target.keyframe_insert(data_path="hide_viewport", frame=vframe + 1, group=AnimName)
-                            target.keyframe_insert(data_path="hide_render", frame=vframe + 1, group=AnimName)
+                            target.keyframe_insert(data_path="hide_viewport", frame=getKeyFrame(vframe), group=AnimName)
+                            target.keyframe_insert(data_path="hide_render", frame=getKeyFrame(vframe), group=AnimName)
 
 
         elif (read_material and ag[0] == AnimType.Material.value):
             for track in ag[1]:
-                blender_frame = 1
-                for afv in track.animations: #'Animation Frame Value'
+                for row, afv in enumerate(track.animations): #'Animation Frame Value'
                     obj["%s:%s" % (track.name, track.type)] = afv
                     obj.keyframe_insert(data_path = '["%s:%s"]' % (track.name, track.type),
-                                        frame = blender_frame,
+                                        frame = getKeyFrame(row),
                                         group = track.name)
-                    blender_frame += 1
                     
 
         elif (read_camera and ag[0] == AnimType.Camera.value):
@@ -791,41 +1246,82 @@ def setup_eye_shader_node(eyeName, customVectorName):
     
     
 # ==== Import OPERATOR ====
-from bpy_extras.io_utils import (ImportHelper)
+if bpy is not None:
+    from bpy_extras.io_utils import (ImportHelper)
+    from bpy.props import StringProperty, BoolProperty, CollectionProperty, FloatProperty, IntProperty
+    from bpy.types import Operator, Panel, OperatorFileListElement
+else: # The operator and panel are never registered without Blender
+    ImportHelper = object
+    class Operator:
+        pass
+    class Panel:
+        pass
+    OperatorFileListElement = None
+    def StringProperty(**kwargs):
+        return None
+    BoolProperty = CollectionProperty = FloatProperty = IntProperty = StringProperty
 
-class NUANMB_Import_Operator(bpy.types.Operator, ImportHelper):
+class NUANMB_Import_Operator(Operator, ImportHelper):
     """Imports animation data from NUANMB files"""
     bl_idname = ("import_scene.nuanmb")
     bl_label = ("Import NUANMB")
     bl_options = {'PRESET', 'UNDO'}
 
     filename_ext = ".nuanmb"
-    filter_glob: bpy.props.StringProperty(default="*.nuanmb", options={'HIDDEN'})
-    files: bpy.props.CollectionProperty(type=bpy.types.OperatorFileListElement)
+    filter_glob: StringProperty(default="*.nuanmb", options={'HIDDEN'})
+    files: CollectionProperty(type=OperatorFileListElement)
     
-    read_transform: bpy.props.BoolProperty(
+    read_transform: BoolProperty(
             name="Transformation",
             description="Read transformation data",
             default=True,
             )
 
-    read_material: bpy.props.BoolProperty(
+    read_material: BoolProperty(
             name="Material",
             description="Read material data",
             default=True,
             )
 
-    read_visibility: bpy.props.BoolProperty(
+    read_visibility: BoolProperty(
             name="Visibility",
             description="Read visibility data",
             default=True,
             )
 
-    read_camera: bpy.props.BoolProperty(
+    read_camera: BoolProperty(
             name="Camera",
             description="Read camera data",
             default=True,
             )
+
+    frame_rate: FloatProperty(
+            name="Frame Rate",
+            description="Frames per second to key the animation at. Below 60 makes fewer keyframes and imports faster",
+            default=SOURCE_FRAME_RATE,
+            min=1.0,
+            max=240.0,
+            )
+
+    preview: BoolProperty(
+            name="Preview",
+            description="Only key some of the frames, to quickly check a move or block out timing. A later import of the same animation replaces the preview",
+            default=False,
+            )
+
+    preview_step: IntProperty(
+            name="Every Nth Frame",
+            description="Key every this many frames in a preview",
+            default=4,
+            min=1,
+            )
+
+    preview_max_keys: IntProperty(
+            name="Max Keys",
+            description="Most keys per track in a preview, spacing them out further if needed. 0 for no limit",
+            default=0,
+            min=0,
+            )
     
     def execute(self, context):
         keywords = self.as_keywords(ignore=("filter_glob", "files",))
@@ -850,7 +1346,7 @@ class NUANMB_Import_Operator(bpy.types.Operator, ImportHelper):
                 return True
         return False
 
-class NUANMB_PT_import_tracks(bpy.types.Panel):
+class NUANMB_PT_import_tracks(Panel):
     bl_space_type = 'FILE_BROWSER'
     bl_region_type = 'TOOL_PROPS'
     bl_label = "Tracks"
@@ -875,6 +1371,12 @@ class NUANMB_PT_import_tracks(bpy.types.Panel):
         layout.prop(operator, "read_material")
         layout.prop(operator, "read_visibility")
         layout.prop(operator, "read_camera")
+        layout.prop(operator, "frame_rate")
+        layout.prop(operator, "preview")
+        sub = layout.column()
+        sub.enabled = operator.preview
+        sub.prop(operator, "preview_step")
+        sub.prop(operator, "preview_max_keys")
 
 classes = (
     NUANMB_Import_Operator,
@@ -0,0 +1,205 @@
+"""
+Headless benchmarks for reading and writing .nuanmb files, no Blender needed.
+
+    python benchmarks/bench_nuanmb.py --size medium --json results.json
+    python benchmarks/bench_nuanmb.py --size medium --compare results.json
+    python benchmarks/bench_nuanmb.py --scenario encode --preset FAST --preset BALANCED --preset SMALLEST
+
+Every scenario runs on a synthetic file from synthetic_nuanmb.py. The results are written as JSON
+so runs from different commits can be compared with --compare. With more than one --preset the encoding
+scenarios run once per compression preset, and file_bytes shows what each preset costs in size.
+"""
+import argparse, io, json, os, platform, subprocess, sys, tempfile, time, tracemalloc
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import NUANMB_EXPORT as exporter
+import NUANMB_IMPORT as importer
+import synthetic_nuanmb
+
+SIZES = {
+    'small': dict(bones=30, frames=60, materials=1, visibility=2),
+    'medium': dict(bones=120, frames=300, materials=4, visibility=8),
+    'large': dict(bones=300, frames=900, materials=8, visibility=16),
+}
+
+class Scenario:
+    # setup() runs untimed and returns the state run(state) gets timed with
+    def __init__(self, name, setup, run):
+        self.name = name
+        self.setup = setup
+        self.run = run
+
+def transform_tracks(groups):
+    return [node.nodeAnimTrack.animationTrack for node in groups[0].nodes]
+
+def quantize(tracks, budget):
+    return [exporter.CompressedTransform(at, budget) for at in tracks]
+
+def pack(compressedTransforms):
+    b = io.BytesIO()
+    for ct in compressedTransforms:
+        if ct.valid:
+            ct.write(b)
+    return b
+
+def encode(groups, compression, budget):
+    for nat in exporter.get_group_tracks(groups):
+        nat.encoded = None
+    return exporter.make_anim_buffer(None, groups, compression, workers=1, budget=budget)
+
+def write(groups, animBuffer, path):
+    with open(path, 'wb') as f:
+        exporter.write_nuanmb(f, animBuffer, groups, len(groups[0].nodes[0].nodeAnimTrack.animationTrack) - 1, "bench.nuanmb")
+
+def parse(data):
+    return importer.readAnimInfo(io.BytesIO(data))
+
+def decode(data):
+    info = importer.readAnimInfo(io.BytesIO(data))
+    return importer.decodeAnimation(info, data[info.bufferOffset:info.bufferOffset + info.bufferSize])
+
+def parsed(data):
+    info = importer.readAnimInfo(io.BytesIO(data))
+    return info, data[info.bufferOffset:info.bufferOffset + info.bufferSize]
+
+def seek(state):
+    # One frame from the middle of every track, like scrubbing a preview
+    info, buffer = state
+    frame = int(info.frameCount) // 2
+    return [importer.decodeFrame(buffer, track, frame) for tracks in info.groups.values() for track in tracks]
+
+def resample(state):
+    # Everything decoded and sampled down to 30 fps, like importing at half the frame rate
+    info, buffer = state
+    return importer.resampleAnimation(importer.decodeAnimation(info, buffer), info.frameCount, importer.SOURCE_FRAME_RATE, 30)
+
+def stream(path):
+    # Chunked decoding straight from the file, its peak memory shouldn't grow with the frame count
+    with open(path, 'rb') as f:
+        for firstFrame, chunk in importer.iterateFrameChunks(f):
+            pass
+
+def make_scenarios(config, compression, path, budget):
+    def groups():
+        return synthetic_nuanmb.make_synthetic_groups(**config)
+    def file_bytes():
+        return synthetic_nuanmb.make_synthetic_nuanmb(compression=compression, budget=budget, **config)
+    def file_on_disk():
+        with open(path, 'wb') as f:
+            f.write(file_bytes())
+        return path
+    def encoded_groups():
+        g = groups()
+        return g, exporter.make_anim_buffer(None, g, compression, workers=1, budget=budget)
+    return [
+        Scenario('generate', lambda: None, lambda state: groups()),
+        Scenario('quantize', lambda: transform_tracks(groups()), lambda tracks: quantize(tracks, budget)),
+        Scenario('pack', lambda: quantize(transform_tracks(groups()), budget), pack),
+        Scenario('encode', groups, lambda g: encode(g, compression, budget)),
+        Scenario('estimate', groups, lambda g: exporter.estimate_export(g, compression, budget)),
+        Scenario('write', encoded_groups, lambda state: write(state[0], state[1], path)),
+        Scenario('parse', file_bytes, parse),
+        Scenario('decode', file_bytes, decode),
+        Scenario('seek', lambda: parsed(file_bytes()), seek),
+        Scenario('resample', lambda: parsed(file_bytes()), resample),
+        Scenario('stream', file_on_disk, stream),
+    ]
+
+def time_scenario(scenario, repeat):
+    # Best of repeat runs, then one more run under tracemalloc for the peak memory, which would skew the timing
+    best = float('inf')
+    for _ in range(repeat):
+        state = scenario.setup()
+        start = time.perf_counter()
+        scenario.run(state)
+        best = min(best, time.perf_counter() - start)
+    state = scenario.setup()
+    tracemalloc.start()
+    scenario.run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmarks(sizes, compression, repeat, only=None, presets=('SMALLEST',)):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.nuanmb')
+        for size, preset in [(size, preset) for size in sizes for preset in presets]:
+            config = SIZES[size]
+            budget = exporter.ErrorBudget(strategy=preset)
+            fileSize = len(synthetic_nuanmb.make_synthetic_nuanmb(compression=compression, budget=budget, **config))
+            trackFrames = config['bones'] * config['frames']
+            for scenario in make_scenarios(config, compression, path, budget):
+                if only and scenario.name not in only:
+                    continue
+                seconds, peak = time_scenario(scenario, repeat)
+                results.append({
+                    'scenario': scenario.name,
+                    'size': size,
+                    'compression': compression,
+                    'preset': preset,
+                    'seconds': seconds,
+                    'frames_per_s': trackFrames / seconds if seconds > 0 else None, # bone frames
+                    'mb_per_s': fileSize / seconds / 1e6 if seconds > 0 else None,
+                    'peak_bytes': peak,
+                    'file_bytes': fileSize,
+                })
+                print("%-8s %-7s %-9s %-8s %9.4fs %12.0f frames/s %8.2f MB/s %10d peak bytes %9d file bytes" %
+                      (scenario.name, size, 'compressed' if compression else 'direct', preset, seconds,
+                       results[-1]['frames_per_s'] or 0, results[-1]['mb_per_s'] or 0, peak, fileSize))
+    return results
+
+def compare(results, baselinePath):
+    with open(baselinePath) as f:
+        baseline = {(r['scenario'], r['size'], r['compression'], r.get('preset', 'SMALLEST')): r for r in json.load(f)['results']}
+    print("\nCompared to %s (above 1.00x is faster):" % baselinePath)
+    for r in results:
+        old = baseline.get((r['scenario'], r['size'], r['compression'], r['preset']))
+        if old is None:
+            continue
+        print("%-8s %-7s %-8s %6.2fx time %6.2fx peak memory" %
+              (r['scenario'], r['size'], r['preset'], old['seconds'] / r['seconds'], r['peak_bytes'] / max(old['peak_bytes'], 1)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark .nuanmb reading and writing without Blender")
+    parser.add_argument('--size', choices=sorted(SIZES), action='append', help="Can be given more than once, default medium")
+    parser.add_argument('--no-compression', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scenario', action='append', help="Only run these scenarios")
+    parser.add_argument('--preset', choices=exporter.COMPRESSION_PRESETS, action='append',
+                        help="Compression preset, can be given more than once, default SMALLEST")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--compare', help="Results file from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.size or ['medium'], not args.no_compression, args.repeat, args.scenario,
+                             args.preset or ['SMALLEST'])
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Makes synthetic .nuanmb files without Blender, using the exporter's own Group/Node layout and writer.
+
+    python benchmarks/synthetic_nuanmb.py out.nuanmb --bones 120 --frames 300 --materials 4 --visibility 8
+
+The tracks are deterministic for a given seed, so the same arguments always make the same file.
+"""
+import argparse, math, os, sys
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import NUANMB_EXPORT as exporter
+
+# How often each kind of bone track shows up, roughly matching a fighter's skeleton:
+# lots of helper bones that never move, most others only rotate, a few scale or jitter.
+DEFAULT_TRACK_MIX = {'static': 0.35, 'rotating': 0.4, 'moving': 0.15, 'scaling': 0.05, 'noisy': 0.05}
+TRACK_KINDS = ['static', 'rotating', 'moving', 'scaling', 'noisy']
+
+def parse_track_mix(text):
+    # 'static=0.5,rotating=0.5' -> {'static': 0.5, 'rotating': 0.5}
+    mix = {}
+    for part in text.split(','):
+        kind, weight = part.split('=')
+        if kind not in TRACK_KINDS:
+            raise ValueError("Unknown track kind %s, expected one of %s" % (kind, ', '.join(TRACK_KINDS)))
+        mix[kind] = float(weight)
+    return mix
+
+def pick_track_kinds(count, trackMix, rng):
+    kinds = [k for k in TRACK_KINDS if trackMix.get(k, 0) > 0]
+    weights = numpy.array([trackMix[k] for k in kinds], dtype=numpy.float64)
+    return list(rng.choice(kinds, size=count, p=weights / weights.sum()))
+
+def make_transform_frames(kind, frameCount, rng):
+    # SX SY SZ RX RY RZ RW PX PY PZ 0 per frame, float32 like a sampled track
+    t = numpy.arange(frameCount, dtype=numpy.float64) / 60.0
+    frames = numpy.zeros((frameCount, 11), dtype=numpy.float64)
+    frames[:, 0:3] = 1.0
+    frames[:, 6] = 1.0
+    frames[:, 7:10] = rng.uniform(-2.0, 2.0, 3)
+    if kind == 'static':
+        return frames.astype(numpy.float32)
+
+    axis = rng.normal(size=3)
+    axis /= numpy.linalg.norm(axis)
+    angle = rng.uniform(0.2, 2.5) * numpy.sin(t * rng.uniform(0.5, 4.0) + rng.uniform(0, math.pi))
+    frames[:, 3:6] = axis * numpy.sin(angle / 2)[:, None]
+    frames[:, 6] = numpy.cos(angle / 2)
+    if kind in ('moving', 'noisy'):
+        frames[:, 7:10] += numpy.sin(t[:, None] * rng.uniform(0.5, 3.0, 3)) * rng.uniform(0.5, 5.0, 3)
+    if kind == 'scaling':
+        frames[:, 0:3] = 1.0 + 0.5 * numpy.sin(t * rng.uniform(1.0, 3.0))[:, None]
+    if kind == 'noisy':
+        frames[:, 3:6] += rng.normal(scale=0.01, size=(frameCount, 3))
+        frames[:, 3:7] /= numpy.linalg.norm(frames[:, 3:7], axis=1)[:, None]
+    return frames.astype(numpy.float32)
+
+def make_node(name, flags, trackType, frameCount):
+    node = exporter.Node()
+    node.name = name
+    nat = node.nodeAnimTrack
+    nat.flags |= flags
+    nat.type = trackType
+    nat.allocate(frameCount)
+    return node
+
+def make_synthetic_groups(bones=60, frames=120, trackMix=None, materials=2, visibility=4, seed=0):
+    # Returns the Transform, Visibility and Material groups, filled in the same way gather_groups fills them
+    rng = numpy.random.default_rng(seed)
+    t = numpy.arange(frames, dtype=numpy.float64)
+
+    tg = exporter.Group()
+    tg.nodesAnimType = exporter.AnimType.Transform.value
+    for i, kind in enumerate(pick_track_kinds(bones, trackMix or DEFAULT_TRACK_MIX, rng)):
+        node = make_node("Bone%03d_%s" % (i, kind), exporter.AnimTrackFlags.Transform.value, "Transform", frames)
+        node.nodeAnimTrack.animationTrack[:] = make_transform_frames(kind, frames, rng)
+        tg.nodes.append(node)
+
+    vg = exporter.Group()
+    vg.nodesAnimType = exporter.AnimType.Visibility.value
+    for i in range(visibility):
+        node = make_node("Mesh%03d" % i, exporter.AnimTrackFlags.Boolean.value, "Visibility", frames)
+        period = int(rng.integers(4, 40))
+        node.nodeAnimTrack.animationTrack[:] = (t // period + i) % 2 == 0 if i % 2 else True
+        vg.nodes.append(node)
+
+    mg = exporter.Group()
+    mg.nodesAnimType = exporter.AnimType.Material.value
+    for i in range(materials):
+        main = exporter.Node()
+        main.name = "Material%03d" % i
+        vector = make_node("", exporter.AnimTrackFlags.Vector.value, "CustomVector31", frames)
+        vector.nodeAnimTrack.animationTrack[:] = numpy.stack([numpy.ones(frames), numpy.ones(frames),
+                                                             0.01 * t, numpy.zeros(frames)], axis=1)
+        value = make_node("", exporter.AnimTrackFlags.Float.value, "CustomFloat8", frames)
+        value.nodeAnimTrack.animationTrack[:] = 0.5 + 0.5 * numpy.sin(t / rng.uniform(5.0, 30.0))
+        boolean = make_node("", exporter.AnimTrackFlags.Boolean.value, "CustomBoolean1", frames)
+        boolean.nodeAnimTrack.animationTrack[:] = t >= frames // 2
+        main.materialSubNodes.extend([vector, value, boolean])
+        mg.nodes.append(main)
+
+    return [tg, vg, mg]
+
+def make_synthetic_nuanmb(animName="synthetic.nuanmb", compression=True, budget=None, workers=1,
+                          bones=60, frames=120, trackMix=None, materials=2, visibility=4, seed=0):
+    # Returns the bytes of a whole .nuanmb file
+    groups = make_synthetic_groups(bones, frames, trackMix, materials, visibility, seed)
+    animBuffer = exporter.make_anim_buffer(None, groups, compression, workers=workers, budget=budget)
+    return bytes(exporter.make_nuanmb(animBuffer, groups, frames - 1, animName))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic .nuanmb file")
+    parser.add_argument('output')
+    parser.add_argument('--bones', type=int, default=60)
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--track-mix', type=parse_track_mix, default=None,
+                        help="Bone track weights, e.g. static=0.3,rotating=0.5,noisy=0.2")
+    parser.add_argument('--materials', type=int, default=2)
+    parser.add_argument('--visibility', type=int, default=4)
+    parser.add_argument('--no-compression', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    data = make_synthetic_nuanmb(os.path.basename(args.output), not args.no_compression,
+                                 bones=args.bones, frames=args.frames, trackMix=args.track_mix,
+                                 materials=args.materials, visibility=args.visibility, seed=args.seed)
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    print("Wrote %s (%d bytes)" % (args.output, len(data)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Compares two .nuanmb files track by track, without Blender.
+
+    python tools/nuanmb_diff.py vanilla/c00attack11.nuanmb export/c00attack11.nuanmb
+    python tools/nuanmb_diff.py a.nuanmb b.nuanmb --sort rotation --json diff.json
+
+Tracks are matched by group, node name and track type. For every matched pair it prints the stored size of
+both and the error of b against a: position distance and scale difference (max and RMS), rotation as the
+angle between the quaternions in degrees, the number of frames a visibility or boolean track disagrees on,
+and the largest material value difference. Const tracks are compared against every frame of the other track.
+"""
+import argparse, collections, json, os, sys
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import NUANMB_IMPORT as importer
+from nuanmb_inspect import anim_type_name, describe_flags
+
+SORT_KEYS = {
+    'position': lambda r: r['position']['max'] if r.get('position') else 0.0,
+    'rotation': lambda r: r['rotation']['max'] if r.get('rotation') else 0.0,
+    'scale': lambda r: r['scale']['max'] if r.get('scale') else 0.0,
+    'size': lambda r: abs(r['sizeB'] - r['sizeA']),
+}
+
+def keyed_tracks(info, buffer):
+    # {(group, name, type, n): (track, frames)}, n tells apart repeated types on one material
+    tracks = collections.OrderedDict()
+    for animType, groupTracks in importer.decodeAnimation(info, buffer).items():
+        for track, frames in groupTracks:
+            n = 0
+            while (anim_type_name(animType), track.name, track.type, n) in tracks:
+                n += 1
+            tracks[(anim_type_name(animType), track.name, track.type, n)] = (track, frames)
+    return tracks
+
+def align_frames(a, b):
+    # Both as float64 with the same number of rows, const tracks broadcast and longer tracks cut
+    if len(a) == 1 or len(b) == 1:
+        frameCount = max(len(a), len(b))
+    else:
+        frameCount = min(len(a), len(b))
+    a = numpy.broadcast_to(a[:frameCount], (frameCount,) + a.shape[1:]).astype(numpy.float64)
+    b = numpy.broadcast_to(b[:frameCount], (frameCount,) + b.shape[1:]).astype(numpy.float64)
+    return a, b
+
+def error_stats(errors):
+    return {'max': float(errors.max()) if errors.size else 0.0,
+            'rms': float(numpy.sqrt(numpy.mean(errors ** 2))) if errors.size else 0.0}
+
+def quaternion_angles(a, b):
+    # Angle in degrees between every pair of (n, 4) quaternions, q and -q count as the same rotation
+    dot = numpy.abs(numpy.sum(a * b, axis=1) / (numpy.linalg.norm(a, axis=1) * numpy.linalg.norm(b, axis=1)))
+    return numpy.degrees(2 * numpy.arccos(numpy.clip(dot, 0.0, 1.0)))
+
+def diff_track(trackA, a, trackB, b):
+    result = {
+        'flagsA': describe_flags(trackA.flags),
+        'flagsB': describe_flags(trackB.flags),
+        'sizeA': trackA.dataSize,
+        'sizeB': trackB.dataSize,
+        'framesA': None if a is None else len(a),
+        'framesB': None if b is None else len(b),
+    }
+    if a is None or b is None:
+        result['undecodable'] = True
+        return result
+    a, b = align_frames(a, b)
+    trackType = trackA.flags & 0x00ff
+    if trackType == importer.AnimTrackFlags.Transform.value:
+        result['position'] = error_stats(numpy.linalg.norm(a[:, 7:10] - b[:, 7:10], axis=1))
+        result['rotation'] = error_stats(quaternion_angles(a[:, 3:7], b[:, 3:7]))
+        result['scale'] = error_stats(numpy.abs(a[:, 0:3] - b[:, 0:3]).max(axis=1))
+    elif trackType == importer.AnimTrackFlags.Boolean.value:
+        result['mismatchedFrames'] = int(numpy.count_nonzero(a[:, 0] != b[:, 0]))
+    else:
+        result['material'] = error_stats(numpy.abs(a - b).max(axis=1))
+    return result
+
+def diff_files(pathA, pathB):
+    infoA, bufferA = importer.readAnimFile(pathA, validate=True)
+    infoB, bufferB = importer.readAnimFile(pathB, validate=True)
+    tracksA = keyed_tracks(infoA, bufferA)
+    tracksB = keyed_tracks(infoB, bufferB)
+    tracks = []
+    for key, (trackA, a) in tracksA.items():
+        if key not in tracksB:
+            continue
+        trackB, b = tracksB[key]
+        result = diff_track(trackA, a, trackB, b)
+        result.update({'group': key[0], 'name': key[1], 'type': key[2]})
+        tracks.append(result)
+    return {
+        'a': pathA,
+        'b': pathB,
+        'fileSizeA': os.path.getsize(pathA),
+        'fileSizeB': os.path.getsize(pathB),
+        'frameCountA': infoA.frameCount,
+        'frameCountB': infoB.frameCount,
+        'onlyInA': ["%s/%s/%s" % key[:3] for key in tracksA if key not in tracksB],
+        'onlyInB': ["%s/%s/%s" % key[:3] for key in tracksB if key not in tracksA],
+        'tracks': tracks,
+    }
+
+def format_error(stats, unit=""):
+    return "%9.3g max %9.3g rms%s" % (stats['max'], stats['rms'], unit)
+
+def print_diff(diff):
+    print("a: %s (%d bytes, %g frames)" % (diff['a'], diff['fileSizeA'], diff['frameCountA']))
+    print("b: %s (%d bytes, %g frames, %+.1f%%)" % (diff['b'], diff['fileSizeB'], diff['frameCountB'],
+                                                    100.0 * (diff['fileSizeB'] - diff['fileSizeA']) / max(diff['fileSizeA'], 1)))
+    for r in diff['tracks']:
+        print("%-10s %-32s %-16s %6d -> %-6d bytes  %s -> %s" %
+              (r['group'], r['name'], r['type'], r['sizeA'], r['sizeB'], r['flagsA'], r['flagsB']))
+        if r['framesA'] != r['framesB']:
+            print("    frames %s -> %s" % (r['framesA'], r['framesB']))
+        if r.get('undecodable'):
+            print("    can't be decoded, only the sizes are compared")
+        if 'position' in r:
+            print("    position %s | rotation %s | scale %s" %
+                  (format_error(r['position']), format_error(r['rotation'], " deg"), format_error(r['scale'])))
+        if 'mismatchedFrames' in r:
+            print("    %d frames differ" % r['mismatchedFrames'])
+        if 'material' in r:
+            print("    values %s" % format_error(r['material']))
+    for key in diff['onlyInA']:
+        print("only in a: %s" % key)
+    for key in diff['onlyInB']:
+        print("only in b: %s" % key)
+
+def summarize(diff):
+    # Worst error of each kind over every track
+    summary = {'position': 0.0, 'rotation': 0.0, 'scale': 0.0, 'material': 0.0, 'mismatchedFrames': 0}
+    for r in diff['tracks']:
+        for kind in ('position', 'rotation', 'scale', 'material'):
+            if kind in r:
+                summary[kind] = max(summary[kind], r[kind]['max'])
+        summary['mismatchedFrames'] += r.get('mismatchedFrames', 0)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two .nuanmb files track by track")
+    parser.add_argument('a')
+    parser.add_argument('b')
+    parser.add_argument('--sort', choices=sorted(SORT_KEYS), help="Order the tracks by this, largest first")
+    parser.add_argument('--json', help="Write the comparison to this file")
+    args = parser.parse_args(argv)
+
+    diff = diff_files(args.a, args.b)
+    if args.sort:
+        diff['tracks'].sort(key=SORT_KEYS[args.sort], reverse=True)
+    diff['summary'] = summarize(diff)
+    print_diff(diff)
+    s = diff['summary']
+    print("worst: position %.3g | rotation %.3g deg | scale %.3g | material %.3g | %d visibility frames differ | %d tracks only in a, %d only in b" %
+          (s['position'], s['rotation'], s['scale'], s['material'], s['mismatchedFrames'], len(diff['onlyInA']), len(diff['onlyInB'])))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(diff, f, indent=1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Keeps a SQLite index of the headers and track tables of every .nuanmb in a directory, without Blender.
+
+    python tools/nuanmb_index.py update motion/ --db motion.sqlite
+    python tools/nuanmb_index.py query --db motion.sqlite --node RotN --min-frames 100
+    python tools/nuanmb_index.py query --db motion.sqlite --track-type CustomVector31 --group Material
+
+Only the header and the group tables are read, never the animation buffer. update only re-reads files
+whose modification time or size changed since the last run, and drops files that are gone.
+"""
+import argparse, os, sqlite3, struct, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import NUANMB_IMPORT as importer
+from nuanmb_inspect import anim_type_name, find_nuanmb_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    animName TEXT,
+    versionMajor INTEGER,
+    versionMinor INTEGER,
+    finalFrameIndex REAL,
+    frameCount INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    fileId INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    animType INTEGER NOT NULL,
+    groupName TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    flags INTEGER NOT NULL,
+    frameCount INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracksByName ON tracks(name);
+CREATE INDEX IF NOT EXISTS tracksByType ON tracks(type);
+CREATE INDEX IF NOT EXISTS tracksByFile ON tracks(fileId);
+"""
+
+def open_index(dbPath):
+    db = sqlite3.connect(dbPath)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(SCHEMA)
+    return db
+
+def index_file(db, path, stat):
+    # Replaces whatever was stored for path, unreadable files are kept with their error so they aren't retried
+    db.execute("DELETE FROM files WHERE path = ?", (path,))
+    try:
+        info, _ = importer.readAnimFile(path, indexOnly=True)
+    except (RuntimeError, struct.error, ValueError, OSError) as e:
+        db.execute("INSERT INTO files (path, mtime, size, error) VALUES (?, ?, ?, ?)", (path, stat.st_mtime, stat.st_size, str(e)))
+        return False
+    fileId = db.execute("INSERT INTO files (path, mtime, size, animName, versionMajor, versionMinor, finalFrameIndex, frameCount) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (path, stat.st_mtime, stat.st_size, info.name, info.versionMajor, info.versionMinor,
+                         info.finalFrameIndex, int(info.frameCount))).lastrowid
+    db.executemany("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                   [(fileId, animType, anim_type_name(animType), track.name, track.type, track.flags, track.frameCount)
+                    for animType, tracks in info.groups.items() for track in tracks])
+    return True
+
+def update_index(db, directory):
+    # Returns (added or changed, unchanged, removed, unreadable)
+    known = {path: (mtime, size) for path, mtime, size in db.execute("SELECT path, mtime, size FROM files")}
+    changed = unchanged = unreadable = 0
+    seen = set()
+    with db:
+        for path in find_nuanmb_files(os.path.abspath(directory)):
+            seen.add(path)
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                unchanged += 1
+                continue
+            changed += 1
+            if not index_file(db, path, stat):
+                unreadable += 1
+        prefix = os.path.join(os.path.abspath(directory), '')
+        removed = [path for path in known if path.startswith(prefix) and path not in seen]
+        db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+    return changed, unchanged, len(removed), unreadable
+
+def query_files(db, node=None, trackType=None, group=None, minFrames=None, maxFrames=None):
+    # Paths of the files with a track matching every given filter, and their frame counts
+    where = ["files.error IS NULL"]
+    values = []
+    if minFrames is not None:
+        where.append("files.frameCount >= ?"); values.append(minFrames)
+    if maxFrames is not None:
+        where.append("files.frameCount <= ?"); values.append(maxFrames)
+    trackWhere = []
+    if node is not None:
+        trackWhere.append("tracks.name = ?"); values.append(node)
+    if trackType is not None:
+        trackWhere.append("tracks.type = ?"); values.append(trackType)
+    if group is not None:
+        trackWhere.append("tracks.groupName = ?"); values.append(group)
+    if trackWhere:
+        where.append("EXISTS (SELECT 1 FROM tracks WHERE tracks.fileId = files.id AND %s)" % " AND ".join(trackWhere))
+    return db.execute("SELECT path, animName, frameCount FROM files WHERE %s ORDER BY path" % " AND ".join(where), values).fetchall()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index .nuanmb headers into SQLite and search them")
+    commands = parser.add_subparsers(dest='command', required=True)
+    update = commands.add_parser('update', help="Add new and changed files in a directory to the index")
+    update.add_argument('directory')
+    update.add_argument('--db', required=True)
+    query = commands.add_parser('query', help="List the indexed files matching every filter")
+    query.add_argument('--db', required=True)
+    query.add_argument('--node', help="Bone, mesh or material name")
+    query.add_argument('--track-type', help="e.g. Transform, Visibility, CustomVector31")
+    query.add_argument('--group', choices=[t.name for t in importer.AnimType])
+    query.add_argument('--min-frames', type=int)
+    query.add_argument('--max-frames', type=int)
+    args = parser.parse_args(argv)
+
+    db = open_index(args.db)
+    try:
+        if args.command == 'update':
+            start = time.time()
+            changed, unchanged, removed, unreadable = update_index(db, args.directory)
+            print("%d indexed, %d unchanged, %d removed, %d unreadable in %.2f seconds" %
+                  (changed, unchanged, removed, unreadable, time.time() - start))
+        elif args.command == 'query':
+            rows = query_files(db, args.node, args.track_type, args.group, args.min_frames, args.max_frames)
+            for path, animName, frameCount in rows:
+                print("%-60s %-32s %6d frames" % (path, animName, frameCount))
+            print("%d files" % len(rows))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Looks inside .nuanmb files without Blender, using the importer's reader.
+
+    python tools/nuanmb_inspect.py info c00attack11.nuanmb
+    python tools/nuanmb_inspect.py dump c00attack11.nuanmb --npz tracks.npz
+    python tools/nuanmb_inspect.py dump c00attack11.nuanmb --json tracks.json
+    python tools/nuanmb_inspect.py dump c00attack11.nuanmb --npz frames.npz --frames 10:20
+    python tools/nuanmb_inspect.py scan motion/ --json index.json
+    python tools/nuanmb_inspect.py validate motion/
+
+scan only reads the header and group tables of each file, never the animation buffer.
+validate bounds-checks every offset, string and compression header without decoding anything.
+"""
+import argparse, json, os, struct, sys
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import NUANMB_IMPORT as importer
+
+TRACK_MODES = {
+    importer.AnimTrackFlags.Direct.value: 'Direct',
+    importer.AnimTrackFlags.ConstTransform.value: 'ConstTransform',
+    importer.AnimTrackFlags.Compressed.value: 'Compressed',
+    importer.AnimTrackFlags.Constant.value: 'Constant',
+}
+TRACK_TYPES = {f.value: f.name for f in importer.AnimTrackFlags if f.value < 0x100}
+COMPRESSED_ITEM_COUNTS = {
+    importer.AnimTrackFlags.Transform.value: 9,
+    importer.AnimTrackFlags.Float.value: 1,
+    importer.AnimTrackFlags.Vector4.value: 4,
+}
+
+def anim_type_name(animType):
+    try:
+        return importer.AnimType(animType).name
+    except ValueError:
+        return str(animType)
+
+def describe_flags(flags):
+    # e.g. 0x401 -> 'Transform | Compressed'
+    return "%s | %s" % (TRACK_TYPES.get(flags & 0x00ff, hex(flags & 0x00ff)), TRACK_MODES.get(flags & 0xff00, hex(flags & 0xff00)))
+
+def track_summary(track, buffer=None):
+    summary = {
+        'name': track.name,
+        'type': track.type,
+        'flags': track.flags,
+        'flagNames': describe_flags(track.flags),
+        'frameCount': track.frameCount,
+        'dataOffset': track.dataOffset,
+        'dataSize': track.dataSize,
+    }
+    if buffer is not None and (track.flags & 0xff00) == importer.AnimTrackFlags.Compressed.value:
+        ach = importer.readCompressedHeader(buffer, track.dataOffset)
+        summary['compression'] = {
+            'flags': ach.flags,
+            'bitsPerEntry': ach.bitsPerEntry,
+            'defaultDataOffset': ach.defaultDataOffset,
+            'compressedDataOffset': ach.compressedDataOffset,
+            'frameCount': ach.frameCount,
+            'items': [{'start': item.start, 'end': item.end, 'bitCount': item.count} for item in
+                      importer.readCompressedItems(buffer, track.dataOffset, COMPRESSED_ITEM_COUNTS.get(track.flags & 0x00ff, 0))],
+        }
+    return summary
+
+def file_summary(path, info, buffer=None):
+    return {
+        'path': path,
+        'fileSize': os.path.getsize(path),
+        'name': info.name,
+        'version': [info.versionMajor, info.versionMinor],
+        'finalFrameIndex': info.finalFrameIndex,
+        'frameCount': info.frameCount,
+        'bufferOffset': info.bufferOffset,
+        'bufferSize': info.bufferSize,
+        'groups': [{'animType': animType, 'name': anim_type_name(animType),
+                    'tracks': [track_summary(track, buffer) for track in tracks]}
+                   for animType, tracks in info.groups.items()],
+    }
+
+def print_info(summary):
+    print("%s: %s" % (summary['path'], summary['name']))
+    print("  Version %d.%d | Final frame index %g | %d frames | Buffer %d bytes at %#x | File %d bytes" %
+          (summary['version'][0], summary['version'][1], summary['finalFrameIndex'], summary['frameCount'],
+           summary['bufferSize'], summary['bufferOffset'], summary['fileSize']))
+    for group in summary['groups']:
+        print("  %s group (%d tracks)" % (group['name'], len(group['tracks'])))
+        for t in group['tracks']:
+            print("    %-32s %-16s %-28s %5d frames  %#8x  %6d bytes" %
+                  (t['name'], t['type'], t['flagNames'], t['frameCount'], t['dataOffset'], t['dataSize']))
+            c = t.get('compression')
+            if c is None:
+                continue
+            print("      compression flags %#x | %d bits per frame | %d frames" % (c['flags'], c['bitsPerEntry'], c['frameCount']))
+            for i, item in enumerate(c['items']):
+                print("      item %d: %12.6g .. %-12.6g %2d bits" % (i, item['start'], item['end'], item['bitCount']))
+
+def track_key(animType, track):
+    return "%s/%s/%s" % (anim_type_name(animType), track.name, track.type)
+
+def parse_frame_range(text):
+    # '10:20' -> (10, 10), '15' -> (15, 1)
+    if ':' not in text:
+        return int(text), 1
+    first, stop = text.split(':')
+    return int(first), int(stop) - int(first)
+
+def dump(path, jsonPath=None, npzPath=None, frameRange=None):
+    info, buffer = importer.readAnimFile(path)
+    if frameRange is None:
+        decoded = importer.decodeAnimation(info, buffer)
+    else: # Only the requested frames get decoded
+        decoded = {animType: [(track, importer.decodeTrackFrames(buffer, track, *frameRange)) for track in tracks] 
+                   for animType, tracks in info.groups.items()}
+    if npzPath:
+        arrays = {track_key(animType, track): frames for animType, tracks in decoded.items()
+                  for track, frames in tracks if frames is not None}
+        numpy.savez_compressed(npzPath, **arrays)
+    if jsonPath:
+        summary = file_summary(path, info, buffer)
+        for group, (animType, tracks) in zip(summary['groups'], decoded.items()):
+            for t, (track, frames) in zip(group['tracks'], tracks):
+                t['frames'] = frames.tolist() if frames is not None else None
+        with open(jsonPath, 'w') as f:
+            json.dump(summary, f, indent=1)
+
+def find_nuanmb_files(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.nuanmb'):
+                yield os.path.join(root, name)
+
+def scan(directory, jsonPath=None):
+    # Header and tables only, so thousands of files take seconds
+    index = []
+    for path in find_nuanmb_files(directory):
+        try:
+            info, _ = importer.readAnimFile(path, indexOnly=True)
+        except (RuntimeError, struct.error, OSError) as e:
+            print("%s: unreadable (%s)" % (path, e))
+            continue
+        tracks = [track for tracks in info.groups.values() for track in tracks]
+        entry = {
+            'path': path,
+            'name': info.name,
+            'fileSize': os.path.getsize(path),
+            'frameCount': info.frameCount,
+            'groups': {anim_type_name(animType): len(tracks) for animType, tracks in info.groups.items()},
+            'tracks': len(tracks),
+            'compressedTracks': sum(1 for t in tracks if (t.flags & 0xff00) == importer.AnimTrackFlags.Compressed.value),
+        }
+        index.append(entry)
+        print("%-60s %6g frames %4d tracks (%d compressed) %8d bytes" %
+              (path, entry['frameCount'], entry['tracks'], entry['compressedTracks'], entry['fileSize']))
+    if jsonPath:
+        with open(jsonPath, 'w') as f:
+            json.dump(index, f, indent=1)
+    print("%d files" % len(index))
+    return index
+
+def validate(paths):
+    # Returns the number of broken files
+    broken = 0
+    checked = 0
+    for path in paths:
+        for filePath in find_nuanmb_files(path) if os.path.isdir(path) else [path]:
+            checked += 1
+            try:
+                importer.readAnimFile(filePath, indexOnly=True, validate=True)
+            except (RuntimeError, OSError) as e:
+                broken += 1
+                print(str(e)) # Already names the file
+    print("%d files checked, %d broken" % (checked, broken))
+    return broken
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect .nuanmb animation files without Blender")
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', help="Print the header, groups, track flags and compression headers")
+    info.add_argument('files', nargs='+')
+    info.add_argument('--json', help="Write the same information as JSON")
+    dumpCommand = commands.add_parser('dump', help="Decode every track to JSON and/or .npz")
+    dumpCommand.add_argument('file')
+    dumpCommand.add_argument('--json')
+    dumpCommand.add_argument('--npz')
+    dumpCommand.add_argument('--frames', type=parse_frame_range, help="Only decode these frames, e.g. 10:20 or 15")
+    scanCommand = commands.add_parser('scan', help="Index every .nuanmb in a directory from the headers only")
+    scanCommand.add_argument('directory')
+    scanCommand.add_argument('--json')
+    validateCommand = commands.add_parser('validate', help="Check the structure of files or directories of them")
+    validateCommand.add_argument('paths', nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        summaries = []
+        for path in args.files:
+            info, buffer = importer.readAnimFile(path)
+            summaries.append(file_summary(path, info, buffer))
+            print_info(summaries[-1])
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(summaries, f, indent=1)
+    elif args.command == 'dump':
+        if not (args.json or args.npz):
+            parser.error("dump needs --json and/or --npz")
+        dump(args.file, args.json, args.npz, args.frames)
+    elif args.command == 'scan':
+        scan(args.directory, args.json)
+    elif args.command == 'validate':
+        sys.exit(1 if validate(args.paths) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Decodes a directory of .nuanmb files into one columnar store that later jobs can memory-map, without Blender.
+
+    python tools/nuanmb_library.py build motion/ motion_library/
+    python tools/nuanmb_library.py list motion_library/
+
+The store is one flat float32 file per kind of track plus index.json:
+
+    transform.f32   SX SY SZ RX RY RZ RW PX PY PZ per row
+    vector.f32      X Y Z W per row
+    float.f32       one value per row
+    boolean.f32     0.0 or 1.0 per row
+
+Every track is a run of rows in its kind's file, found through the offsets in the index. Const tracks keep
+their single row, AnimationLibrary broadcasts them to the animation's frame count without copying.
+
+    library = AnimationLibrary('motion_library/')
+    bones = library.tracks('c00attack11.nuanmb', 'Transform')   # {bone name: (frames, 10) view into the memmap}
+"""
+import argparse, json, os, struct, sys, time
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import NUANMB_IMPORT as importer
+from nuanmb_inspect import anim_type_name, find_nuanmb_files
+
+INDEX_NAME = 'index.json'
+LIBRARY_VERSION = 1
+TRACK_KINDS = {
+    # AnimTrackFlags type -> (kind, channels per row)
+    importer.AnimTrackFlags.Transform.value: ('transform', 10),
+    importer.AnimTrackFlags.Vector4.value: ('vector', 4),
+    importer.AnimTrackFlags.Float.value: ('float', 1),
+    importer.AnimTrackFlags.Boolean.value: ('boolean', 1),
+}
+
+def build_library(source, output):
+    # Appends every decoded track to its kind's file, so only one animation is ever in memory
+    os.makedirs(output, exist_ok=True)
+    channels = {kind: count for kind, count in TRACK_KINDS.values()}
+    rows = {kind: 0 for kind in channels}
+    animations = []
+    skipped = []
+    files = {kind: open(os.path.join(output, kind + '.f32.tmp'), 'wb') for kind in channels}
+    try:
+        for path in find_nuanmb_files(source):
+            try:
+                info, buffer = importer.readAnimFile(path, validate=True)
+                decoded = importer.decodeAnimation(info, buffer)
+            except (RuntimeError, struct.error, ValueError, OSError) as e:
+                skipped.append({'path': path, 'reason': str(e)})
+                print("%s: skipped (%s)" % (path, e))
+                continue
+            entry = {
+                'name': os.path.relpath(path, source).replace(os.sep, '/'),
+                'animName': info.name,
+                'frameCount': int(info.frameCount),
+                'finalFrameIndex': info.finalFrameIndex,
+                'tracks': [],
+            }
+            for animType, tracks in decoded.items():
+                for track, frames in tracks:
+                    kind = TRACK_KINDS.get(track.flags & 0x00ff)
+                    if frames is None or kind is None:
+                        continue
+                    kind = kind[0]
+                    files[kind].write(numpy.ascontiguousarray(frames, dtype='<f4').tobytes())
+                    entry['tracks'].append({
+                        'group': anim_type_name(animType),
+                        'name': track.name,
+                        'type': track.type,
+                        'flags': track.flags,
+                        'kind': kind,
+                        'offset': rows[kind], # In rows, not bytes
+                        'rows': len(frames),
+                    })
+                    rows[kind] += len(frames)
+            animations.append(entry)
+    finally:
+        for f in files.values():
+            f.close()
+
+    for kind in channels:
+        os.replace(os.path.join(output, kind + '.f32.tmp'), os.path.join(output, kind + '.f32'))
+    index = {
+        'version': LIBRARY_VERSION,
+        'columns': {kind: {'rows': rows[kind], 'channels': channels[kind]} for kind in channels},
+        'animations': animations,
+        'skipped': skipped,
+    }
+    temp = os.path.join(output, INDEX_NAME + '.tmp')
+    with open(temp, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(temp, os.path.join(output, INDEX_NAME)) # Written last, so a half built library never looks complete
+    return index
+
+class AnimationLibrary:
+    # Read only view of a library made by build_library, every array it hands out is a view into a memmap
+    def __init__(self, path):
+        with open(os.path.join(path, INDEX_NAME)) as f:
+            index = json.load(f)
+        if index.get('version') != LIBRARY_VERSION:
+            raise RuntimeError("%s is library version %s, expected %d" % (path, index.get('version'), LIBRARY_VERSION))
+        self.path = path
+        self.columns = {}
+        for kind, column in index['columns'].items():
+            if column['rows'] == 0: # numpy can't map an empty file
+                self.columns[kind] = numpy.zeros((0, column['channels']), dtype='<f4')
+            else:
+                self.columns[kind] = numpy.memmap(os.path.join(path, kind + '.f32'), dtype='<f4', mode='r',
+                                                  shape=(column['rows'], column['channels']))
+        self.animations = {entry['name']: entry for entry in index['animations']}
+
+    def names(self):
+        return list(self.animations)
+
+    def stored_frames(self, track):
+        # The track's rows exactly as stored, a const track is one row
+        return self.columns[track['kind']][track['offset']:track['offset'] + track['rows']]
+
+    def frames(self, name, track):
+        # The track held out to the animation's frame count, still without copying
+        animation = self.animations[name]
+        stored = self.stored_frames(track)
+        if len(stored) == 1 and animation['frameCount'] > 1:
+            return numpy.broadcast_to(stored, (animation['frameCount'], stored.shape[1]))
+        return stored
+
+    def tracks(self, name, group=None):
+        # {track name: frames} for one animation, material tracks are keyed by (material name, type)
+        result = {}
+        for track in self.animations[name]['tracks']:
+            if group is not None and track['group'] != group:
+                continue
+            key = track['name'] if track['group'] in ('Transform', 'Visibility') else (track['name'], track['type'])
+            result[key] = self.frames(name, track)
+        return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or list a memory-mappable library of decoded .nuanmb files")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="Decode every .nuanmb in a directory into a library")
+    build.add_argument('source')
+    build.add_argument('output')
+    listCommand = commands.add_parser('list', help="Print the animations in a library")
+    listCommand.add_argument('library')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start = time.time()
+        index = build_library(args.source, args.output)
+        print("%d animations, %d skipped | %s rows in %.1f seconds" %
+              (len(index['animations']), len(index['skipped']),
+               ', '.join("%d %s" % (c['rows'], kind) for kind, c in index['columns'].items()), time.time() - start))
+    elif args.command == 'list':
+        library = AnimationLibrary(args.library)
+        for name in library.names():
+            animation = library.animations[name]
+            print("%-60s %6d frames %4d tracks" % (name, animation['frameCount'], len(animation['tracks'])))
+
+if __name__ == "__main__":
+    main()
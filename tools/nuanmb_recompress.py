@@ -0,0 +1,206 @@
+"""
+Re-encodes existing .nuanmb files with the exporter's compression, without Blender.
+
+    python tools/nuanmb_recompress.py motion/ --output motion_small/
+    python tools/nuanmb_recompress.py motion/ --in-place --json report.json
+
+Every file is decoded with the importer's reader, rebuilt into the exporter's groups and written again through
+make_anim_buffer, so each track ends up const, compressed or direct, whichever is smallest within the error budget.
+A file is only replaced when the result is smaller. Files are handled across a process pool, with only a
+few files in flight per worker so memory stays flat however large the library is.
+"""
+import argparse, collections, concurrent.futures, io, json, os, shutil, struct, sys, time
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import NUANMB_EXPORT as exporter
+import NUANMB_IMPORT as importer
+from nuanmb_inspect import find_nuanmb_files
+
+ERROR_CHANNELS = {
+    # Which decoded columns each kind of error is measured over
+    'scale': slice(0, 3),
+    'rotation': slice(3, 7),
+    'position': slice(7, 10),
+}
+
+class UnsupportedFile(Exception):
+    pass
+
+def make_nat(track, frames):
+    # Decoded (frames, channels) array -> NodeAnimTrack in the exporter's TRACK_FRAME_LAYOUTS
+    nat = exporter.NodeAnimTrack()
+    nat.type = track.type
+    nat.flags = track.flags & 0x00ff
+    nat.allocate(len(frames))
+    if nat.flags == exporter.AnimTrackFlags.Transform.value:
+        nat.animationTrack[:, :10] = frames
+    elif nat.animationTrack.ndim == 1: # Float and Boolean
+        nat.animationTrack[:] = frames[:, 0]
+    else:
+        nat.animationTrack[:] = frames
+    return nat
+
+def groups_from_decoded(decoded):
+    # Rebuilds the exporter's groups from decodeAnimation's output, in the same order as the file
+    groups = []
+    for animType, tracks in decoded.items():
+        g = exporter.Group()
+        g.nodesAnimType = animType
+        if animType in (importer.AnimType.Material.value, importer.AnimType.Camera.value):
+            mainNodes = collections.OrderedDict() # Material and camera tracks hang off one main node per name
+            for track, frames in tracks:
+                if track.name not in mainNodes:
+                    mainNodes[track.name] = exporter.Node()
+                    mainNodes[track.name].name = track.name
+                subNode = exporter.Node()
+                subNode.nodeAnimTrack = make_nat(track, frames)
+                mainNodes[track.name].materialSubNodes.append(subNode)
+            g.nodes.extend(mainNodes.values())
+        else:
+            for track, frames in tracks:
+                node = exporter.Node()
+                node.name = track.name
+                node.nodeAnimTrack = make_nat(track, frames)
+                g.nodes.append(node)
+        groups.append(g)
+    return groups
+
+def decode_file(data):
+    info = importer.validateAnimData(data)
+    buffer = data[info.bufferOffset:info.bufferOffset + info.bufferSize]
+    decoded = importer.decodeAnimation(info, buffer)
+    for tracks in decoded.values():
+        for track, frames in tracks:
+            if frames is None:
+                raise UnsupportedFile("%s track %s can't be decoded" % (track.type, track.name))
+    return info, decoded
+
+def track_error(a, b):
+    # Const tracks only store one frame, so they get compared against every frame of the other
+    frameCount = max(len(a), len(b))
+    a = numpy.broadcast_to(a, (frameCount,) + a.shape[1:]).astype(numpy.float64)
+    b = numpy.broadcast_to(b, (frameCount,) + b.shape[1:]).astype(numpy.float64)
+    return numpy.abs(a - b)
+
+def measure_errors(original, recompressed):
+    # Largest difference per kind of channel between two decodeAnimation results of the same file
+    errors = {'scale': 0.0, 'rotation': 0.0, 'position': 0.0, 'material': 0.0, 'visibility': 0}
+    for animType, tracks in original.items():
+        for (track, a), (_, b) in zip(tracks, recompressed[animType]):
+            error = track_error(a, b)
+            trackType = track.flags & 0x00ff
+            if trackType == importer.AnimTrackFlags.Transform.value:
+                for kind, columns in ERROR_CHANNELS.items():
+                    errors[kind] = max(errors[kind], float(error[:, columns].max()))
+            elif trackType == importer.AnimTrackFlags.Boolean.value:
+                errors['visibility'] += int(error.sum())
+            else:
+                errors['material'] = max(errors['material'], float(error.max()))
+    return errors
+
+def recompress_data(data, budget):
+    # Returns the re-encoded file and the error against the original
+    info, decoded = decode_file(data)
+    if importer.AnimType.Camera.value in decoded:
+        raise UnsupportedFile("camera animations are never compressed")
+    groups = groups_from_decoded(decoded)
+    animBuffer = exporter.make_anim_buffer(None, groups, True, workers=1, budget=budget)
+    newData = bytes(exporter.make_nuanmb(animBuffer, groups, info.finalFrameIndex, info.name))
+    _, newDecoded = decode_file(newData)
+    return newData, measure_errors(decoded, newDecoded)
+
+def recompress_file(source, destination, budget):
+    # Runs in a worker process, only the small result dict goes back
+    # Files that can't be read or written are skipped like malformed ones, so one of them never stops a batch
+    result = {'path': source, 'oldSize': 0, 'newSize': None, 'written': False,
+              'errors': None, 'skipped': None}
+    start = time.time()
+    try:
+        result['oldSize'] = os.path.getsize(source)
+        with open(source, 'rb') as f:
+            data = f.read()
+        newData, result['errors'] = recompress_data(data, budget)
+        result['newSize'] = len(newData)
+    except (UnsupportedFile, RuntimeError, struct.error, ValueError, OSError) as e:
+        result['skipped'] = str(e)
+        newData = None
+
+    try:
+        if newData is not None and len(newData) < len(data):
+            os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+            temp = destination + '.tmp'
+            with open(temp, 'wb') as f:
+                f.write(newData)
+            os.replace(temp, destination)
+            result['written'] = True
+        elif source != destination:
+            os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+            shutil.copyfile(source, destination) # Keeps the output library complete
+    except OSError as e:
+        result['skipped'] = str(e)
+    result['seconds'] = time.time() - start
+    return result
+
+def recompress_library(source, output, budget, workers=None, inFlightPerWorker=2):
+    workers = workers or os.cpu_count() or 1
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for path in [source] if os.path.isfile(source) else find_nuanmb_files(source):
+            relPath = os.path.basename(path) if path == source else os.path.relpath(path, source)
+            destination = path if output is None else os.path.join(output, relPath)
+            # Only a few files queued per worker, so a huge library never sits in memory at once
+            if len(pending) >= workers * inFlightPerWorker:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                results.extend(report(future.result()) for future in done)
+            pending.add(pool.submit(recompress_file, path, destination, budget))
+        for future in concurrent.futures.as_completed(pending):
+            results.append(report(future.result()))
+    return results
+
+def report(r):
+    if r['skipped']:
+        print("%s: skipped (%s)" % (r['path'], r['skipped']))
+    else:
+        e = r['errors']
+        print("%s: %d -> %d bytes (%+.1f%%)%s | max error pos %.2g rot %.2g scale %.2g mat %.2g, %d visibility frames changed" %
+              (r['path'], r['oldSize'], r['newSize'], 100.0 * (r['newSize'] - r['oldSize']) / max(r['oldSize'], 1),
+               "" if r['written'] else " kept original", e['position'], e['rotation'], e['scale'], e['material'], e['visibility']))
+    return r
+
+def summarize(results, seconds):
+    oldTotal = sum(r['oldSize'] for r in results)
+    newTotal = sum(r['newSize'] if r['written'] else r['oldSize'] for r in results)
+    print("%d files, %d rewritten, %d skipped | %d -> %d bytes (%+.1f%%) in %.1f seconds" %
+          (len(results), sum(1 for r in results if r['written']), sum(1 for r in results if r['skipped']),
+           oldTotal, newTotal, 100.0 * (newTotal - oldTotal) / max(oldTotal, 1), seconds))
+    return {'files': len(results), 'oldBytes': oldTotal, 'newBytes': newTotal, 'seconds': seconds}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-encode .nuanmb files with the exporter's compression")
+    parser.add_argument('source', help="A .nuanmb file or a directory of them")
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument('--output', help="Directory to write the re-encoded library to")
+    destination.add_argument('--in-place', action='store_true', help="Replace files that get smaller")
+    parser.add_argument('--position-error', type=float, default=exporter.DEFAULT_EPSILON)
+    parser.add_argument('--rotation-error', type=float, default=exporter.DEFAULT_EPSILON)
+    parser.add_argument('--scale-error', type=float, default=exporter.DEFAULT_EPSILON)
+    parser.add_argument('--material-error', type=float, default=exporter.DEFAULT_EPSILON)
+    parser.add_argument('--preset', choices=exporter.COMPRESSION_PRESETS, default='SMALLEST',
+                        help="How hard to search for the fewest bits, see COMPRESSION_PRESETS in the exporter")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--json', help="Write the per-file results to this file")
+    args = parser.parse_args(argv)
+
+    budget = exporter.ErrorBudget(args.position_error, args.rotation_error, args.scale_error, args.material_error, args.preset)
+    start = time.time()
+    results = recompress_library(args.source, None if args.in_place else args.output, budget, args.workers)
+    summary = summarize(results, time.time() - start)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'files': results}, f, indent=1)
+
+if __name__ == "__main__":
+    main()